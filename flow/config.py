@@ -6,6 +6,10 @@ PYTHON_COMMAND = "python"
 
 SUMO_SLEEP = 5.0  # Delay between initializing SUMO and connecting with TraCI
 
+# directory in which generated .net.xml files are cached and shared between
+# environments and processes. May also be set through SumoParams
+NET_CACHE_DIR = os.environ.get("FLOW_NET_CACHE_DIR", None)
+
 PROJECT_PATH = osp.abspath(osp.join(osp.dirname(__file__), '..'))
 
 LOG_DIR = PROJECT_PATH + "/data"
@@ -76,10 +76,13 @@ class BaseController(metaclass=ABCMeta):
             'obey_speed_limit': self.get_obey_speed_limit_action
         }
         self.failsafes = []
+        # names of the failsafes, in the order they are applied
+        self.failsafe_names = []
         if failsafe_list:
             for check in failsafe_list:
                 if check in failsafe_map:
                     self.failsafes.append(failsafe_map.get(check))
+                    self.failsafe_names.append(check)
                 else:
                     raise ValueError('Skipping {}, as it is not a valid failsafe.'.format(check))
 
@@ -0,0 +1,434 @@
+"""Batched computation of the actions of the acceleration controllers.
+
+At every simulation step, the environment requests an action from the
+acceleration controller of every controlled vehicle. BaseController.get_action
+reads the state of the vehicle and of its leader, and computes the
+car-following model, the failsafes and the noise one vehicle at a time.
+
+Here, the vehicles are instead grouped by controller class, and the
+accelerations of each group are computed at once from arrays of speeds,
+headways and leader speeds. The failsafes and the noise are then applied to
+all the vehicles at once. The actions are the same as the ones returned by
+get_action.
+
+Controllers whose class is not in BATCH_MODELS, including the subclasses of
+the supported controllers, are run through their get_action method.
+"""
+from collections import defaultdict
+
+import numpy as np
+
+from flow.controllers.car_following_models import CFMController, \
+    BCMController, LACController, OVMController, LinearOVM, IDMController, \
+    SimCarFollowingController, GippsController, BandoFTLController
+
+
+class VehicleStates:
+    """State of a set of vehicles, as used by the batched controllers.
+
+    Attributes
+    ----------
+    veh_ids : list of str
+        ids of the vehicles
+    controllers : list of flow.controllers.BaseController
+        acceleration controllers of the vehicles
+    speed : np.ndarray
+        speeds of the vehicles
+    headway : np.ndarray
+        headways of the vehicles
+    leader : list of str
+        ids of the leaders of the vehicles, None or "" if there are none
+    lead_speed : np.ndarray
+        speeds of the leaders, -1001 if there are none
+    has_leader : np.ndarray
+        whether the vehicles have a leader
+    edge : list of str
+        edges of the vehicles
+    """
+
+    def __init__(self, env, veh_ids, controllers):
+        """Read the state of the vehicles from the vehicle kernel."""
+        kv = env.k.vehicle
+        self.veh_ids = veh_ids
+        self.controllers = controllers
+        self.speed = np.array(kv.get_speed(veh_ids), dtype=float)
+        self.headway = np.array(kv.get_headway(veh_ids), dtype=float)
+        self.leader = kv.get_leader(veh_ids)
+        self.lead_speed = np.array(kv.get_speed(self.leader), dtype=float)
+        self.has_leader = np.array([bool(lead) for lead in self.leader],
+                                   dtype=bool)
+        self.edge = kv.get_edge(veh_ids)
+
+    def subset(self, indices):
+        """Return the state of the vehicles at the given indices."""
+        sub = VehicleStates.__new__(VehicleStates)
+        sub.veh_ids = [self.veh_ids[i] for i in indices]
+        sub.controllers = [self.controllers[i] for i in indices]
+        sub.speed = self.speed[indices]
+        sub.headway = self.headway[indices]
+        sub.leader = [self.leader[i] for i in indices]
+        sub.lead_speed = self.lead_speed[indices]
+        sub.has_leader = self.has_leader[indices]
+        sub.edge = [self.edge[i] for i in indices]
+        return sub
+
+    def param(self, name):
+        """Return the values of an attribute of the controllers."""
+        return np.array([getattr(c, name) for c in self.controllers],
+                        dtype=float)
+
+
+def _cfm_accel(env, s):
+    """Batched form of CFMController.get_accel."""
+    accel = s.param('k_d') * (s.headway - s.param('d_des')) + \
+        s.param('k_v') * (s.lead_speed - s.speed) + \
+        s.param('k_c') * (s.param('v_des') - s.speed)
+    return np.where(s.has_leader, accel, s.param('max_accel'))
+
+
+def _bcm_accel(env, s):
+    """Batched form of BCMController.get_accel."""
+    trail = env.k.vehicle.get_follower(s.veh_ids)
+    trail_vel = np.array(env.k.vehicle.get_speed(trail), dtype=float)
+    footway = np.array(env.k.vehicle.get_headway(trail), dtype=float)
+
+    accel = s.param('k_d') * (s.headway - footway) + \
+        s.param('k_v') * ((s.lead_speed - s.speed) - (s.speed - trail_vel)) + \
+        s.param('k_c') * (s.param('v_des') - s.speed)
+    return np.where(s.has_leader, accel, s.param('max_accel'))
+
+
+def _lac_accel(env, s):
+    """Batched form of LACController.get_accel, which updates its state."""
+    length = np.array(env.k.vehicle.get_length(s.veh_ids), dtype=float)
+    tau = s.param('tau')
+    a = s.param('a')
+
+    ex = s.headway - length - s.param('h') * s.speed
+    ev = s.lead_speed - s.speed
+    u = s.param('k_1') * ex + s.param('k_2') * ev
+    a_dot = -(a / tau) + (u / tau)
+    a = a_dot * env.sim_step + a
+
+    for controller, value in zip(s.controllers, a.tolist()):
+        controller.a = value
+    return a
+
+
+def _ovm_accel(env, s):
+    """Batched form of OVMController.get_accel."""
+    h = s.headway
+    h_st = s.param('h_st')
+    h_go = s.param('h_go')
+    v_max = s.param('v_max')
+
+    # V function here - input: h, output : Vh
+    v_h = np.where(
+        h <= h_st, 0,
+        np.where(h < h_go,
+                 v_max / 2 * (1 - np.cos(np.pi * (h - h_st) / (h_go - h_st))),
+                 v_max))
+
+    accel = s.param('alpha') * (v_h - s.speed) + \
+        s.param('beta') * (s.lead_speed - s.speed)
+    return np.where(s.has_leader, accel, s.param('max_accel'))
+
+
+def _linear_ovm_accel(env, s):
+    """Batched form of LinearOVM.get_accel."""
+    h = s.headway
+    h_st = s.param('h_st')
+    v_max = s.param('v_max')
+
+    # V function here - input: h, output : Vh
+    alpha = 1.689  # the average value from Nakayama paper
+    v_h = np.where(
+        h < h_st, 0,
+        np.where(h <= h_st + v_max / alpha, alpha * (h - h_st), v_max))
+
+    return (v_h - s.speed) / s.param('adaptation')
+
+
+def _idm_accel(env, s):
+    """Batched form of IDMController.get_accel."""
+    v = s.speed
+    a = s.param('a')
+
+    # in order to deal with ZeroDivisionError
+    h = np.where(np.abs(s.headway) < 1e-3, 1e-3, s.headway)
+
+    s_star = s.param('s0') + np.maximum(
+        0, v * s.param('T') + v * (v - s.lead_speed) /
+        (2 * np.sqrt(a * s.param('b'))))
+    s_star = np.where(s.has_leader, s_star, 0)
+
+    return a * (1 - (v / s.param('v0'))**s.param('delta') - (s_star / h)**2)
+
+
+def _sim_accel(env, s):
+    """Batched form of SimCarFollowingController.get_accel."""
+    return None
+
+
+def _gipps_accel(env, s):
+    """Batched form of GippsController.get_accel."""
+    v = s.speed
+    h = s.headway
+    v_l = s.lead_speed
+    v_desired = s.param('v_desired')
+    acc = s.param('acc')
+    b = s.param('b')
+    b_l = s.param('b_l')
+    s0 = s.param('s0')
+    tau = s.param('tau')
+
+    # get velocity dynamics
+    v_acc = v + (2.5 * acc * tau * (
+            1 - (v / v_desired)) * np.sqrt(0.025 + (v / v_desired)))
+    v_safe = (tau * b) + np.sqrt(((tau**2) * (b**2)) - (
+            b * ((2 * (h-s0)) - (tau * v) - ((v_l**2) / b_l))))
+
+    # same as min(v_acc, v_safe, v_desired), including with nans
+    v_next = np.where(v_safe < v_acc, v_safe, v_acc)
+    v_next = np.where(v_desired < v_next, v_desired, v_next)
+
+    return (v_next-v)/env.sim_step
+
+
+def _bando_accel(env, s):
+    """Batched form of BandoFTLController.get_accel."""
+    v = s.speed
+    h_st = s.param('h_st')
+    v_h = s.param('v_max') * (
+        (np.tanh(s.headway/h_st-2)+np.tanh(2))/(1+np.tanh(2)))
+    s_dot = s.lead_speed - v
+    u = s.param('alpha') * (v_h - v) + s.param('beta') * s_dot/(s.headway**2)
+
+    max_accel = ~s.has_leader & s.param('want_max_accel').astype(bool)
+    return np.where(max_accel, s.param('max_accel'), u)
+
+
+# batched form of the get_accel method of the supported controller classes
+BATCH_MODELS = {
+    CFMController: _cfm_accel,
+    BCMController: _bcm_accel,
+    LACController: _lac_accel,
+    OVMController: _ovm_accel,
+    LinearOVM: _linear_ovm_accel,
+    IDMController: _idm_accel,
+    SimCarFollowingController: _sim_accel,
+    GippsController: _gipps_accel,
+    BandoFTLController: _bando_accel,
+}
+
+
+def _warn(s, mask, message):
+    """Print the failsafe warning of the vehicles in the mask."""
+    for i in np.flatnonzero(mask):
+        if s.controllers[i].display_warnings:
+            print(
+                "=====================================\n"
+                + message.format(s.veh_ids[i]) +
+                "\n=====================================")
+
+
+def _instantaneous(env, s, action):
+    """Batched form of BaseController.get_safe_action_instantaneous."""
+    # if there is only one vehicle in the network, all actions are safe
+    if env.k.vehicle.num_vehicles == 1:
+        return action
+
+    this_vel = s.speed
+    sim_step = env.sim_step
+    next_vel = this_vel + action * sim_step
+
+    # if there is no other vehicle in the lane, all actions are safe
+    has_leader = np.array([lead is not None for lead in s.leader], dtype=bool)
+    crash = has_leader & (next_vel > 0) & (
+        s.headway < sim_step * next_vel + this_vel * 1e-3 +
+        0.5 * this_vel * sim_step)
+
+    _warn(s, crash, "Vehicle {} is about to crash. Instantaneous acceleration "
+                    "clipping applied.")
+    return np.where(crash, -this_vel / sim_step, action)
+
+
+def _safe_velocity(env, s, action):
+    """Batched form of BaseController.get_safe_velocity_action."""
+    # if there is only one vehicle in the network, all actions are safe
+    if env.k.vehicle.num_vehicles == 1:
+        return action
+
+    this_vel = s.speed
+    sim_step = env.sim_step
+    v_safe = 2 * s.headway / sim_step + (s.lead_speed - this_vel) - \
+        this_vel * (2 * s.param('delay'))
+
+    _warn(s, this_vel > v_safe, "Speed of vehicle {} is greater than safe "
+                                "speed. Safe velocity clipping applied.")
+
+    clipped = np.where(v_safe > 0, (v_safe - this_vel) / sim_step,
+                       -this_vel / sim_step)
+    return np.where(this_vel + action * sim_step > v_safe, clipped, action)
+
+
+def _feasible_accel(env, s, action):
+    """Batched form of BaseController.get_feasible_action."""
+    max_accel = s.param('max_accel')
+    max_deaccel = s.param('max_deaccel')
+
+    too_high = action > max_accel
+    _warn(s, too_high, "Acceleration of vehicle {} is greater than the max "
+                       "acceleration. Feasible acceleration clipping applied.")
+    action = np.where(too_high, max_accel, action)
+
+    too_low = action < -max_deaccel
+    _warn(s, too_low, "Deceleration of vehicle {} is greater than the max "
+                      "deceleration. Feasible acceleration clipping applied.")
+    return np.where(too_low, -max_deaccel, action)
+
+
+def _obey_speed_limit(env, s, action):
+    """Batched form of BaseController.get_obey_speed_limit_action."""
+    limits = {edge: env.k.network.speed_limit(edge) for edge in set(s.edge)}
+    edge_speed_limit = np.array([limits[edge] for edge in s.edge],
+                                dtype=float)
+
+    this_vel = s.speed
+    sim_step = env.sim_step
+    too_fast = this_vel + action * sim_step > edge_speed_limit
+
+    _warn(s, too_fast & (edge_speed_limit > 0),
+          "Speed of vehicle {} is greater than speed limit. Obey speed limit "
+          "clipping applied.")
+
+    clipped = np.where(edge_speed_limit > 0,
+                       (edge_speed_limit - this_vel) / sim_step,
+                       -this_vel / sim_step)
+    return np.where(too_fast, clipped, action)
+
+
+# batched form of the failsafes of BaseController
+BATCH_FAILSAFES = {
+    'instantaneous': _instantaneous,
+    'safe_velocity': _safe_velocity,
+    'feasible_accel': _feasible_accel,
+    'obey_speed_limit': _obey_speed_limit,
+}
+
+
+def _apply_failsafes(env, s, accel):
+    """Apply the failsafes of every vehicle, in the order they are listed."""
+    groups = defaultdict(list)
+    for i, controller in enumerate(s.controllers):
+        if controller.failsafe_names:
+            groups[tuple(controller.failsafe_names)].append(i)
+
+    accel = accel.copy()
+    for names, indices in groups.items():
+        sub = s.subset(indices)
+        sub_accel = accel[indices]
+        for name in names:
+            sub_accel = BATCH_FAILSAFES[name](env, sub, sub_accel)
+        accel[indices] = sub_accel
+    return accel
+
+
+def get_actions(env, veh_ids):
+    """Return the actions of the acceleration controllers of the vehicles.
+
+    The actions are the ones returned by the get_action method of the
+    controllers, and the accelerations with and without noise and failsafes
+    are stored in the vehicle kernel in the same way.
+
+    The noise of all the batched controllers is sampled at once, in the order
+    of the vehicles. The random draws of controllers that are run through
+    get_action follow them.
+
+    Parameters
+    ----------
+    env : flow.envs.Env
+        state of the environment at the current time step
+    veh_ids : list of str
+        ids of the vehicles
+
+    Returns
+    -------
+    list of float or None
+        the action of every vehicle, None if it is left to the simulator
+    """
+    kv = env.k.vehicle
+    veh_ids = list(veh_ids)
+    controllers = kv.get_acc_controller(veh_ids)
+    edges = kv.get_edge(veh_ids)
+    actions = [None] * len(veh_ids)
+
+    batch = []
+    fallback = []
+    for i, (controller, edge) in enumerate(zip(controllers, edges)):
+        if type(controller) not in BATCH_MODELS:
+            fallback.append(i)
+        elif len(edge) == 0 or edge[0] == ":":
+            # vehicles that just entered the network or that are in a
+            # junction are left to sumo, see BaseController.get_action
+            for noise in (False, True):
+                for failsafe in (False, True):
+                    kv.update_accel(veh_ids[i], None, noise, failsafe)
+        else:
+            batch.append(i)
+
+    if batch:
+        s = VehicleStates(env, [veh_ids[i] for i in batch],
+                          [controllers[i] for i in batch])
+
+        # compute the accelerations of every controller class at once
+        groups = defaultdict(list)
+        for j, controller in enumerate(s.controllers):
+            groups[type(controller)].append(j)
+
+        accel = np.zeros(len(batch))
+        valid = np.ones(len(batch), dtype=bool)
+        with np.errstate(all='ignore'):
+            for cls, indices in groups.items():
+                group_accel = BATCH_MODELS[cls](env, s.subset(indices))
+                if group_accel is None:
+                    valid[indices] = False
+                else:
+                    accel[indices] = group_accel
+
+            s = s.subset(np.flatnonzero(valid))
+            accel = accel[valid]
+            accel_no_noise_with_failsafe = _apply_failsafes(env, s, accel)
+
+            # add noise to the accelerations, if requested
+            accel_noise = s.param('accel_noise')
+            noisy = accel_noise > 0
+            accel_with_noise = accel.copy()
+            if noisy.any():
+                accel_with_noise[noisy] += np.sqrt(env.sim_step) * \
+                    np.random.normal(0, accel_noise[noisy])
+
+            # run the fail-safes, if requested
+            accel_with_noise_with_failsafe = _apply_failsafes(
+                env, s, accel_with_noise)
+
+        for j in np.flatnonzero(~valid):
+            for noise in (False, True):
+                for failsafe in (False, True):
+                    kv.update_accel(veh_ids[batch[j]], None, noise, failsafe)
+
+        results = zip(np.array(batch)[valid], accel.tolist(),
+                      accel_no_noise_with_failsafe.tolist(),
+                      accel_with_noise.tolist(),
+                      accel_with_noise_with_failsafe.tolist())
+        for i, a, a_nf, a_n, a_nf_n in results:
+            kv.update_accel(veh_ids[i], a, noise=False, failsafe=False)
+            kv.update_accel(veh_ids[i], a_nf, noise=False, failsafe=True)
+            kv.update_accel(veh_ids[i], a_n, noise=True, failsafe=False)
+            kv.update_accel(veh_ids[i], a_nf_n, noise=True, failsafe=True)
+            actions[i] = a_nf_n
+
+    for i in fallback:
+        actions[i] = controllers[i].get_action(env)
+
+    return actions
@@ -105,7 +105,7 @@ class OuterCycleRouter(BaseRouter):
         min_dist = int(1e9)
         closest_edge = None
         for edge in edges:
-            route = env.k.kernel_api.simulation.findRoute(cur_edge, edge).edges
+            route = env.k.network.route_oracle.find_route(cur_edge, edge)
             if len(route) < min_dist:
                 min_dist = len(route)
                 closest_edge = edge
@@ -130,7 +130,8 @@ class OuterCycleRouter(BaseRouter):
             next_route = None
         else:
             closest_edge = self._get_closest_edge(veh_edge, cycle, env)
-            closest_route = env.k.kernel_api.simulation.findRoute(veh_edge, closest_edge).edges
+            closest_route = env.k.network.route_oracle.find_route(
+                veh_edge, closest_edge)
             next_route = list(closest_route)
 
         # print(veh_id, veh_edge, veh_route, next_route)
@@ -163,7 +164,7 @@ class InflowRouter(BaseRouter):
         veh_route = vehicles.get_route(veh_id)
         veh_next_edge = env.k.network.next_edge(veh_edge, vehicles.get_lane(veh_id))
 
-        cur_route_len = len(env.paired_routes[veh_edge_id][dest_id].edges)
+        cur_route_len = env.route_lengths[veh_edge_id, dest_id]
 
         next_route = None
         if veh_route[-1] == veh_edge and veh_next_edge != []:
@@ -174,7 +175,7 @@ class InflowRouter(BaseRouter):
                     next_edge.append(env.k.network.next_edge(edge[0], edge[1])[0])
                 veh_next_edge = next_edge
             for edge, _ in veh_next_edge:
-                next_route_len = len(env.paired_routes[env.edges.index(edge)][dest_id].edges)
+                next_route_len = env.route_lengths[env.edges.index(edge), dest_id]
                 if next_route_len < cur_route_len:
                     feasible_next_edge.append(edge)
             next_edge = np.random.choice(feasible_next_edge)
@@ -0,0 +1,361 @@
+"""Columnar recorder of the emission data collected by the simulation kernel.
+
+The data of every vehicle is appended, at every recorded step, to typed
+columns of a fixed number of rows. Full chunks are written to a compressed
+columnar file, so that the memory used while recording does not grow with the
+length of the rollout. The file is either a .npz archive, in which the chunks
+are stored as "<chunk index>/<column name>" arrays, or a Parquet file with one
+row group per chunk if pyarrow is installed.
+"""
+
+import csv
+import multiprocessing
+import os
+import zipfile
+
+import numpy as np
+
+from flow.core import util
+from flow.utils.exceptions import FatalFlowError
+
+try:
+    import pyarrow
+    import pyarrow.parquet as pq
+except ImportError:
+    pyarrow = None
+
+# number of rows of a chunk
+CHUNK_SIZE = 10000
+
+# the data stored in the emission files (excluding id and time) in the order
+# of their columns, with their type and the function collecting them from the
+# vehicle kernel
+EMISSION_FIELDS = {
+    "x": (float, lambda kv, veh_id: kv.get_2d_position(veh_id)[0]),
+    "y": (float, lambda kv, veh_id: kv.get_2d_position(veh_id)[1]),
+    "speed": (float, lambda kv, veh_id: kv.get_speed(veh_id)),
+    "headway": (float, lambda kv, veh_id: kv.get_headway(veh_id)),
+    "leader_id": (str, lambda kv, veh_id: kv.get_leader(veh_id)),
+    "target_accel_with_noise_with_failsafe": (
+        float, lambda kv, veh_id: kv.get_accel(
+            veh_id, noise=True, failsafe=True)),
+    "target_accel_no_noise_no_failsafe": (
+        float, lambda kv, veh_id: kv.get_accel(
+            veh_id, noise=False, failsafe=False)),
+    "target_accel_with_noise_no_failsafe": (
+        float, lambda kv, veh_id: kv.get_accel(
+            veh_id, noise=True, failsafe=False)),
+    "target_accel_no_noise_with_failsafe": (
+        float, lambda kv, veh_id: kv.get_accel(
+            veh_id, noise=False, failsafe=True)),
+    "realized_accel": (float, lambda kv, veh_id: kv.get_realized_accel(veh_id)),
+    "road_grade": (float, lambda kv, veh_id: kv.get_road_grade(veh_id)),
+    "edge_id": (str, lambda kv, veh_id: kv.get_edge(veh_id)),
+    "lane_number": (int, lambda kv, veh_id: kv.get_lane(veh_id)),
+    "distance": (float, lambda kv, veh_id: kv.get_distance(veh_id)),
+    "relative_position": (float, lambda kv, veh_id: kv.get_position(veh_id)),
+    "follower_id": (str, lambda kv, veh_id: kv.get_follower(veh_id)),
+    "leader_rel_speed": (
+        float, lambda kv, veh_id: kv.get_speed(kv.get_leader(veh_id))
+        - kv.get_speed(veh_id)),
+}
+
+# file extensions of the supported formats
+EXTENSIONS = {"npz": "npz", "parquet": "parquet"}
+
+
+class EmissionRecorder:
+    """Records the emission data of a rollout into a columnar file.
+
+    Attributes
+    ----------
+    path : str
+        path to the emission file
+    fields : list of str
+        names of the recorded columns, excluding time and id
+    fmt : str
+        format of the emission file, one of "npz" or "parquet"
+    chunk_size : int
+        number of rows held in memory before being written to the file
+    num_rows : int
+        number of rows of the current chunk
+    num_chunks : int
+        number of chunks written to the file
+    """
+
+    def __init__(self, path, fields=None, fmt="npz", chunk_size=CHUNK_SIZE):
+        """Instantiate the recorder.
+
+        The file is only created once the first chunk is written.
+
+        Parameters
+        ----------
+        path : str
+            path to the emission file
+        fields : list of str, optional
+            names of the recorded fields, defaults to all the fields of
+            EMISSION_FIELDS
+        fmt : str, optional
+            format of the emission file, one of "npz" or "parquet"
+        chunk_size : int, optional
+            number of rows held in memory before being written to the file
+
+        Raises
+        ------
+        flow.utils.exceptions.FatalFlowError
+            if the format or a field is not supported, or if the parquet
+            format is requested and pyarrow is not installed
+        """
+        if fields is None:
+            fields = list(EMISSION_FIELDS.keys())
+        unknown = [name for name in fields if name not in EMISSION_FIELDS]
+        if unknown:
+            raise FatalFlowError(
+                "Unknown emission fields: {}".format(", ".join(unknown)))
+        if fmt not in EXTENSIONS:
+            raise FatalFlowError(
+                "Unknown emission format: {}".format(fmt))
+        if fmt == "parquet" and pyarrow is None:
+            raise FatalFlowError(
+                "The parquet emission format requires pyarrow.")
+
+        self.path = path
+        self.fields = list(fields)
+        self.fmt = fmt
+        self.chunk_size = chunk_size
+        self.num_rows = 0
+        self.num_chunks = 0
+        self._file = None
+
+        types = {"time": float, "id": str}
+        types.update({name: EMISSION_FIELDS[name][0] for name in self.fields})
+        self._chunk = {
+            name: np.empty(chunk_size, dtype=object if t is str else t)
+            for name, t in types.items()}
+
+    def record(self, t, kv):
+        """Append the data of all the vehicles at the current time.
+
+        Parameters
+        ----------
+        t : float
+            time of the sample
+        kv : flow.core.kernel.vehicle.KernelVehicle
+            the vehicle kernel
+        """
+        veh_ids = kv.get_ids()
+        columns = {"time": [t] * len(veh_ids), "id": veh_ids}
+        for name in self.fields:
+            getter = EMISSION_FIELDS[name][1]
+            columns[name] = [getter(kv, veh_id) for veh_id in veh_ids]
+        self.append(columns)
+
+    def append(self, columns):
+        """Append rows to the recorded columns.
+
+        Parameters
+        ----------
+        columns : dict <str, list>
+            the values of every column (time, id and fields) of the rows
+        """
+        num_new_rows = len(columns["id"])
+        start = 0
+        while start < num_new_rows:
+            end = min(num_new_rows,
+                      start + self.chunk_size - self.num_rows)
+            rows = slice(self.num_rows, self.num_rows + end - start)
+            for name, values in self._chunk.items():
+                values[rows] = columns[name][start:end]
+            self.num_rows += end - start
+            start = end
+            if self.num_rows == self.chunk_size:
+                self.flush()
+
+    def flush(self):
+        """Write the rows of the current chunk to the file."""
+        if self.num_rows == 0:
+            return
+
+        columns = {}
+        for name, values in self._chunk.items():
+            values = values[:self.num_rows]
+            if values.dtype == object:
+                # missing ids are stored as empty strings
+                values = np.array(
+                    ["" if v is None else v for v in values], dtype=str)
+            else:
+                values = values.copy()
+            columns[name] = values
+
+        if self.fmt == "npz":
+            if self._file is None:
+                self._file = zipfile.ZipFile(
+                    self.path, "w", compression=zipfile.ZIP_DEFLATED)
+            for name, values in columns.items():
+                entry = "{:05d}/{}.npy".format(self.num_chunks, name)
+                with self._file.open(entry, "w", force_zip64=True) as f:
+                    np.lib.format.write_array(f, values, allow_pickle=False)
+        else:
+            table = pyarrow.table(columns)
+            if self._file is None:
+                self._file = pq.ParquetWriter(self.path, table.schema)
+            self._file.write_table(table)
+
+        self.num_rows = 0
+        self.num_chunks += 1
+
+    def close(self):
+        """Write the remaining rows and close the file.
+
+        Returns
+        -------
+        str or None
+            path to the emission file, or None if no data was recorded
+        """
+        self.flush()
+        if self._file is None:
+            return None
+        self._file.close()
+        self._file = None
+        return self.path
+
+
+def iter_emission(path, fields=None):
+    """Iterate over the chunks of an emission file.
+
+    Only the requested columns are read from the file.
+
+    Parameters
+    ----------
+    path : str
+        path to the .npz or .parquet emission file
+    fields : list of str, optional
+        names of the columns to read, defaults to all of them
+
+    Yields
+    ------
+    dict <str, np.ndarray>
+        the columns of a chunk, in the order of the file
+    """
+    if path.endswith(".parquet"):
+        if pyarrow is None:
+            raise FatalFlowError(
+                "Reading parquet emission files requires pyarrow.")
+        parquet_file = pq.ParquetFile(path)
+        names = parquet_file.schema_arrow.names
+        if fields is not None:
+            names = [name for name in names if name in fields]
+        for i in range(parquet_file.num_row_groups):
+            table = parquet_file.read_row_group(i, columns=names)
+            yield {name: table.column(name).to_numpy() for name in names}
+    else:
+        with np.load(path, allow_pickle=False) as npz:
+            chunks = {}
+            for key in npz.files:
+                chunk, name = key.split("/")
+                chunks.setdefault(chunk, []).append(name)
+            for chunk in sorted(chunks):
+                names = chunks[chunk]
+                if fields is not None:
+                    names = [name for name in names if name in fields]
+                yield {name: npz["{}/{}".format(chunk, name)]
+                       for name in names}
+
+
+def load_emission(path, fields=None):
+    """Load the columns of an emission file.
+
+    Parameters
+    ----------
+    path : str
+        path to the .npz or .parquet emission file
+    fields : list of str, optional
+        names of the columns to read, defaults to all of them
+
+    Returns
+    -------
+    dict <str, np.ndarray>
+        the columns of the file
+    """
+    columns = {}
+    for chunk in iter_emission(path, fields):
+        for name, values in chunk.items():
+            columns.setdefault(name, []).append(values)
+    return {name: np.concatenate(values) for name, values in columns.items()}
+
+
+def emission_to_csv(path, output_path=None):
+    """Convert an emission file recorded by EmissionRecorder into a csv file.
+
+    The file is converted one chunk at a time. Missing accelerations are
+    written as empty values.
+
+    Parameters
+    ----------
+    path : str
+        path to the .npz or .parquet emission file
+    output_path : str, optional
+        path to the csv file that will be generated, default is the same
+        directory as the emission file, with the same name
+
+    Returns
+    -------
+    str
+        path to the csv file
+    """
+    if output_path is None:
+        output_path = os.path.splitext(path)[0] + ".csv"
+
+    with open(output_path, "w") as f:
+        writer = csv.writer(f, delimiter=",")
+        header = False
+        for chunk in iter_emission(path):
+            if not header:
+                writer.writerow(chunk.keys())
+                header = True
+            columns = []
+            for values in chunk.values():
+                if values.dtype.kind == "f":
+                    values = np.where(
+                        np.isnan(values), None, values.astype(object))
+                columns.append(values.tolist())
+            writer.writerows(zip(*columns))
+
+    return output_path
+
+
+def _to_csv(path):
+    """Convert an emission file of any supported format into a csv file."""
+    if path.endswith(".xml"):
+        return util.emission_to_csv(path)
+    return emission_to_csv(path)
+
+
+def emissions_to_csv(paths, num_workers=None):
+    """Convert several emission files into csv files in parallel.
+
+    Both the files recorded by EmissionRecorder and the .xml files generated
+    by sumo are supported. Each file is converted in a separate process.
+
+    Parameters
+    ----------
+    paths : list of str
+        paths to the emission files
+    num_workers : int, optional
+        number of processes converting the files, defaults to the number of
+        cpus
+
+    Returns
+    -------
+    list of str
+        paths to the csv files, in the order of the emission files
+    """
+    if num_workers is None:
+        num_workers = multiprocessing.cpu_count()
+    num_workers = min(num_workers, len(paths))
+
+    if num_workers <= 1:
+        return [_to_csv(path) for path in paths]
+
+    with multiprocessing.Pool(num_workers) as pool:
+        return pool.map(_to_csv, paths)
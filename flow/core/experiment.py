@@ -1,7 +1,9 @@
 """Contains an experiment class for running simulations."""
+from flow.core.emission import emissions_to_csv
 from flow.utils.registry import make_create_env
 from datetime import datetime
 import logging
+import os
 import time
 import numpy as np
 
@@ -42,9 +44,11 @@ class Experiment:
         >>> exp.run(num_runs=1, convert_to_csv=True)
 
     After the experiment is complete, look at the "./data" directory. There
-    will be two files, one with the suffix .xml and another with the suffix
-    .csv. The latter should be easily interpretable from any csv reader (e.g.
-    Excel), and can be parsed using tools such as numpy and pandas.
+    will be a file with the suffix .csv for every run, which should be easily
+    interpretable from any csv reader (e.g. Excel), and can be parsed using
+    tools such as numpy and pandas. Without convert_to_csv, the data is kept
+    in the compressed columnar files (see flow.core.emission) recorded
+    during the runs.
 
     Attributes
     ----------
@@ -95,7 +99,8 @@ class Experiment:
             there are any)
         convert_to_csv : bool
             Specifies whether to convert the emission file created by sumo
-            into a csv file
+            into a csv file. The files of all the runs are converted in
+            parallel at the end of the experiment.
 
         Returns
         -------
@@ -134,6 +139,7 @@ class Experiment:
         # time profiling information
         t = time.time()
         times = []
+        emission_files = []
 
         for i in range(num_runs):
             ret = 0
@@ -171,7 +177,10 @@ class Experiment:
             # Save emission data at the end of every rollout. This is skipped
             # by the internal method if no emission path was specified.
             if self.env.simulator == "traci":
-                self.env.k.simulation.save_emission(run_id=i)
+                emission_file = self.env.k.simulation.save_emission(run_id=i)
+
+                if convert_to_csv and emission_file is not None:
+                    emission_files.append(emission_file)
 
         # Print the averages/std for all variables in the info_dict.
         for key in info_dict.keys():
@@ -182,4 +191,9 @@ class Experiment:
         print("steps/second:", np.mean(times))
         self.env.terminate()
 
+        # Convert the emission files into csv files.
+        emissions_to_csv(emission_files)
+        for emission_file in emission_files:
+            os.remove(emission_file)
+
         return info_dict
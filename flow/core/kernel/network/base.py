@@ -154,6 +154,18 @@ class BaseKernelNetwork(object):
         """Return the names of all junctions in the network."""
         raise NotImplementedError
 
+    def get_edge_stats(self):
+        """Return the aggregated state of all edges at the last step.
+
+        Returns
+        -------
+        np.ndarray
+            one row per edge, in the order of ``get_edge_list()``, with the
+            number of vehicles, the mean speed (m/s), the CO2 emission (mg/s)
+            and the occupancy (%) of the edge
+        """
+        raise NotImplementedError
+
     def get_edge(self, x):  # TODO: maybe remove
         """Compute an edge and relative position from an absolute position.
 
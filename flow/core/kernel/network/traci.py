@@ -1,13 +1,22 @@
 """Script containing the TraCI network kernel class."""
 
 from flow.core.kernel.network import BaseKernelNetwork
+import traci.constants as tc
 from flow.core.util import makexml, printxml, ensure_dir
+import flow.config as config
 import time
 import os
+import shutil
+import hashlib
 import subprocess
+import tempfile
 import xml.etree.ElementTree as ElementTree
 from lxml import etree
 from copy import deepcopy
+from collections import OrderedDict
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
 
 E = etree.Element
 
@@ -15,6 +24,30 @@ E = etree.Element
 RETRIES_ON_ERROR = 10
 # number of seconds to wait before trying to access the .net.xml file again
 WAIT_ON_ERROR = 1
+# time penalties of sumo's router for turnarounds and minor links (sumo's
+# --weights.turnaround-penalty and --weights.minor-penalty defaults)
+TURNAROUND_PENALTY = 5.0
+MINOR_PENALTY = 1.5
+# edge variables that are subscribed to, in the columns of get_edge_stats()
+EDGE_SUBSCRIBED_VARIABLES = [
+    tc.LAST_STEP_VEHICLE_NUMBER,
+    tc.LAST_STEP_MEAN_SPEED,
+    tc.VAR_CO2EMISSION,
+    tc.LAST_STEP_OCCUPANCY
+]
+# version of the netconvert binary, read once per process by _net_cache_key
+_netconvert_version = None
+
+
+def _get_netconvert_version():
+    """Return the output of netconvert --version, which is cached."""
+    global _netconvert_version
+    if _netconvert_version is None:
+        _netconvert_version = subprocess.run(
+            ['netconvert', '--version'],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL).stdout
+    return _netconvert_version
 
 
 def _flow(name, vtype, route, **kwargs):
@@ -30,6 +63,103 @@ def _inputs(net=None, rou=None, add=None, gui=None):
     return inp
 
 
+class RouteOracle(object):
+    """Answer route queries between the edges of a sumo network.
+
+    Routes between two edges of the network are rebuilt from the predecessor
+    table of ``TraCIKernelNetwork.get_shortest_paths``, which uses the same
+    costs as sumo's router. The other queries (e.g. from an internal edge, on
+    which a vehicle crossing a junction is located) fall back to
+    ``simulation.findRoute``, whose results are kept in a LRU cache.
+
+    Attributes
+    ----------
+    hits : int
+        number of queries answered from the predecessor table
+    cache_hits : int
+        number of queries answered from the cache of sumo routes
+    misses : int
+        number of queries sent to sumo
+    """
+
+    def __init__(self, network, cache_size=1024):
+        """Instantiate the route oracle.
+
+        Parameters
+        ----------
+        network : TraCIKernelNetwork
+            the network kernel, whose kernel api is used for the queries that
+            are sent to sumo
+        cache_size : int
+            maximum number of routes kept in the cache of sumo routes
+        """
+        self.network = network
+        self.cache_size = cache_size
+        self._edge_index = None
+        self._predecessors = None
+        self._cache = OrderedDict()
+        self.hits = 0
+        self.cache_hits = 0
+        self.misses = 0
+
+    def find_route(self, from_edge, to_edge):
+        """Return the fastest route between two edges.
+
+        Parameters
+        ----------
+        from_edge : str
+            name of the origin edge
+        to_edge : str
+            name of the destination edge
+
+        Returns
+        -------
+        tuple of str
+            edges of the route, including the origin and destination edges.
+            Empty if the destination cannot be reached
+        """
+        if self._edge_index is None:
+            _, self._predecessors = self.network.get_shortest_paths()
+            self._edge_index = {
+                edge: i for i, edge in enumerate(self.network.get_edge_list())}
+
+        i = self._edge_index.get(from_edge)
+        j = self._edge_index.get(to_edge)
+        if i is not None and j is not None:
+            self.hits += 1
+            if i == j:
+                return (from_edge,)
+            if self._predecessors[i, j] < 0:
+                return ()
+            route = [j]
+            while route[-1] != i:
+                route.append(self._predecessors[i, route[-1]])
+            edges = self.network.get_edge_list()
+            return tuple(edges[k] for k in reversed(route))
+
+        key = (from_edge, to_edge)
+        if key in self._cache:
+            self.cache_hits += 1
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        self.misses += 1
+        route = tuple(self.network.kernel_api.simulation.findRoute(
+            from_edge, to_edge).edges)
+        self._cache[key] = route
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return route
+
+    @property
+    def hit_rate(self):
+        """Return the fraction of the queries that were not sent to sumo."""
+        num_queries = self.hits + self.cache_hits + self.misses
+        if num_queries == 0:
+            return 0.
+        return (self.hits + self.cache_hits) / num_queries
+
+
 class TraCIKernelNetwork(BaseKernelNetwork): # TODO: update kernel api
     """Base network kernel for sumo-based simulations.
 
@@ -62,6 +192,13 @@ class TraCIKernelNetwork(BaseKernelNetwork): # TODO: update kernel api
         ensure_dir('%s' % self.net_path)
         ensure_dir('%s' % self.cfg_path)
 
+        # directory in which the generated .net.xml files are shared between
+        # environments and processes (not used if None)
+        self.net_cache_dir = getattr(sim_params, "net_cache_dir", None) \
+            or config.NET_CACHE_DIR
+        if self.net_cache_dir is not None:
+            ensure_dir(self.net_cache_dir)
+
         # variables to be defined during network generation
         self.network = None
         self.nodfn = None
@@ -83,6 +220,9 @@ class TraCIKernelNetwork(BaseKernelNetwork): # TODO: update kernel api
         self.__non_internal_length = None  # total length of non-internal edges
         self.rts = None
         self.cfg = None
+        self._shortest_paths = None
+        self.route_oracle = None
+        self._edge_stats = None
 
     def generate_network(self, network):
         """See parent class.
@@ -99,6 +239,8 @@ class TraCIKernelNetwork(BaseKernelNetwork): # TODO: update kernel api
         """
         # store the network object in the network variable
         self.network = network
+        self._shortest_paths = None
+        self.route_oracle = RouteOracle(self)
         self.orig_name = network.orig_name
         self.name = network.name
 
@@ -210,9 +352,29 @@ class TraCIKernelNetwork(BaseKernelNetwork): # TODO: update kernel api
         # specify the location of the sumo configuration file
         self.cfg = self.cfg_path + cfg_name
 
+    def pass_api(self, kernel_api):
+        """See parent class.
+
+        The aggregated state of all edges is subscribed to here.
+        """
+        BaseKernelNetwork.pass_api(self, kernel_api)
+
+        self._edge_stats = np.zeros(
+            (len(self._edge_list), len(EDGE_SUBSCRIBED_VARIABLES)))
+        for edge in self._edge_list:
+            self.kernel_api.edge.subscribe(edge, EDGE_SUBSCRIBED_VARIABLES)
+
     def update(self, reset):
-        """Perform no action of value (networks are static)."""
-        pass
+        """See parent class.
+
+        The network is static, only the subscribed edge data is updated.
+        """
+        edge_obs = self.kernel_api.edge.getAllSubscriptionResults()
+        for i, edge in enumerate(self._edge_list):
+            obs = edge_obs.get(edge)
+            if obs is not None:
+                self._edge_stats[i] = [
+                    obs[var] for var in EDGE_SUBSCRIBED_VARIABLES]
 
     def close(self):
         """Close the network class.
@@ -315,6 +477,10 @@ class TraCIKernelNetwork(BaseKernelNetwork): # TODO: update kernel api
         """See parent class."""
         return self._junction_list
 
+    def get_edge_stats(self):
+        """See parent class."""
+        return self._edge_stats
+
     def next_edge(self, edge, lane):
         """See parent class."""
         try:
@@ -329,6 +495,105 @@ class TraCIKernelNetwork(BaseKernelNetwork): # TODO: update kernel api
         except KeyError:
             return []
 
+    def get_shortest_paths(self):
+        """Return the fastest routes between all pairs of edges.
+
+        The routing graph is built from the .net.xml file of the network, and
+        only includes the lanes that passenger vehicles may use. As in sumo's
+        router, the cost of a route is the free-flow travel time of all its
+        edges but the last one, including the internal edges connecting them
+        and the time penalties of turnarounds and minor links. The routes are
+        computed once per generated network.
+
+        Returns
+        -------
+        np.ndarray
+            travel time of the route between every pair of edges, indexed in
+            the order of ``get_edge_list()``. np.inf if the destination edge
+            cannot be reached
+        np.ndarray
+            index of the edge preceding the destination edge on the route
+            between every pair of edges, or -1 if the edges are identical or
+            the destination cannot be reached
+        """
+        if self._shortest_paths is None:
+            parser = etree.XMLParser(recover=True)
+            net_path = os.path.join(self.cfg_path, self.netfn) \
+                if self.network.net_params.template is None else self.netfn
+            root = etree.parse(net_path, parser=parser).getroot()
+
+            def allows_passenger(lane):
+                allow = lane.get('allow', 'all').split()
+                disallow = lane.get('disallow', '').split()
+                return ('all' in allow or 'passenger' in allow) \
+                    and 'all' not in disallow and 'passenger' not in disallow
+
+            # free-flow travel time of every lane, and whether it may be used
+            travel_time = {}
+            allowed = {}
+            for edge in root.iter('edge'):
+                for lane in edge.iter('lane'):
+                    travel_time[lane.get('id')] = \
+                        float(lane.get('length')) / float(lane.get('speed'))
+                    allowed[lane.get('id')] = allows_passenger(lane)
+
+            # the travel time of an internal edge is that of its first lane,
+            # plus the penalty of the link leading to this lane if it is a minor
+            # link that is not controlled by a traffic light
+            links = {}
+            for conn in root.iter('connection'):
+                via = conn.get('via')
+                if via is not None and via.endswith('_0') and \
+                        conn.get('tl') is None and \
+                        not conn.get('state', 'M').isupper():
+                    travel_time[via] += TURNAROUND_PENALTY \
+                        if conn.get('dir') == 't' else MINOR_PENALTY
+
+                # as in sumo, the first connection between two edges that is
+                # usable by passenger vehicles links them in the routes
+                from_lane = '{}_{}'.format(
+                    conn.get('from'), conn.get('fromLane'))
+                to_lane = '{}_{}'.format(conn.get('to'), conn.get('toLane'))
+                if allowed.get(from_lane, False) and \
+                        allowed.get(to_lane, False):
+                    links.setdefault((conn.get('from'), conn.get('to')), conn)
+
+            # internal edges that follow an internal edge, for junctions that
+            # are crossed through several internal edges
+            next_via = {}
+            for (from_edge, _), conn in links.items():
+                if from_edge[0] == ':' and conn.get('via') is not None:
+                    next_via.setdefault(
+                        from_edge, conn.get('via').rsplit('_', 1)[0])
+
+            edge_index = {edge: i for i, edge in enumerate(self._edge_list)}
+            cost = {}
+            for (from_edge, to_edge), conn in links.items():
+                if from_edge not in edge_index or to_edge not in edge_index:
+                    continue
+
+                # time spent on the edge and on the internal edges after it
+                tt = travel_time[from_edge + '_0']
+                via = conn.get('via')
+                via = via.rsplit('_', 1)[0] if via is not None else None
+                while via is not None:
+                    tt += travel_time[via + '_0']
+                    via = next_via.get(via)
+
+                cost[edge_index[from_edge], edge_index[to_edge]] = tt
+
+            n_edge = len(self._edge_list)
+            rows, cols = zip(*cost.keys()) if cost else ((), ())
+            graph = csr_matrix(
+                (list(cost.values()), (rows, cols)), shape=(n_edge, n_edge))
+
+            travel_times, predecessors = dijkstra(
+                graph, directed=True, return_predecessors=True)
+            predecessors[predecessors < 0] = -1
+            self._shortest_paths = (travel_times, predecessors)
+
+        return self._shortest_paths
+
     # TODO: nodes should have a traffic light option
     def generate_net(self,
                      net_params,
@@ -509,25 +774,45 @@ class TraCIKernelNetwork(BaseKernelNetwork): # TODO: update kernel api
         x.append(t)
         printxml(x, self.net_path + self.cfgfn)
 
-        netconvert_call = [
-                'netconvert -c ' + self.net_path + self.cfgfn +
-                ' --output-file=' + self.cfg_path + self.netfn +
-                ' --no-internal-links="false"' +
-                ' --no-turnarounds.fringe="false"' +
-                ' --no-turnarounds="false"' +
-                ' --sidewalks.guess="true"' +
-                ' --default.junctions.radius=0'
-            ]
+        netconvert_options = \
+            ' --no-internal-links="false"' + \
+            ' --no-turnarounds.fringe="false"' + \
+            ' --no-turnarounds="false"' + \
+            ' --sidewalks.guess="true"' + \
+            ' --default.junctions.radius=0'
 
         if 'print_warnings' in net_params.additional_params:
             if not net_params.additional_params['print_warnings']:
-                netconvert_call[0] += ' --no-warnings="true"'
+                netconvert_options += ' --no-warnings="true"'
 
-        subprocess.call(
-            netconvert_call,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
-            shell=True)
+        if self.net_cache_dir is None:
+            self._netconvert(self.cfg_path + self.netfn, netconvert_options)
+        else:
+            input_files = [self.nodfn, self.edgfn]
+            if types is not None:
+                input_files.append(self.typfn)
+            if connections is not None:
+                input_files.append(self.confn)
+
+            # reuse the .net.xml file of an identical network if it was
+            # already generated, by this or by any other process
+            cached_netfn = os.path.join(
+                self.net_cache_dir,
+                self._net_cache_key(input_files, netconvert_options)
+                + '.net.xml')
+            if not os.path.isfile(cached_netfn):
+                # netconvert writes to a temporary file with a unique name,
+                # which is then published atomically under the name of the
+                # cache entry
+                fd, tmp_netfn = tempfile.mkstemp(
+                    dir=self.net_cache_dir, suffix='.tmp')
+                os.close(fd)
+                if self._netconvert(tmp_netfn, netconvert_options) == 0:
+                    os.replace(tmp_netfn, cached_netfn)
+                else:
+                    os.remove(tmp_netfn)
+            if os.path.isfile(cached_netfn):
+                self._link_net_file(cached_netfn, self.cfg_path + self.netfn)
 
         # collect data from the generated network configuration file
         error = None
@@ -541,6 +826,81 @@ class TraCIKernelNetwork(BaseKernelNetwork): # TODO: update kernel api
                 time.sleep(WAIT_ON_ERROR)
         raise error
 
+    def _netconvert(self, output_file, options):
+        """Call netconvert on the netconvert configuration of the network.
+
+        Parameters
+        ----------
+        output_file : str
+            path to the .net.xml file to generate
+        options : str
+            additional command line options passed to netconvert
+
+        Returns
+        -------
+        int
+            exit code of netconvert
+        """
+        netconvert_call = [
+            'netconvert -c ' + self.net_path + self.cfgfn +
+            ' --output-file=' + output_file + options
+        ]
+
+        return subprocess.call(
+            netconvert_call,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            shell=True)
+
+    def _net_cache_key(self, input_files, options):
+        """Return the key of a generated network in the .net.xml cache.
+
+        The key is a hash of the network class, the contents of the node,
+        edge, type, and connection files (i.e. the outputs of the specify_*
+        methods of the network), the netconvert options, and the version of
+        netconvert, so that the entries of another version are not reused.
+        The names of the files are not included, so that networks with
+        different names share the same entry.
+
+        Parameters
+        ----------
+        input_files : list of str
+            names of the netconvert input files (located in net_path)
+        options : str
+            additional command line options passed to netconvert
+
+        Returns
+        -------
+        str
+            hexadecimal digest of the hash
+        """
+        network_class = type(self.network)
+        key = hashlib.sha1()
+        key.update('{}.{}'.format(
+            network_class.__module__, network_class.__name__).encode())
+        for fn in input_files:
+            with open(self.net_path + fn, 'rb') as f:
+                key.update(f.read())
+        key.update(options.encode())
+        key.update(_get_netconvert_version())
+        return key.hexdigest()
+
+    @staticmethod
+    def _link_net_file(cached_netfn, netfn):
+        """Hard-link a cached .net.xml file to the location sumo loads.
+
+        The file is copied instead if it cannot be linked, e.g. if the cache
+        is located on a different file system.
+        """
+        try:
+            os.remove(netfn)
+        except OSError:
+            pass
+        try:
+            os.link(cached_netfn, netfn)
+        except OSError:
+            shutil.copyfile(cached_netfn, netfn)
+
     def generate_net_from_osm(self, net_params):
         """Generate .net.xml files from OpenStreetMap files.
 
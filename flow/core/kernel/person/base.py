@@ -170,6 +170,23 @@ class KernelPerson(object, metaclass=ABCMeta):
         """
         pass
 
+    @abstractmethod
+    def get_waiting_time(self, per_id, error=-1001):
+        """Return the time the person has been waiting for its current stage.
+
+        Parameters
+        ----------
+        per_id : str or list of str
+            person id, or list of person ids
+        error : any, optional
+            value that is returned if the person is not found
+
+        Returns
+        -------
+        float
+        """
+        pass
+
     ###########################################################################
     #                        Methods for Datapipeline                         #
     ###########################################################################
@@ -7,12 +7,19 @@ from flow.core.kernel.person import KernelPerson
 import traci.constants as tc
 from traci.exceptions import FatalTraCIError, TraCIException
 import numpy as np
-import collections
 import warnings
-from bisect import bisect_left
+from bisect import bisect_left, insort
 import itertools
 from copy import deepcopy
 
+# variables of the persons that are subscribed to
+SUBSCRIBED_VARIABLES = [
+    tc.VAR_LANEPOSITION,
+    tc.VAR_LANE_ID,
+    tc.VAR_POSITION,
+    tc.VAR_WAITING_TIME
+]
+
 # colors for vehicles
 WHITE = (255, 255, 255)
 CYAN = (0, 255, 255)
@@ -37,11 +44,15 @@ class TraCIPerson(KernelPerson):
         """See parent class."""
         KernelPerson.__init__(self, master_kernel, sim_params)
 
-        self.__ids = []  # ids of all persons
+        self.__ids = []  # ids of all persons, sorted as in sumo
+
+        # subscription results: Key = Person ID, Value = dictionary of the
+        # subscribed variables
+        self.__sumo_obs = {}
 
-        # persons: Key = Person ID, Value = Stage describing the person
-        # Ordered dictionary used to keep neural net inputs in order
-        self.__persons = collections.OrderedDict()
+        # stages of the persons, only requested from sumo when needed, and
+        # cleared after every simulation step
+        self.__stages = {}
         self.__match = {}
         self.__removed = set()
 
@@ -71,7 +82,8 @@ class TraCIPerson(KernelPerson):
         """
         self.total = 0
         self.num_persons = 0
-        self.__persons = collections.OrderedDict()
+        self.__sumo_obs = {}
+        self.__stages = {}
         self.__types = {}
         self.__ids = []
         self.__reservations = []
@@ -83,11 +95,11 @@ class TraCIPerson(KernelPerson):
 
         The following actions are performed:
 
-        * The state of all persons is modified to match their state at the
-          current time step. This includes states specified by sumo, and states
-          explicitly defined by flow, e.g. "num_arrived".
         * If persons exit the network, they are removed from the persons
-          class, and newly departed persons are introduced to the class.
+          class, and newly departed persons are introduced to the class and
+          subscribed to.
+        * The subscribed state of all persons is collected in bulk. The stages
+          of the persons are only requested when needed.
 
         Parameters
         ----------
@@ -95,16 +107,27 @@ class TraCIPerson(KernelPerson):
             specifies whether the simulator was reset in the last simulation
             step
         """
-
-        self.__ids = self.kernel_api.person.getIDList()
+        if reset:
+            self.__ids = sorted(self.kernel_api.person.getIDList())
+            for per_id in self.__ids:
+                self.kernel_api.person.subscribe(per_id, SUBSCRIBED_VARIABLES)
+        else:
+            sim_obs = self.kernel_api.simulation.getSubscriptionResults()
+            arrived = set(sim_obs[tc.VAR_ARRIVED_PERSONS_IDS])
+            if len(arrived) > 0:
+                self.__ids = [
+                    per_id for per_id in self.__ids if per_id not in arrived]
+            for per_id in sim_obs[tc.VAR_DEPARTED_PERSONS_IDS]:
+                self.kernel_api.person.subscribe(per_id, SUBSCRIBED_VARIABLES)
+                insort(self.__ids, per_id)
+
+        self.__sumo_obs = self.kernel_api.person.getAllSubscriptionResults()
+        if len(self.__sumo_obs) != len(self.__ids):
+            # persons removed through the kernel api do not arrive
+            self.__ids = [
+                per_id for per_id in self.__ids if per_id in self.__sumo_obs]
         self.num_persons = len(self.__ids)
-        self.__persons = collections.OrderedDict()
-        for per_id in self.__ids:
-            self.__persons[per_id] = {}
-            self.__persons[per_id]['stage'] = self.kernel_api.person.getStage(per_id)
-            self.__persons[per_id]['lane_position'] = self.kernel_api.person.getLanePosition(per_id)
-            self.__persons[per_id]['lane_id'] = self.kernel_api.person.getLaneID(per_id)
-            self.__persons[per_id]['position'] = self.kernel_api.person.getPosition(per_id)
+        self.__stages = {}
         self.__reservations = self.kernel_api.person.getTaxiReservations(0)
 
     def add(self, per_id, type_id, edge, pos):
@@ -148,17 +171,27 @@ class TraCIPerson(KernelPerson):
         The last term for sumo (transparency) is set to 255.
         """
         r, g, b = color
-        self.kernel_api.person.setColor(personID=per_id, color=(r, g, b, 255))
+        self.kernel_api.person.setColor(per_id, (r, g, b, 255))
 
     def get_ids(self):
         """See parent class."""
         return self.__ids
 
+    def get_stage(self, per_id):
+        """Return the current stage of the person.
+
+        The stage is requested from sumo at the first call after a simulation
+        step.
+        """
+        if per_id not in self.__stages:
+            self.__stages[per_id] = self.kernel_api.person.getStage(per_id)
+        return self.__stages[per_id]
+
     def get_waiting_ids(self):
         """See parent class."""
         ret_ids = []
         for per_id in self.__ids:
-            if self.__persons[per_id]['stage'].description == 'waiting for taxi':
+            if self.get_stage(per_id).description == 'waiting for taxi':
                 ret_ids.append(per_id)
         return ret_ids
     
@@ -166,7 +199,7 @@ class TraCIPerson(KernelPerson):
         """See parent class."""
         ret_ids = []
         for per_id in self.__ids:
-            if self.__persons[per_id]['stage'].description == 'driving':
+            if self.get_stage(per_id).description == 'driving':
                 ret_ids.append(per_id)
         return ret_ids
 
@@ -178,14 +211,20 @@ class TraCIPerson(KernelPerson):
         """See parent class."""
         if isinstance(per_id, (list, np.ndarray)):
             return [self.get_position(perID) for perID in per_id]
-        return self.__persons[per_id]['lane_position']
+        return self.__sumo_obs[per_id][tc.VAR_LANEPOSITION]
 
     def get_lane(self, per_id):
         """See parent class."""
         if isinstance(per_id, (list, np.ndarray)):
-            return [self.get_edge(perID) for perID in per_id]
-        return self.__persons[per_id]['lane_id']
+            return [self.get_lane(perID) for perID in per_id]
+        return self.__sumo_obs[per_id][tc.VAR_LANE_ID]
+
+    def get_waiting_time(self, per_id, error=-1001):
+        """See parent class."""
+        if isinstance(per_id, (list, np.ndarray)):
+            return [self.get_waiting_time(perID, error) for perID in per_id]
+        return self.__sumo_obs.get(per_id, {}).get(tc.VAR_WAITING_TIME, error)
 
     def get_2d_position(self, per_id):
         """See parent class."""
-        return self.__persons[per_id]['position']
\ No newline at end of file
+        return self.__sumo_obs[per_id][tc.VAR_POSITION]
\ No newline at end of file
@@ -1,7 +1,9 @@
 """Script containing the TraCI simulation kernel class."""
 
 from flow.core.kernel.simulation import KernelSimulation
+from flow.core.emission import EmissionRecorder, EXTENSIONS
 from flow.core.util import ensure_dir
+from flow.utils.exceptions import FatalFlowError
 import flow.config as config
 import traci.constants as tc
 import traci
@@ -11,12 +13,52 @@ import time
 import logging
 import subprocess
 import signal
-import csv
+import threading
+
+try:
+    import libsumo
+except ImportError:
+    libsumo = None
+else:
+    # importing libsumo replaces traci.exceptions.TraCIException by its own
+    # class, which is not raised by the TraCI connections. The modules that
+    # import it afterwards would no longer catch the errors of sumo.
+    traci.exceptions.TraCIException = traci.connection.TraCIException
 
 
 # Number of retries on restarting SUMO before giving up
 RETRIES_ON_ERROR = 10
 
+# libsumo runs a single simulation per process, owned by one kernel
+_libsumo_lock = threading.Lock()
+_libsumo_owner = None
+
+
+def _acquire_libsumo(kernel):
+    """Make kernel the owner of the libsumo simulation of the process.
+
+    Raises
+    ------
+    flow.utils.exceptions.FatalFlowError
+        if another kernel already runs a libsumo simulation in this process
+    """
+    global _libsumo_owner
+    with _libsumo_lock:
+        if _libsumo_owner is not None and _libsumo_owner is not kernel:
+            raise FatalFlowError(
+                "a libsumo simulation is already running in this process, "
+                "and libsumo only supports one per process. Close it first, "
+                "or set use_libsumo to False for the other environments")
+        _libsumo_owner = kernel
+
+
+def _release_libsumo(kernel):
+    """Release the libsumo simulation of the process, if kernel owns it."""
+    global _libsumo_owner
+    with _libsumo_lock:
+        if _libsumo_owner is kernel:
+            _libsumo_owner = None
+
 
 class TraCISimulation(KernelSimulation): # TODO: add person & update kernel api
     """Sumo simulation kernel.
@@ -27,6 +69,9 @@ class TraCISimulation(KernelSimulation): # TODO: add person & update kernel api
     ----------
     sumo_proc : subprocess.Popen
         contains the subprocess.Popen instance used to start traci
+    use_libsumo : bool
+        whether sumo was loaded in-process with libsumo by the last call to
+        ``start_simulation``
     sim_step : float
         seconds per simulation step
     emission_path : str or None
@@ -34,20 +79,27 @@ class TraCISimulation(KernelSimulation): # TODO: add person & update kernel api
         output is not generated if this value is not specified
     time : float
         used to internally keep track of the simulation time
-    stored_data : dict <str, dict <float, dict <str, Any>>>
-        a dict object used to store additional data if an emission file is
-        provided. The first key corresponds to the name of the vehicle, the
-        second corresponds to the time the sample was issued, and the final
-        keys represent the additional data stored at every given time for every
-        vehicle, and consists of the following keys:
-
-        * acceleration (no noise): the accelerations issued to the vehicle,
-          excluding noise
-        * acceleration (requested): the requested acceleration by the vehicle,
-          including noise
-        * acceleration (actual): the actual acceleration by the vehicle,
+    emission_fields : list of str or None
+        names of the recorded emission fields, or None to record all of them
+    emission_decimation : int
+        the emission data is recorded every emission_decimation steps
+    emission_format : str
+        format of the emission files, one of "npz" or "parquet"
+    emission_step : int
+        number of steps since the last reset, used for decimation
+    emission_recorder : flow.core.emission.EmissionRecorder or None
+        recorder of the emission data of the current rollout, created once
+        the first data is collected. The recorded fields are described in
+        ``flow.core.emission.EMISSION_FIELDS``, and include:
+
+        * target accelerations: the accelerations issued to the vehicle,
+          with and without noise and failsafes
+        * realized_accel: the actual acceleration by the vehicle,
           collected by computing the difference between the speeds of the
           vehicle and dividing it by the sim_step term
+    snapshot : str or None
+        path to the state file saved by ``save_snapshot``, or None if no
+        snapshot of the current simulation instance has been saved
     """
 
     def __init__(self, master_kernel):
@@ -62,10 +114,16 @@ class TraCISimulation(KernelSimulation): # TODO: add person & update kernel api
         KernelSimulation.__init__(self, master_kernel)
 
         self.sumo_proc = None
+        self.use_libsumo = False
         self.sim_step = None
         self.emission_path = None
         self.time = 0
-        self.stored_data = dict()
+        self.emission_fields = None
+        self.emission_decimation = 1
+        self.emission_format = "npz"
+        self.emission_step = 0
+        self.emission_recorder = None
+        self.snapshot = None
 
     def pass_api(self, kernel_api):
         """See parent class.
@@ -75,7 +133,7 @@ class TraCISimulation(KernelSimulation): # TODO: add person & update kernel api
         KernelSimulation.pass_api(self, kernel_api)
 
         # subscribe some simulation parameters needed to check for entering,
-        # exiting, and colliding vehicles
+        # exiting, and colliding vehicles, and entering and exiting persons
         self.kernel_api.simulation.subscribe([
             tc.VAR_DEPARTED_VEHICLES_IDS,
             tc.VAR_ARRIVED_VEHICLES_IDS,
@@ -84,11 +142,14 @@ class TraCISimulation(KernelSimulation): # TODO: add person & update kernel api
             tc.VAR_DELTA_T,
             tc.VAR_LOADED_VEHICLES_NUMBER,
             tc.VAR_DEPARTED_VEHICLES_NUMBER,
-            tc.VAR_ARRIVED_VEHICLES_NUMBER
+            tc.VAR_ARRIVED_VEHICLES_NUMBER,
+            tc.VAR_DEPARTED_PERSONS_IDS,
+            tc.VAR_ARRIVED_PERSONS_IDS
         ])
 
     def simulation_step(self):
         """See parent class."""
+        self.master_kernel.vehicle.flush_commands()
         self.kernel_api.simulationStep()
 
     def update(self, reset):
@@ -100,47 +161,17 @@ class TraCISimulation(KernelSimulation): # TODO: add person & update kernel api
 
         # Collect the additional data to store in the emission file.
         if self.emission_path is not None:
-            kv = self.master_kernel.vehicle
-            for veh_id in self.master_kernel.vehicle.get_ids():
-                t = round(self.time, 2)
-
-                # some miscellaneous pre-processing
-                position = kv.get_2d_position(veh_id)
-
-                # Make sure dictionaries corresponding to the vehicle and
-                # time are available.
-                if veh_id not in self.stored_data.keys():
-                    self.stored_data[veh_id] = dict()
-                if t not in self.stored_data[veh_id].keys():
-                    self.stored_data[veh_id][t] = dict()
-
-                # Add the speed, position, and lane data.
-                self.stored_data[veh_id][t].update({
-                    "speed": kv.get_speed(veh_id),
-                    "lane_number": kv.get_lane(veh_id),
-                    "edge_id": kv.get_edge(veh_id),
-                    "relative_position": kv.get_position(veh_id),
-                    "x": position[0],
-                    "y": position[1],
-                    "headway": kv.get_headway(veh_id),
-                    "leader_id": kv.get_leader(veh_id),
-                    "follower_id": kv.get_follower(veh_id),
-                    "leader_rel_speed":
-                        kv.get_speed(kv.get_leader(veh_id))
-                        - kv.get_speed(veh_id),
-                    "target_accel_with_noise_with_failsafe":
-                        kv.get_accel(veh_id, noise=True, failsafe=True),
-                    "target_accel_no_noise_no_failsafe":
-                        kv.get_accel(veh_id, noise=False, failsafe=False),
-                    "target_accel_with_noise_no_failsafe":
-                        kv.get_accel(veh_id, noise=True, failsafe=False),
-                    "target_accel_no_noise_with_failsafe":
-                        kv.get_accel(veh_id, noise=False, failsafe=True),
-                    "realized_accel":
-                        kv.get_realized_accel(veh_id),
-                    "road_grade": kv.get_road_grade(veh_id),
-                    "distance": kv.get_distance(veh_id),
-                })
+            if reset:
+                self.emission_step = 0
+            if self.emission_step % self.emission_decimation == 0:
+                if self.emission_recorder is None:
+                    self.emission_recorder = EmissionRecorder(
+                        self._emission_file("part"),
+                        fields=self.emission_fields,
+                        fmt=self.emission_format)
+                self.emission_recorder.record(
+                    round(self.time, 2), self.master_kernel.vehicle)
+            self.emission_step += 1
 
     def close(self):
         """See parent class."""
@@ -148,7 +179,38 @@ class TraCISimulation(KernelSimulation): # TODO: add person & update kernel api
         if self.emission_path is not None:
             self.save_emission()
 
-        self.kernel_api.close()
+        # the snapshot belongs to this simulation instance
+        if self.snapshot is not None:
+            try:
+                os.remove(self.snapshot)
+            except OSError:
+                pass
+            self.snapshot = None
+
+        try:
+            self.kernel_api.close()
+        finally:
+            if self.use_libsumo:
+                _release_libsumo(self)
+
+    def save_snapshot(self):
+        """Save the current state of the simulation to a state file.
+
+        The snapshot can be restored with ``load_snapshot`` in order to reset
+        the simulation without restarting sumo or regenerating the network.
+        """
+        network = self.master_kernel.network
+        self.snapshot = "{}{}.state.xml".format(
+            network.cfg_path, network.network.name)
+        self.kernel_api.simulation.saveState(self.snapshot)
+
+    def load_snapshot(self):
+        """Restore the state saved by the last call to ``save_snapshot``."""
+        # sumo's taxi dispatcher keeps the reservations of persons that are
+        # discarded when loading a state, so the persons are removed first
+        for per_id in self.kernel_api.person.getIDList():
+            self.kernel_api.person.remove(per_id)
+        self.kernel_api.simulation.loadState(self.snapshot)
 
     def check_collision(self):
         """See parent class."""
@@ -165,8 +227,21 @@ class TraCISimulation(KernelSimulation): # TODO: add person & update kernel api
         2. It also uses the configuration files created by the network class to
            initialize a sumo instance.
         3. Finally, It initializes a traci connection to interface with sumo
-           from Python and returns the connection.
+           from Python and returns the connection. If `sim_params.use_libsumo`
+           is set, sumo is instead loaded in-process and the libsumo module,
+           which mirrors the traci connection API, is returned.
         """
+        use_libsumo = getattr(sim_params, "use_libsumo", False)
+        if use_libsumo:
+            if libsumo is None:
+                raise FatalFlowError(
+                    "use_libsumo is set, but libsumo could not be imported")
+            if sim_params.render:
+                raise FatalFlowError(
+                    "libsumo does not support rendering with sumo-gui")
+            _acquire_libsumo(self)
+        self.use_libsumo = use_libsumo
+
         # Save the simulation step size (for later use).
         self.sim_step = sim_params.sim_step
 
@@ -174,6 +249,10 @@ class TraCISimulation(KernelSimulation): # TODO: add person & update kernel api
         self.emission_path = sim_params.emission_path
         if self.emission_path is not None:
             ensure_dir(self.emission_path)
+        self.emission_fields = getattr(sim_params, "emission_fields", None)
+        self.emission_decimation = getattr(
+            sim_params, "emission_decimation", 1)
+        self.emission_format = getattr(sim_params, "emission_format", "npz")
 
         error = None
         for _ in range(RETRIES_ON_ERROR):
@@ -185,13 +264,16 @@ class TraCISimulation(KernelSimulation): # TODO: add person & update kernel api
                     else "sumo"
 
                 # command used to start sumo
-                sumo_call = [
-                    sumo_binary, "-c", network.cfg,
-                    "--remote-port", str(sim_params.port),
-                    "--num-clients", str(sim_params.num_clients),
+                sumo_call = [sumo_binary, "-c", network.cfg]
+                if not use_libsumo:
+                    sumo_call.extend([
+                        "--remote-port", str(sim_params.port),
+                        "--num-clients", str(sim_params.num_clients),
+                    ])
+                sumo_call.extend([
                     "--step-length", str(sim_params.sim_step),
                     "--device.taxi.dispatch-algorithm", str(sim_params.taxi_dispatch_alg)
-                ]
+                ])
                 
                 #TODO needed?
                 sumo_call.append('--persontrip.transfer.taxi-walk')
@@ -253,6 +335,15 @@ class TraCISimulation(KernelSimulation): # TODO: add person & update kernel api
 
                 # print(sumo_call)
 
+                if use_libsumo:
+                    # load sumo within this process; the kernels then call
+                    # into sumo directly instead of through a socket
+                    logging.info(" Starting SUMO in-process with libsumo")
+                    libsumo.start(sumo_call)
+                    libsumo.simulationStep()
+
+                    return libsumo
+
                 # Opening the I/O thread to SUMO
                 self.sumo_proc = subprocess.Popen(
                     sumo_call,
@@ -276,74 +367,64 @@ class TraCISimulation(KernelSimulation): # TODO: add person & update kernel api
                 print("Error during start: {}".format(traceback.format_exc()))
                 error = e
                 self.teardown_sumo()
+        if use_libsumo:
+            _release_libsumo(self)
         raise error
 
     def teardown_sumo(self):
         """Kill the sumo subprocess instance."""
+        if self.use_libsumo:
+            # sumo was loaded in-process with libsumo
+            try:
+                libsumo.close()
+            except Exception as e:
+                print("Error during teardown: {}".format(e))
+            return
+
+        if self.sumo_proc is None:
+            # the subprocess was never started
+            return
+
         try:
             os.killpg(self.sumo_proc.pid, signal.SIGTERM)
         except Exception as e:
             print("Error during teardown: {}".format(e))
 
+    def _emission_file(self, run_id):
+        return os.path.join(self.emission_path, "{}-{}_emission.{}".format(
+            self.master_kernel.network.network.name, run_id,
+            EXTENSIONS[self.emission_format]))
+
     def save_emission(self, run_id=0):
-        """Save any collected emission data to a csv file.
+        """Save any collected emission data to an emission file.
 
-        If not data was collected, nothing happens. Moreover, any internally
-        stored data by this class is clear whenever data is stored.
+        The data is recorded into a temporary file while the simulation runs,
+        which is closed and renamed after the rollout number. If no data was
+        collected, nothing happens. The recorder is reset whenever data is
+        stored. The file can be converted to a csv file with
+        ``flow.core.emission.emission_to_csv``.
 
         Parameters
         ----------
         run_id : int
             the rollout number, appended to the name of the emission file. Used
             to store emission files from multiple rollouts run sequentially.
-        """
-        # If there is no stored data, ignore this operation. This is to ensure
-        # that data isn't deleted if the operation is called twice.
-        if len(self.stored_data) == 0:
-            return
 
-        # Get a csv name for the emission file.
-        name = "{}-{}_emission.csv".format(
-            self.master_kernel.network.network.name, run_id)
-
-        # The name of all stored data-points (excluding id and time)
-        stored_ids = [
-            "x",
-            "y",
-            "speed",
-            "headway",
-            "leader_id",
-            "target_accel_with_noise_with_failsafe",
-            "target_accel_no_noise_no_failsafe",
-            "target_accel_with_noise_no_failsafe",
-            "target_accel_no_noise_with_failsafe",
-            "realized_accel",
-            "road_grade",
-            "edge_id",
-            "lane_number",
-            "distance",
-            "relative_position",
-            "follower_id",
-            "leader_rel_speed",
-        ]
-
-        # Update the stored data to push to the csv file.
-        final_data = {"time": [], "id": []}
-        final_data.update({key: [] for key in stored_ids})
-
-        for veh_id in self.stored_data.keys():
-            for t in self.stored_data[veh_id].keys():
-                final_data['time'].append(t)
-                final_data['id'].append(veh_id)
-                for key in stored_ids:
-                    final_data[key].append(self.stored_data[veh_id][t][key])
-
-        with open(os.path.join(self.emission_path, name), "w") as f:
-            print(os.path.join(self.emission_path, name), self.emission_path)
-            writer = csv.writer(f, delimiter=',')
-            writer.writerow(final_data.keys())
-            writer.writerows(zip(*final_data.values()))
-
-        # Clear all memory from the stored data. This is useful if this
-        # function is called in between resets.
-        self.stored_data.clear()
+        Returns
+        -------
+        str or None
+            path to the emission file, or None if no data was collected
+        """
+        # If there is no recorded data, ignore this operation. This is to
+        # ensure that data isn't deleted if the operation is called twice.
+        if self.emission_recorder is None:
+            return None
+
+        path = self.emission_recorder.close()
+        self.emission_recorder = None
+        if path is None:
+            return None
+
+        emission_file = self._emission_file(run_id)
+        os.replace(path, emission_file)
+        return emission_file
@@ -98,3 +98,18 @@ class KernelTrafficLight(object):
             Element = state of the traffic light at that node/lane
         """
         raise NotImplementedError
+
+    def get_phase(self, node_id):
+        """Return the index of the current phase of the traffic light.
+
+        Parameters
+        ----------
+        node_id: str
+            name of the node
+
+        Returns
+        -------
+        int
+            index of the current phase in the program of the traffic light
+        """
+        raise NotImplementedError
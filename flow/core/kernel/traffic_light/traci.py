@@ -46,7 +46,7 @@ class TraCITrafficLight(KernelTrafficLight): # TODO: update kernel api
         # subscribe the traffic light signal data
         for node_id in self.__ids:
             self.kernel_api.trafficlight.subscribe(
-                node_id, [tc.TL_RED_YELLOW_GREEN_STATE])
+                node_id, [tc.TL_RED_YELLOW_GREEN_STATE, tc.TL_CURRENT_PHASE])
 
     def update(self, reset):
         """See parent class."""
@@ -74,3 +74,7 @@ class TraCITrafficLight(KernelTrafficLight): # TODO: update kernel api
     def get_state(self, node_id):
         """See parent class."""
         return self.__tls[node_id][tc.TL_RED_YELLOW_GREEN_STATE]
+
+    def get_phase(self, node_id):
+        """See parent class."""
+        return self.__tls[node_id][tc.TL_CURRENT_PHASE]
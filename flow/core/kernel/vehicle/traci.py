@@ -43,6 +43,160 @@ TYPE_COLOR = [
     [LIGHT_BROWN, DEEP_BROWN]
 ]
 
+# variables subscribed for every vehicle in the network
+SUBSCRIBED_VARIABLES = [
+    tc.VAR_LANE_INDEX, tc.VAR_LANEPOSITION,
+    tc.VAR_ROAD_ID,
+    tc.VAR_SPEED,
+    tc.VAR_EDGES,
+    tc.VAR_POSITION,
+    tc.VAR_ANGLE,
+    tc.VAR_SPEED_WITHOUT_TRACI,
+    tc.VAR_FUELCONSUMPTION,
+    tc.VAR_DISTANCE
+]
+# maximum distance looked ahead by the leader subscription
+LEADER_LOOKAHEAD = 2000
+
+# setter commands whose effect lasts until they are called again, and that
+# are therefore redundant when called with the values last sent to sumo
+PERSISTENT_COMMANDS = ("setColor", "setSpeed", "setMaxSpeed", "setRoute")
+
+
+class TraCICommandBuffer(object):
+    """Per-step buffer of the setter commands sent to the vehicles in sumo.
+
+    When enabled, the commands are collected during a step and sent in one
+    pass by ``flush`` before the next simulation step. Only the last command
+    of each kind is kept for a vehicle, and persistent commands (see
+    PERSISTENT_COMMANDS) are dropped if they would not change the value last
+    sent for the vehicle. When disabled, commands are sent immediately.
+
+    Attributes
+    ----------
+    enabled : bool
+        whether commands are buffered
+    num_issued : int
+        number of commands sent to sumo
+    num_elided : int
+        number of commands dropped as redundant
+    """
+
+    def __init__(self, enabled):
+        """Instantiate the buffer.
+
+        Parameters
+        ----------
+        enabled : bool
+            whether commands are buffered, or sent immediately
+        """
+        self.enabled = enabled
+        self.num_issued = 0
+        self.num_elided = 0
+        # pending commands, keyed by (command, vehicle id)
+        self._pending = collections.OrderedDict()
+        # arguments of the persistent commands last sent to each vehicle
+        self._sent = {}
+
+    def add(self, kernel_api, command, veh_id, *args):
+        """Send a command to a vehicle, or buffer it until the next flush.
+
+        Parameters
+        ----------
+        kernel_api : traci.connection.Connection
+            TraCI connection the command is sent through
+        command : str
+            name of the method of ``kernel_api.vehicle`` to call
+        veh_id : str
+            vehicle identifier
+        args : tuple
+            remaining arguments of the command
+        """
+        if not self.enabled:
+            getattr(kernel_api.vehicle, command)(veh_id, *args)
+            self.num_issued += 1
+            return
+
+        key = (command, veh_id)
+        if key in self._pending:
+            self.num_elided += 1
+        self._pending[key] = args
+
+    def flush(self, kernel_api):
+        """Send all pending commands.
+
+        Errors raised by sumo for a command are printed, and the remaining
+        commands are still sent.
+
+        Parameters
+        ----------
+        kernel_api : traci.connection.Connection
+            TraCI connection the commands are sent through
+
+        Returns
+        -------
+        list of (str, str)
+            command and vehicle id of the commands that failed
+        """
+        failed = []
+        pending, self._pending = self._pending, collections.OrderedDict()
+        for (command, veh_id), args in pending.items():
+            persistent = command in PERSISTENT_COMMANDS
+            if persistent and self._sent.get(veh_id, {}).get(command) == args:
+                self.num_elided += 1
+                continue
+            try:
+                getattr(kernel_api.vehicle, command)(veh_id, *args)
+            except TraCIException as e:
+                print('Error when sending {} to vehicle {}: {}'.format(
+                    command, veh_id, e))
+                failed.append((command, veh_id))
+                continue
+            self.num_issued += 1
+            if persistent:
+                self._sent.setdefault(veh_id, {})[command] = args
+        return failed
+
+    def last_sent(self, veh_id, command):
+        """Return the arguments of the persistent command last sent to a vehicle.
+
+        Returns
+        -------
+        tuple or None
+            arguments of the command, or None if it was not sent since the
+            vehicle was added or the value was forgotten
+        """
+        return self._sent.get(veh_id, {}).get(command)
+
+    def invalidate(self, veh_id, command):
+        """Forget the value last sent by a persistent command of a vehicle.
+
+        This is used when sumo reports another value, so that the next command
+        is sent even if it has the arguments sent last.
+        """
+        self._sent.get(veh_id, {}).pop(command, None)
+
+    def cancel(self, veh_id, command):
+        """Drop a pending command of a vehicle and forget its last value.
+
+        This is used when the same quantity is set directly through TraCI,
+        so that the buffer neither overrides it nor elides later commands.
+        """
+        self._pending.pop((command, veh_id), None)
+        self._sent.get(veh_id, {}).pop(command, None)
+
+    def forget(self, veh_id):
+        """Drop the pending commands and the last values of a vehicle."""
+        self._sent.pop(veh_id, None)
+        for key in [key for key in self._pending if key[1] == veh_id]:
+            del self._pending[key]
+
+    def clear(self):
+        """Drop all pending commands and last values."""
+        self._pending.clear()
+        self._sent.clear()
+
+
 class TraCIVehicle(KernelVehicle):
     """Flow kernel for the TraCI API.
 
@@ -102,6 +256,17 @@ class TraCIVehicle(KernelVehicle):
         except AttributeError:
             self._force_color_update = False
 
+        # whether to collect the subscription results of all vehicles at once
+        self._bulk_subscriptions = getattr(
+            sim_params, "bulk_subscriptions", False)
+
+        # setter commands sent to the vehicles, optionally buffered per step
+        self._commands = TraCICommandBuffer(
+            getattr(sim_params, "buffer_commands", False))
+
+        # last color set for each vehicle
+        self._colors = {}
+
         # old speeds used to compute accelerations
         self.previous_speeds = {}
 
@@ -169,11 +334,14 @@ class TraCIVehicle(KernelVehicle):
 
         # copy over the previous speeds
 
-        vehicle_obs = {}
-        for veh_id in self.__ids:
-            self.previous_speeds[veh_id] = self.get_speed(veh_id)
-            vehicle_obs[veh_id] = \
-                self.kernel_api.vehicle.getSubscriptionResults(veh_id)
+        if self._bulk_subscriptions:
+            vehicle_obs = self._get_all_subscription_results()
+        else:
+            vehicle_obs = {}
+            for veh_id in self.__ids:
+                self.previous_speeds[veh_id] = self.get_speed(veh_id)
+                vehicle_obs[veh_id] = \
+                    self.kernel_api.vehicle.getSubscriptionResults(veh_id)
         sim_obs = self.kernel_api.simulation.getSubscriptionResults()
 
         arrived_rl_ids = []
@@ -273,8 +441,9 @@ class TraCIVehicle(KernelVehicle):
             except TypeError:
                 print(traceback.format_exc())
             headway = vehicle_obs.get(veh_id, {}).get(tc.VAR_LEADER, None)
-            # check for a collided vehicle or a vehicle with no leader
-            if headway is None:
+            # check for a collided vehicle or a vehicle with no leader (libsumo
+            # reports a missing leader as an empty id instead of None)
+            if headway is None or not headway[0]:
                 self.__vehicles[veh_id]["leader"] = None
                 self.__vehicles[veh_id]["follower"] = None
                 self.__vehicles[veh_id]["headway"] = 1e+3
@@ -303,6 +472,28 @@ class TraCIVehicle(KernelVehicle):
 
         return crash
 
+    def _get_all_subscription_results(self):
+        """Collect the subscription results of all vehicles in one call.
+
+        This is used in place of one ``getSubscriptionResults`` call per
+        vehicle when ``bulk_subscriptions`` is set in SumoParams. The previous
+        speeds of the vehicles are updated as well.
+
+        Returns
+        -------
+        dict < str, dict >
+            subscription results for every vehicle in the vehicles class. An
+            empty dict is returned for vehicles with no available data.
+        """
+        all_obs = self.kernel_api.vehicle.getAllSubscriptionResults()
+        sumo_obs = self.__sumo_obs
+
+        self.previous_speeds.update(
+            (veh_id, sumo_obs.get(veh_id, {}).get(tc.VAR_SPEED, -1001))
+            for veh_id in self.__ids)
+
+        return {veh_id: all_obs.get(veh_id, {}) for veh_id in self.__ids}
+
     def _add_departed(self, veh_id, veh_type):
         """Add a vehicle that entered the network from an inflow or reset.
 
@@ -368,18 +559,14 @@ class TraCIVehicle(KernelVehicle):
                     self.__controlled_lc_ids.append(veh_id)
 
         # subscribe the new vehicle
-        self.kernel_api.vehicle.subscribe(veh_id, [
-            tc.VAR_LANE_INDEX, tc.VAR_LANEPOSITION,
-            tc.VAR_ROAD_ID,
-            tc.VAR_SPEED,
-            tc.VAR_EDGES,
-            tc.VAR_POSITION,
-            tc.VAR_ANGLE,
-            tc.VAR_SPEED_WITHOUT_TRACI,
-            tc.VAR_FUELCONSUMPTION,
-            tc.VAR_DISTANCE
-        ])
-        self.kernel_api.vehicle.subscribeLeader(veh_id, 2000)
+        if self._bulk_subscriptions:
+            # the leader is subscribed within the same command
+            self.kernel_api.vehicle.subscribe(
+                veh_id, SUBSCRIBED_VARIABLES + [tc.VAR_LEADER],
+                parameters={tc.VAR_LEADER: ("d", LEADER_LOOKAHEAD)})
+        else:
+            self.kernel_api.vehicle.subscribe(veh_id, SUBSCRIBED_VARIABLES)
+            self.kernel_api.vehicle.subscribeLeader(veh_id, LEADER_LOOKAHEAD)
 
         # some constant vehicle parameters to the vehicles class
         self.__vehicles[veh_id]["length"] = self.kernel_api.vehicle.getLength(
@@ -402,19 +589,6 @@ class TraCIVehicle(KernelVehicle):
             "lane_change_params"].lane_change_mode
         self.kernel_api.vehicle.setLaneChangeMode(veh_id, lc_mode)
 
-        # get initial state info
-        self.__sumo_obs[veh_id] = dict()
-        self.__sumo_obs[veh_id][tc.VAR_ROAD_ID] = \
-            self.kernel_api.vehicle.getRoadID(veh_id)
-        self.__sumo_obs[veh_id][tc.VAR_LANEPOSITION] = \
-            self.kernel_api.vehicle.getLanePosition(veh_id)
-        self.__sumo_obs[veh_id][tc.VAR_LANE_INDEX] = \
-            self.kernel_api.vehicle.getLaneIndex(veh_id)
-        self.__sumo_obs[veh_id][tc.VAR_SPEED] = \
-            self.kernel_api.vehicle.getSpeed(veh_id)
-        self.__sumo_obs[veh_id][tc.VAR_FUELCONSUMPTION] = \
-            self.kernel_api.vehicle.getFuelConsumption(veh_id)
-
         # make sure that the order of rl_ids is kept sorted
         self.__rl_ids.sort()
         self.num_rl_vehicles = len(self.__rl_ids)
@@ -422,6 +596,23 @@ class TraCIVehicle(KernelVehicle):
         # get the subscription results from the new vehicle
         new_obs = self.kernel_api.vehicle.getSubscriptionResults(veh_id)
 
+        # get initial state info
+        if self._bulk_subscriptions:
+            # the subscription already returned the current state
+            self.__sumo_obs[veh_id] = dict(new_obs or {})
+        else:
+            self.__sumo_obs[veh_id] = dict()
+            self.__sumo_obs[veh_id][tc.VAR_ROAD_ID] = \
+                self.kernel_api.vehicle.getRoadID(veh_id)
+            self.__sumo_obs[veh_id][tc.VAR_LANEPOSITION] = \
+                self.kernel_api.vehicle.getLanePosition(veh_id)
+            self.__sumo_obs[veh_id][tc.VAR_LANE_INDEX] = \
+                self.kernel_api.vehicle.getLaneIndex(veh_id)
+            self.__sumo_obs[veh_id][tc.VAR_SPEED] = \
+                self.kernel_api.vehicle.getSpeed(veh_id)
+            self.__sumo_obs[veh_id][tc.VAR_FUELCONSUMPTION] = \
+                self.kernel_api.vehicle.getFuelConsumption(veh_id)
+
         return new_obs
 
     def reset(self):
@@ -431,7 +622,8 @@ class TraCIVehicle(KernelVehicle):
         self.pickup_stop = {}
         self.mid_edges = {}
         self.dropoff_stop = {}
-
+        self._commands.clear()
+        self._colors.clear()
 
     def remove(self, veh_id):
         """See parent class."""
@@ -443,6 +635,9 @@ class TraCIVehicle(KernelVehicle):
         if veh_id in self.__ids:
             self.__ids.remove(veh_id)
 
+        self._commands.forget(veh_id)
+        self._colors.pop(veh_id, None)
+
         # remove from the vehicles kernel
         if veh_id in self.__vehicles:
             del self.__vehicles[veh_id]
@@ -1016,9 +1211,11 @@ class TraCIVehicle(KernelVehicle):
                 this_vel = self.get_speed(vid)
                 next_vel = max([this_vel + acc[i] * self.sim_step, 0])
                 if smooth:
-                    self.kernel_api.vehicle.slowDown(vid, next_vel, 1e-3)
+                    self._commands.add(
+                        self.kernel_api, "slowDown", vid, next_vel, 1e-3)
                 else:
-                    self.kernel_api.vehicle.setSpeed(vid, next_vel)
+                    self._commands.add(
+                        self.kernel_api, "setSpeed", vid, next_vel)
 
     def apply_lane_change(self, veh_ids, direction):
         """See parent class."""
@@ -1047,8 +1244,8 @@ class TraCIVehicle(KernelVehicle):
 
             # perform the requested lane action action in TraCI
             if target_lane != this_lane:
-                self.kernel_api.vehicle.changeLane(
-                    veh_id, int(target_lane), self.sim_step)
+                self._commands.add(self.kernel_api, "changeLane", veh_id,
+                                   int(target_lane), self.sim_step)
 
                 if veh_id in self.get_rl_ids():
                     self.prev_last_lc[veh_id] = \
@@ -1063,8 +1260,39 @@ class TraCIVehicle(KernelVehicle):
 
         for i, veh_id in enumerate(veh_ids):
             if route_choices[i] is not None:
-                self.kernel_api.vehicle.setRoute(
-                    vehID=veh_id, edgeList=route_choices[i])
+                # the route is redundant if it was the last one sent, unless
+                # sumo has changed it since, e.g. when rerouting the vehicle
+                sent = self._commands.last_sent(veh_id, "setRoute")
+                if sent is not None and \
+                        list(sent[0]) != list(self.get_route(veh_id)):
+                    self._commands.invalidate(veh_id, "setRoute")
+                self._commands.add(
+                    self.kernel_api, "setRoute", veh_id,
+                    list(route_choices[i]))
+
+    def flush_commands(self):
+        """Send the setter commands buffered during the current step.
+
+        This is called by the simulation kernel before every simulation step,
+        and has no effect unless ``buffer_commands`` is set in SumoParams.
+        """
+        if self._commands.enabled:
+            for command, veh_id in self._commands.flush(self.kernel_api):
+                if command == "setColor":
+                    # the color was not set, so that it is sent again
+                    self._colors.pop(veh_id, None)
+
+    def get_command_counts(self):
+        """Return the number of setter commands issued and elided.
+
+        Returns
+        -------
+        int
+            number of setter commands sent to sumo
+        int
+            number of setter commands dropped as redundant
+        """
+        return self._commands.num_issued, self._commands.num_elided
 
     def get_x_by_id(self, veh_id):
         """See parent class."""
@@ -1080,77 +1308,57 @@ class TraCIVehicle(KernelVehicle):
         """See parent class.
 
         The colors of all vehicles are updated as follows:
-        - red: autonomous (rl) vehicles
+        - red: autonomous (rl) vehicles, and vehicles with "av" in their id
         - white: unobserved human-driven vehicles
         - cyan: observed human-driven vehicles
+        - green: free taxis, and the colors of their type in TYPE_COLOR for
+          taxis that are picking up or serving a reservation
+        - from red to green as the speed increases, if ``color_by_speed`` is
+          set, in which case this overrides the colors above
+
+        Vehicles whose type was given a color in vehicles.add() are not
+        re-colored, unless ``force_color_update`` is set. The last color set
+        for each vehicle is cached, and sumo is only called for the vehicles
+        whose color changed.
         """
-        for veh_id in self.get_rl_ids():
-            try:
-                # If vehicle is already being colored via argument to vehicles.add(), don't re-color it.
-                if self._force_color_update or 'color' not in \
-                        self.type_parameters[self.get_type(veh_id)]:
-                    # color rl vehicles red
-                    self.set_color(veh_id=veh_id, color=RED)
-            except (FatalTraCIError, TraCIException) as e:
-                print('Error when updating rl vehicle colors:', e)
-
-        # color vehicles white if not observed and cyan if observed
-        for veh_id in self.get_human_ids():
-            try:
-                color = CYAN if veh_id in self.get_observed_ids() else WHITE
-                # If vehicle is already being colored via argument to vehicles.add(), don't re-color it.
-                if self._force_color_update or 'color' not in \
-                        self.type_parameters[self.get_type(veh_id)]:
-                    self.set_color(veh_id=veh_id, color=color)
-            except (FatalTraCIError, TraCIException) as e:
-                print('Error when updating human vehicle colors:', e)
+        veh_ids = [veh_id for veh_id in self.get_ids()
+                   if self._force_color_update or 'color' not in
+                   self.type_parameters[self.get_type(veh_id)]]
 
-        for veh_id in self.get_ids():
-            try:
-                if 'av' in veh_id:
-                    color = RED
-                    # If vehicle is already being colored via argument to vehicles.add(), don't re-color it.
-                    if self._force_color_update or 'color' not in \
-                            self.type_parameters[self.get_type(veh_id)]:
-                        self.set_color(veh_id=veh_id, color=color)
-            except (FatalTraCIError, TraCIException) as e:
-                print('Error when updating human vehicle colors:', e)
-
-        free, pickup, service = self.get_taxi_fleet(0), self.get_taxi_fleet(1), self.get_taxi_fleet(2)
-        for veh_id in self.get_ids():
-            try:
-                if 'taxi' in veh_id:
-                    if veh_id in free:
-                        color = GREEN
-                    else:
-                        color = TYPE_COLOR[self.__types[veh_id]][int(veh_id not in pickup)]
-                        # if veh_id in pickup:
-                        #     color = YELLOW if self.__types[veh_id] == 0 else CYAN
-                        # else:
-                        #     color = ORANGE if self.__types[veh_id] == 0 else CYANP
-                    # color = (GREEN if veh_id in free else ORANGE) if veh_id not in pickup else YELLOW
-                    # If vehicle is already being colored via argument to vehicles.add(), don't re-color it.
-                    if self._force_color_update or 'color' not in \
-                            self.type_parameters[self.get_type(veh_id)]:
-                        self.set_color(veh_id=veh_id, color=color)
-            except (FatalTraCIError, TraCIException) as e:
-                print('Error when updating human vehicle colors:', e)
-
-        # color vehicles by speed if desired
         if self._color_by_speed:
+            # bin the speeds of all vehicles at once
             max_speed = self.master_kernel.network.max_speed()
             speed_ranges = np.linspace(0, max_speed, STEPS)
-            for veh_id in self.get_ids():
-                veh_speed = self.get_speed(veh_id)
-                bin_index = np.digitize(veh_speed, speed_ranges)
-                # If vehicle is already being colored via argument to vehicles.add(), don't re-color it.
-                if self._force_color_update or 'color' not in \
-                        self.type_parameters[self.get_type(veh_id)]:
-                    self.set_color(veh_id=veh_id, color=color_bins[bin_index])
+            bins = np.digitize(self.get_speed(veh_ids), speed_ranges)
+            colors = [color_bins[i] for i in bins]
+        else:
+            rl_ids = set(self.get_rl_ids())
+            observed_ids = set(self.get_observed_ids())
+            colors = []
+            for veh_id in veh_ids:
+                if 'taxi' in veh_id:
+                    if veh_id in self.__free_taxis:
+                        color = GREEN
+                    else:
+                        color = TYPE_COLOR[self.__types[veh_id]][
+                            int(veh_id not in self.__pickup_taxis)]
+                elif 'av' in veh_id or veh_id in rl_ids:
+                    color = RED
+                elif veh_id in observed_ids:
+                    color = CYAN
+                else:
+                    color = WHITE
+                colors.append(color)
+
+        for veh_id, color in zip(veh_ids, colors):
+            if self._colors.get(veh_id) != tuple(color):
+                try:
+                    self.set_color(veh_id=veh_id, color=color)
+                except (FatalTraCIError, TraCIException) as e:
+                    print('Error when updating vehicle colors:', e)
 
         # clear the list of observed vehicles
-        for veh_id in self.get_observed_ids():
-            self.remove_observed(veh_id)
+        del self.__observed_ids[:]
 
     def get_color(self, veh_id):
         """See parent class.
@@ -1166,8 +1374,11 @@ class TraCIVehicle(KernelVehicle):
         The last term for sumo (transparency) is set to 255.
         """
         r, g, b = color
-        self.kernel_api.vehicle.setColor(
-            vehID=veh_id, color=(r, g, b, 255))
+        self._commands.add(
+            self.kernel_api, "setColor", veh_id, (r, g, b, 255))
+        # when buffered, this is forgotten by flush_commands if sumo fails to
+        # set the color
+        self._colors[veh_id] = (r, g, b)
 
     def add(self, veh_id, type_id, edge, pos, lane, speed):
         """See parent class."""
@@ -1206,7 +1417,7 @@ class TraCIVehicle(KernelVehicle):
 
     def set_max_speed(self, veh_id, max_speed):
         """See parent class."""
-        self.kernel_api.vehicle.setMaxSpeed(veh_id, max_speed)
+        self._commands.add(self.kernel_api, "setMaxSpeed", veh_id, max_speed)
 
     def get_accel(self, veh_id, noise=True, failsafe=True):
         """See parent class."""
@@ -1270,8 +1481,10 @@ class TraCIVehicle(KernelVehicle):
             self.kernel_api.vehicle.replaceStop(veh_id, 0, stops[0].lane[:-2], stops[0].endPos, 0, 0)
 
         from_edge = reservation.fromEdge
-        route = self.kernel_api.simulation.findRoute(cur_edge, from_edge)
-        self.kernel_api.vehicle.setRoute(veh_id, route.edges)
+        route = self.master_kernel.network.route_oracle.find_route(
+            cur_edge, from_edge)
+        self._commands.cancel(veh_id, "setRoute")
+        self.kernel_api.vehicle.setRoute(veh_id, route)
         # self.kernel_api.vehicle.dispatchTaxi(veh_id, [reservation.id])
         self.reservation[veh_id] = reservation
         self.pickup_stop[veh_id] = [ reservation.fromEdge, reservation.departPos ]
@@ -1288,10 +1501,13 @@ class TraCIVehicle(KernelVehicle):
         cur_edge = self.kernel_api.vehicle.getRoadID(veh_id)
         to_edge = self.reservation[veh_id].toEdge if len(self.mid_edges[veh_id]) == 0 \
             else self.mid_edges[veh_id][0]
-        route = self.kernel_api.simulation.findRoute(cur_edge, to_edge)
-        self.kernel_api.vehicle.setRoute(veh_id, route.edges)
+        route = self.master_kernel.network.route_oracle.find_route(
+            cur_edge, to_edge)
+        self._commands.cancel(veh_id, "setRoute")
+        self.kernel_api.vehicle.setRoute(veh_id, route)
         self.__pickup_taxis.remove(veh_id)
         self.__occupied_taxis.add(veh_id)
+        self._commands.cancel(veh_id, "setSpeed")
         self.kernel_api.vehicle.setSpeed(veh_id, -1)
     
     def checkpoint(self, veh_id):
@@ -1300,8 +1516,11 @@ class TraCIVehicle(KernelVehicle):
         self.mid_edges[veh_id].pop(0)
         to_edge = self.reservation[veh_id].toEdge if len(self.mid_edges[veh_id]) == 0 \
             else self.mid_edges[veh_id][0]
-        route = self.kernel_api.simulation.findRoute(cur_edge, to_edge)
-        self.kernel_api.vehicle.setRoute(veh_id, route.edges)
+        route = self.master_kernel.network.route_oracle.find_route(
+            cur_edge, to_edge)
+        self._commands.cancel(veh_id, "setRoute")
+        self.kernel_api.vehicle.setRoute(veh_id, route)
+        self._commands.cancel(veh_id, "setSpeed")
         self.kernel_api.vehicle.setSpeed(veh_id, -1)
 
     def move2xy(self, veh_id, x, y, edge='', lane='0', keepRoute=0):
@@ -1310,6 +1529,7 @@ class TraCIVehicle(KernelVehicle):
     def dropoff(self, veh_id, is_outside=False):
         self.__occupied_taxis.remove(veh_id)
         self.__free_taxis.add(veh_id)
+        self._commands.cancel(veh_id, "setSpeed")
         self.kernel_api.vehicle.setSpeed(veh_id, -1)
 
         if not is_outside:
@@ -1332,10 +1552,14 @@ class TraCIVehicle(KernelVehicle):
     def reposition_taxi(self, veh_id, position_x, position_y):
         try:
             edge_id, pos, lane = self.kernel_api.simulation.convertRoad(position_x, position_y)
-            if edge_id.startswith(':') or edge_id == self.kernel_api.vehicle.getRoadID(veh_id):
+            cur_edge = self.kernel_api.vehicle.getRoadID(veh_id)
+            if edge_id.startswith(':') or edge_id == cur_edge:
                 return
+            route = self.master_kernel.network.route_oracle.find_route(
+                cur_edge, edge_id)
             self.kernel_api.vehicle.resume(veh_id)
-            self.kernel_api.vehicle.changeTarget(veh_id, edge_id)
+            self._commands.cancel(veh_id, "setRoute")
+            self.kernel_api.vehicle.setRoute(veh_id, route)
             self.kernel_api.vehicle.setStop(veh_id, edge_id, pos, 0)
         #TODO: for debug
         except TraCIException as e:
@@ -1343,8 +1567,12 @@ class TraCIVehicle(KernelVehicle):
             print(self.kernel_api.vehicle.getLaneID(veh_id), edge_id)
 
     def reposition_taxi_by_road(self, veh_id, edge_id):
-        if edge_id == self.kernel_api.vehicle.getRoadID(veh_id) or 'flow' in edge_id:
+        cur_edge = self.kernel_api.vehicle.getRoadID(veh_id)
+        if edge_id == cur_edge or 'flow' in edge_id:
             return
+        route = self.master_kernel.network.route_oracle.find_route(
+            cur_edge, edge_id)
         self.kernel_api.vehicle.resume(veh_id)
-        self.kernel_api.vehicle.changeTarget(veh_id, edge_id)
+        self._commands.cancel(veh_id, "setRoute")
+        self.kernel_api.vehicle.setRoute(veh_id, route)
         self.kernel_api.vehicle.setStop(veh_id, edge_id, 25, 0, 600)
@@ -622,6 +622,53 @@ class SumoParams(SimParams):
         current time step
     use_ballistic: bool, optional
         If true, use a ballistic integration step instead of an euler step
+    bulk_subscriptions : bool, optional
+        If true, the vehicle kernel collects the subscription results of all
+        vehicles with a single call every step, and subscribes to the leader
+        of new vehicles within their variable subscription. This reduces the
+        per-step overhead in networks with many vehicles, and requires
+        sumo >= 1.7
+    use_libsumo : bool, optional
+        If true, sumo is loaded in-process with libsumo instead of being
+        started as a subprocess that is connected to over a TraCI socket. This
+        removes the IPC overhead of every kernel call and the need for a port,
+        but only one simulation may run per process, and sumo-gui rendering
+        is not supported
+    snapshot_reset : bool, optional
+        If true, the state of the simulation is saved once after sumo is
+        first started during a reset, and later resets restore this snapshot
+        in-process instead of restarting sumo and regenerating the network.
+        Note that sumo's random number generators are not rewound, so the
+        rollouts that follow are not bit-identical to those of a restarted
+        instance. Has no effect when rendering
+    net_cache_dir : str, optional
+        directory in which the .net.xml files generated by netconvert are
+        cached. Networks with identical nodes, edges, types, and connections
+        reuse the cached file (by hard-linking it) instead of calling
+        netconvert again, including across processes that share the
+        directory. Defaults to the FLOW_NET_CACHE_DIR environment variable; no
+        cache is used if neither is set
+    emission_fields : list of str, optional
+        names of the fields recorded in the emission files, among the keys of
+        flow.core.emission.EMISSION_FIELDS. All of them are recorded by
+        default
+    emission_decimation : int, optional
+        the emission data is recorded once every emission_decimation
+        simulation steps, defaults to every step
+    emission_format : str, optional
+        format of the emission files, either "npz" (compressed numpy
+        archive) or "parquet", which requires pyarrow. The files can be
+        converted to csv with flow.core.emission.emission_to_csv
+    buffer_commands : bool, optional
+        If true, the setter commands sent to the vehicles (accelerations,
+        lane changes, routes, colors and maximum speeds) are buffered during
+        a step and sent in one pass before the next simulation step. Only the
+        last command of each kind is sent per vehicle, and colors and speeds
+        that are unchanged since they were last sent are not sent again. The
+        number of commands issued and elided is available through
+        ``get_command_counts`` in the vehicle kernel. Note that the new
+        colors only appear in sumo-gui after the next simulation step, and
+        that speeds set directly through TraCI are not tracked
     """
 
     def __init__(self,
@@ -643,7 +690,15 @@ class SumoParams(SimParams):
                  teleport_time=-1,
                  num_clients=1,
                  color_by_speed=False,
-                 use_ballistic=False):
+                 use_ballistic=False,
+                 bulk_subscriptions=False,
+                 use_libsumo=False,
+                 snapshot_reset=False,
+                 net_cache_dir=None,
+                 emission_fields=None,
+                 emission_decimation=1,
+                 emission_format="npz",
+                 buffer_commands=False):
         """Instantiate SumoParams."""
         super(SumoParams, self).__init__(
             sim_step, render, restart_instance, emission_path, save_render,
@@ -658,6 +713,14 @@ class SumoParams(SimParams):
         self.num_clients = num_clients
         self.color_by_speed = color_by_speed
         self.use_ballistic = use_ballistic
+        self.bulk_subscriptions = bulk_subscriptions
+        self.use_libsumo = use_libsumo
+        self.snapshot_reset = snapshot_reset
+        self.net_cache_dir = net_cache_dir
+        self.emission_fields = emission_fields
+        self.emission_decimation = emission_decimation
+        self.emission_format = emission_format
+        self.buffer_commands = buffer_commands
 
 
 class EnvParams:
@@ -2,9 +2,16 @@
 
 import csv
 import errno
+import fcntl
 import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+import sumolib
 from lxml import etree
-from xml.etree import ElementTree
+
+from flow.utils.exceptions import FatalFlowError
 
 
 def makexml(name, nsl):
@@ -32,13 +39,112 @@ def ensure_dir(path):
     return path
 
 
-def emission_to_csv(emission_path, output_path=None):
+@contextmanager
+def file_lock(path):
+    """Hold an exclusive lock on a file, shared by all processes.
+
+    Blocks until the lock is acquired. The file is created if needed.
+
+    Parameters
+    ----------
+    path : str
+        path to the lock file
+    """
+    with open(path, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def reserve_port(lease_time=60., registry_path=None):
+    """Return a free port, which is not handed to other processes for a while.
+
+    A port found free by binding a socket to it may be handed to several
+    processes that start sumo concurrently, before any of them binds it. The
+    ports handed out are thus recorded in a registry, which is updated under
+    a lock and shared by all processes.
+
+    Parameters
+    ----------
+    lease_time : float
+        time (in seconds) for which the port is not handed out again, which
+        should be longer than the time sumo takes to bind it
+    registry_path : str, optional
+        path to the registry, defaults to a file in the temporary directory
+
+    Returns
+    -------
+    int
+        the reserved port
+
+    Raises
+    ------
+    flow.utils.exceptions.FatalFlowError
+        if no free port could be found
+    """
+    if registry_path is None:
+        registry_path = os.path.join(tempfile.gettempdir(), 'flow_ports')
+
+    with file_lock(registry_path + '.lock'):
+        now = time.time()
+        leases = {}
+        if os.path.exists(registry_path):
+            with open(registry_path) as f:
+                for line in f:
+                    port, lease_start = line.split()
+                    if now - float(lease_start) < lease_time:
+                        leases[int(port)] = lease_start
+
+        for _ in range(100):
+            port = sumolib.miscutils.getFreeSocketPort()
+            if port is not None and port not in leases:
+                break
+        else:
+            raise FatalFlowError('No free port could be reserved.')
+
+        leases[port] = repr(now)
+        with open(registry_path, 'w') as f:
+            f.writelines('{} {}\n'.format(*lease) for lease in leases.items())
+    return port
+
+
+# columns of the csv files converted from the sumo emission files, with the
+# attribute of the vehicle elements they are read from
+EMISSION_COLUMNS = [
+    ('CO', 'CO', float),
+    ('y', 'y', float),
+    ('CO2', 'CO2', float),
+    ('electricity', 'electricity', float),
+    ('type', 'type', str),
+    ('id', 'id', str),
+    ('eclass', 'eclass', str),
+    ('waiting', 'waiting', float),
+    ('NOx', 'NOx', float),
+    ('fuel', 'fuel', float),
+    ('HC', 'HC', float),
+    ('x', 'x', float),
+    ('route', 'route', str),
+    ('relative_position', 'pos', float),
+    ('noise', 'noise', float),
+    ('angle', 'angle', float),
+    ('PMx', 'PMx', float),
+    ('speed', 'speed', float),
+]
+
+
+def emission_to_csv(emission_path, output_path=None, chunk_size=10000):
     """Convert an emission file generated by sumo into a csv file.
 
     Note that the emission file contains information generated by sumo, not
     flow. This means that some data, such as absolute position, is not
     immediately available from the emission file, but can be recreated.
 
+    The file is parsed incrementally, and the rows are written in chunks, so
+    that the memory used does not depend on the size of the file. The rows
+    are thus written in the order of the emission file, i.e. sorted by time.
+
     Parameters
     ----------
     emission_path : str
@@ -46,54 +152,53 @@ def emission_to_csv(emission_path, output_path=None):
     output_path : str
         path to the csv file that will be generated, default is the same
         directory as the emission file, with the same name
-    """
-    parser = etree.XMLParser(recover=True)
-    tree = ElementTree.parse(emission_path, parser=parser)
-    root = tree.getroot()
-
-    # parse the xml data into a dict
-    out_data = []
-    for time in root.findall('timestep'):
-        t = float(time.attrib['time'])
-
-        for car in time:
-            out_data.append(dict())
-            try:
-                out_data[-1]['time'] = t
-                out_data[-1]['CO'] = float(car.attrib['CO'])
-                out_data[-1]['y'] = float(car.attrib['y'])
-                out_data[-1]['CO2'] = float(car.attrib['CO2'])
-                out_data[-1]['electricity'] = float(car.attrib['electricity'])
-                out_data[-1]['type'] = car.attrib['type']
-                out_data[-1]['id'] = car.attrib['id']
-                out_data[-1]['eclass'] = car.attrib['eclass']
-                out_data[-1]['waiting'] = float(car.attrib['waiting'])
-                out_data[-1]['NOx'] = float(car.attrib['NOx'])
-                out_data[-1]['fuel'] = float(car.attrib['fuel'])
-                out_data[-1]['HC'] = float(car.attrib['HC'])
-                out_data[-1]['x'] = float(car.attrib['x'])
-                out_data[-1]['route'] = car.attrib['route']
-                out_data[-1]['relative_position'] = float(car.attrib['pos'])
-                out_data[-1]['noise'] = float(car.attrib['noise'])
-                out_data[-1]['angle'] = float(car.attrib['angle'])
-                out_data[-1]['PMx'] = float(car.attrib['PMx'])
-                out_data[-1]['speed'] = float(car.attrib['speed'])
-                out_data[-1]['edge_id'] = car.attrib['lane'].rpartition('_')[0]
-                out_data[-1]['lane_number'] = car.attrib['lane'].\
-                    rpartition('_')[-1]
-            except KeyError:
-                del out_data[-1]
-
-    # sort the elements of the dictionary by the vehicle id
-    out_data = sorted(out_data, key=lambda k: k['id'])
+    chunk_size : int, optional
+        number of rows held in memory before being written to the csv file
 
+    Returns
+    -------
+    str
+        path to the csv file
+    """
     # default output path
     if output_path is None:
         output_path = emission_path[:-3] + 'csv'
 
-    # output the dict data into a csv file
-    keys = out_data[0].keys()
+    header = ['time'] + [name for name, _, _ in EMISSION_COLUMNS] + \
+        ['edge_id', 'lane_number']
+
     with open(output_path, 'w') as output_file:
-        dict_writer = csv.DictWriter(output_file, keys)
-        dict_writer.writeheader()
-        dict_writer.writerows(out_data)
+        writer = csv.writer(output_file)
+        writer.writerow(header)
+
+        rows = []
+        for _, timestep in etree.iterparse(
+                emission_path, events=('end',), tag='timestep',
+                recover=True, huge_tree=True):
+            t = float(timestep.attrib['time'])
+
+            for car in timestep:
+                attrib = car.attrib
+                try:
+                    row = [t]
+                    row.extend(cast(attrib[key])
+                               for _, key, cast in EMISSION_COLUMNS)
+                    edge, _, lane = attrib['lane'].rpartition('_')
+                except KeyError:
+                    continue
+                row.append(edge)
+                row.append(lane)
+                rows.append(row)
+
+            # free the parsed elements, including the ones already processed
+            timestep.clear()
+            while timestep.getprevious() is not None:
+                del timestep.getparent()[0]
+
+            if len(rows) >= chunk_size:
+                writer.writerows(rows)
+                rows = []
+
+        writer.writerows(rows)
+
+    return output_path
@@ -19,10 +19,8 @@ from gym.spaces import Tuple
 from traci.exceptions import FatalTraCIError
 from traci.exceptions import TraCIException
 
-import sumolib
-
-
-from flow.core.util import ensure_dir
+from flow.controllers.batch import get_actions
+from flow.core.util import ensure_dir, reserve_port
 from flow.core.kernel import Kernel
 from flow.utils.exceptions import FatalFlowError
 
@@ -139,8 +137,10 @@ class Env(gym.Env, metaclass=ABCMeta):
             # 1.0 works with stress_test_start 10k times
             time.sleep(1.0 * int(time_stamp[-6:]) / 1e6)
         # FIXME: this is sumo-specific
-        if self.sim_params.port is None:
-            self.sim_params.port = sumolib.miscutils.getFreeSocketPort()
+        # (libsumo runs sumo in-process, so it does not need a port)
+        if self.sim_params.port is None and \
+                not getattr(self.sim_params, "use_libsumo", False):
+            self.sim_params.port = reserve_port()
         # time_counter: number of steps taken since the start of a rollout
         self.time_counter = 0
         # step_counter: number of total steps taken
@@ -242,9 +242,33 @@ class Env(gym.Env, metaclass=ABCMeta):
         atexit.register(self.terminate)
     
     def restart_simulation_v2(self, sim_params):
+        """Restart the simulation at the start of a new rollout.
+
+        If ``sim_params.snapshot_reset`` is set, the state of the simulation
+        is saved after sumo is started, and subsequent calls restore this
+        snapshot instead of restarting sumo and regenerating the network.
+
+        Parameters
+        ----------
+        sim_params : flow.core.params.SimParams
+            simulation-specific parameters
+        """
         # print('restart simu v2')
+        if self.simulator == 'traci' and \
+                self.k.simulation.snapshot is not None:
+            # the emission data is otherwise saved when closing the kernel
+            if self.k.simulation.emission_path is not None:
+                self.k.simulation.save_emission()
+            self.k.simulation.load_snapshot()
+            self.k.vehicle.initialize(deepcopy(self.network.vehicles))
+            self.k.person.initialize(deepcopy(self.network.persons))
+            self.k.pass_api(self.k.kernel_api)
+            self.setup_initial_state()
+            return
+
         self.k.close()
-        if self.simulator == 'traci':
+        if self.simulator == 'traci' and \
+                self.k.simulation.sumo_proc is not None:
             self.k.simulation.sumo_proc.kill()
         if sim_params.emission_path is not None:
             ensure_dir(sim_params.emission_path)
@@ -256,6 +280,9 @@ class Env(gym.Env, metaclass=ABCMeta):
         kernel_api = self.k.simulation.start_simulation(
             network=self.k.network, sim_params=self.sim_params)
         self.k.pass_api(kernel_api)
+        if self.simulator == 'traci' and \
+                getattr(self.sim_params, "snapshot_reset", False):
+            self.k.simulation.save_snapshot()
         self.setup_initial_state()
 
 
@@ -279,7 +306,8 @@ class Env(gym.Env, metaclass=ABCMeta):
         self.k.close()
 
         # killed the sumo process if using sumo/TraCI
-        if self.simulator == 'traci':
+        if self.simulator == 'traci' and \
+                self.k.simulation.sumo_proc is not None:
             self.k.simulation.sumo_proc.kill()
 
         if render is not None:
@@ -362,11 +390,7 @@ class Env(gym.Env, metaclass=ABCMeta):
 
             # perform acceleration actions for controlled human-driven vehicles
             if len(self.k.vehicle.get_controlled_ids()) > 0:
-                accel = []
-                for veh_id in self.k.vehicle.get_controlled_ids():
-                    action = self.k.vehicle.get_acc_controller(
-                        veh_id).get_action(self)
-                    accel.append(action)
+                accel = get_actions(self, self.k.vehicle.get_controlled_ids())
                 self.k.vehicle.apply_acceleration(
                     self.k.vehicle.get_controlled_ids(), accel)
 
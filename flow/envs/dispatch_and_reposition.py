@@ -19,12 +19,12 @@ from gym.spaces.multi_discrete import MultiDiscrete
 from gym.spaces import Tuple
 
 from flow.core import rewards
+from flow.core.util import file_lock
 from flow.envs.base import Env
 from flow.utils.distributions import gen_request
 from traci.exceptions import TraCIException, FatalTraCIError
 
 import threading
-from exclusiveprocess import Lock, CannotAcquireLock
 
 ADDITIONAL_ENV_PARAMS = {
     "max_num_order": 10,
@@ -114,22 +114,26 @@ class DispatchAndRepositionEnv(Env):
         }
 
         self.edges = self.k.network.get_edge_list()
-        # in/out flow edge cannot be visited by taxi
-        self.flow_edges = []
-        self.in_edges = []
-        self.out_edges = []
-        for i, edge in enumerate(self.edges):
-            if 'flow' in edge:
-                self.flow_edges.append(i)
-            elif 'in' in edge:
-                self.in_edges.append(i)
-            elif 'out' in edge:
-                self.out_edges.append(i)
+        self.edge_index = {edge: i for i, edge in enumerate(self.edges)}
+        # category of each edge, in/out flow edge cannot be visited by taxi
+        category = ['flow' if 'flow' in edge else 'in' if 'in' in edge
+                    else 'out' if 'out' in edge else 'inner'
+                    for edge in self.edges]
+        self.is_flow_edge = np.array([c == 'flow' for c in category], dtype=bool)
+        self.is_in_edge = np.array([c == 'in' for c in category], dtype=bool)
+        self.is_out_edge = np.array([c == 'out' for c in category], dtype=bool)
+        self.is_inner_edge = np.array([c == 'inner' for c in category], dtype=bool)
+        self.flow_edges = np.flatnonzero(self.is_flow_edge).tolist()
+        self.in_edges = np.flatnonzero(self.is_in_edge).tolist()
+        self.out_edges = np.flatnonzero(self.is_out_edge).tolist()
+        # edges that are never a valid reposition or mid edge
+        self._banned_edges = torch.from_numpy(~self.is_inner_edge)
 
         self._preprocess()
 
         self.num_taxi = network.vehicles.num_rl_vehicles
         self.taxis = [taxi for taxi in network.vehicles.ids if network.vehicles.get_type(taxi) == 'taxi']
+        self.taxi_index = {taxi: i for i, taxi in enumerate(self.taxis)}
         self.outside_taxis = []
         self.background_cars = [car for car in network.vehicles.ids if network.vehicles.get_type(car) != 'taxi']
         assert self.num_taxi == len(self.taxis)
@@ -146,6 +150,31 @@ class DispatchAndRepositionEnv(Env):
             self.k.kernel_api.simulation.convert2D(edge, self.k.kernel_api.lane.getLength(edge + '_0')), \
             self.k.kernel_api.lane.getWidth(edge + '_0')) \
             for edge in self.edges]
+        # endpoints and lengths of the edges, to convert edge positions into
+        # 2D coordinates without querying sumo (all edges are straight)
+        self._edge_start = np.array([start for start, _, _ in self.edge_position])
+        self._edge_end = np.array([end for _, end, _ in self.edge_position])
+        self._edge_length = np.array(
+            [self.k.kernel_api.lane.getLength(edge + '_0') for edge in self.edges])
+        self._tl_durations = None
+
+        # preallocated observation, and the slice of each feature block in it
+        n_tl_feature = int(self.use_tl) * self.n_tl * (self.n_phase + 1)
+        sizes = [
+            ('time', 1),
+            ('edges', len(self.edges)),
+            ('taxis', self.num_taxi * 9),
+            ('tl', n_tl_feature),
+            ('orders', self.max_num_order * 5),
+            ('mid_edge', 4 + len(self.taxis)),
+            ('reposition', self.num_taxi + 2),
+        ]
+        self._state = np.zeros(self.observation_space.shape)
+        self._state_slices = {}
+        offset = 0
+        for name, size in sizes:
+            self._state_slices[name] = slice(offset, offset + size)
+            offset += size
         self.statistics = {
             'route': {},
             'location': {}
@@ -184,12 +213,12 @@ class DispatchAndRepositionEnv(Env):
         edge2 = 'bot1_3_0'
         edge3 = 'top2_3_0'
 
-        id1 = self.edges.index(edge1)
-        id2 = self.edges.index(edge2)
-        id3 = self.edges.index(edge3)
+        id1 = self.edge_index[edge1]
+        id2 = self.edge_index[edge2]
+        id3 = self.edge_index[edge3]
 
-        route1 = set(self.paired_complete_routes[id1][id2])
-        route2 = set(self.paired_complete_routes[id2][id3])
+        route1 = set(self.get_route(id1, id2))
+        route2 = set(self.get_route(id2, id3))
         # print('part 1', route1)
         # print('part 2', route2)
         # print('intersect', route1 & route2)
@@ -215,67 +244,135 @@ class DispatchAndRepositionEnv(Env):
         exit(0)
 
     def _preprocess(self):
-        def _add_center(edges):
-            if len(edges) == 0:
-                return []
-            ret = []
-            for i in range(len(edges) - 1):
-                ret.append(edges[i])
-                ret.append(self.centers[edges[i] + '&' + edges[i + 1]])
-            ret.append(edges[-1])
-            return ret
-
+        """Compute the routes between all pairs of edges, and the mid edges.
+
+        The fastest routes are computed by the network kernel, and stored in
+        compact form: the predecessors of the destination edges on the routes
+        (see ``get_route``) and the number of edges of every route (0 if the
+        destination cannot be reached, 1 for identical edges).
+
+        The mid edge k of an order from edge i to edge j is banned if the
+        routes i -> k and k -> j share an edge or a junction, if the detour
+        is longer than ``max_detour`` times the route i -> j, or if k cannot
+        be reached. The results are saved in the save path of the env, and
+        loaded from there by the other envs.
+        """
         n_edge = len(self.edges)
-        save_path = os.path.join(self.env_params.save_path, 'preprocess.pt')
-        while True:
-            try:
-                with Lock(name='preprocess'):
-                    if os.path.exists(save_path):
-                        self.paired_routes, self.paired_complete_routes, self.banned_mid_edges = \
-                            torch.load(save_path)
-                    else:
-                        self.paired_routes = [
-                            [self.k.kernel_api.simulation.findRoute(s, t) for t in self.edges] \
-                            for s in self.edges
-                        ]
-                        self.centers = {}
-                        for edge1 in self.network.edges:
-                            for edge2 in self.network.edges:
-                                if edge1['to'] == edge2['from']:
-                                    self.centers[edge1['id'] + '&' + edge2['id']] = edge1['to']
-                        self.paired_complete_routes = [
-                            [_add_center(route.edges) for route in routes] \
-                            for routes in self.paired_routes
-                        ]
-                        self.banned_mid_edges = torch.zeros((n_edge, n_edge, n_edge), dtype=bool)
-                        for i in range(n_edge):
-                            for j in range(n_edge):
-                                if i != j:
-                                    l = len(self.paired_routes[i][j].edges)
-                                    for k in range(n_edge):
-                                        if k != i and k != j:
-                                            l1 = len(self.paired_routes[i][k].edges)
-                                            l2 = len(self.paired_routes[k][j].edges)
-                                            r1 = set(self.paired_complete_routes[i][k][:-1])
-                                            r2 = set(self.paired_complete_routes[k][j][1:])
-                                            if len(r1 & r2) > 0 or l1 + l2 - 1 > self.max_detour * l \
-                                                or l1 == 0 or l2 == 0: # This is for unreachable path
-                                                self.banned_mid_edges[i, j, k] = True
-                        torch.save([self.paired_routes, self.paired_complete_routes, self.banned_mid_edges], \
-                            save_path)
+        save_path = os.path.join(self.env_params.save_path, 'preprocess.npz')
+        if not os.path.exists(save_path):
+            # the first env computes the results, the others wait for them
+            with file_lock(save_path + '.lock'):
+                if not os.path.exists(save_path):
+                    predecessors, route_lengths, banned_mid_edges = \
+                        self._compute_routes()
+                    # written to a temporary file first, so that the envs
+                    # that do not take the lock never read a partial file
+                    tmp_path = save_path + '.tmp'
+                    with open(tmp_path, 'wb') as f:
+                        np.savez(f,
+                                 predecessors=predecessors,
+                                 route_lengths=route_lengths,
+                                 banned_mid_edges=np.packbits(
+                                     banned_mid_edges, axis=-1))
+                    os.replace(tmp_path, save_path)
+        with np.load(save_path) as data:
+            self.route_predecessors = data['predecessors']
+            self.route_lengths = data['route_lengths']
+            self.banned_mid_edges = torch.from_numpy(
+                np.unpackbits(data['banned_mid_edges'], axis=-1,
+                              count=n_edge).astype(bool))
+
+    def _compute_routes(self):
+        """Compute the data stored by ``_preprocess``."""
+        n_edge = len(self.edges)
+        _, predecessors = self.k.network.get_shortest_paths()
+        predecessors = predecessors.astype(np.int32)
+
+        # index of the junction at the end of every edge
+        edge_to = {edge['id']: edge['to'] for edge in self.network.edges}
+        nodes = sorted(set(edge_to.values()))
+        to_node = np.array([nodes.index(edge_to[edge]) for edge in self.edges])
+
+        # the routes are built by following the predecessors, one edge per
+        # iteration, in which the following are updated for all pairs (i, k):
+        # - route_lengths: the number of edges of the route
+        # - first[i, k]: the edges and junctions of the route, but the last
+        #   edge
+        # - second[i, k]: the edges and junctions of the route, but the first
+        #   edge
+        # the edges are indexed before the junctions in the last axis
+        rows = np.arange(n_edge)[:, None]
+        reachable = predecessors >= 0
+        pred = np.where(reachable, predecessors, 0)
+        pred_node = n_edge + to_node[pred]
+        i, k = np.nonzero(reachable)
+
+        route_lengths = np.eye(n_edge, dtype=np.int32)
+        first = np.zeros((n_edge, n_edge, n_edge + len(nodes)), dtype=bool)
+        second = np.zeros_like(first)
+        for _ in range(n_edge):
+            next_lengths = np.where(
+                reachable, route_lengths[rows, pred] + 1, route_lengths)
+            first[i, k] = first[i, pred[i, k]]
+            first[i, k, pred[i, k]] = True
+            first[i, k, pred_node[i, k]] = True
+            second[i, k] = second[i, pred[i, k]]
+            second[i, k, pred_node[i, k]] = True
+            second[i, k, k] = True
+            if np.array_equal(next_lengths, route_lengths):
                 break
-            except CannotAcquireLock:
-                pass
-
+            route_lengths = next_lengths
+
+        # common edges and junctions of the routes i -> k and k -> j, as
+        # shared[k, i, j]
+        shared = np.matmul(first.transpose(1, 0, 2).astype(np.float32),
+                           second.transpose(0, 2, 1).astype(np.float32)) > 0
+
+        l = route_lengths[:, :, None]
+        l1 = route_lengths[:, None, :]
+        l2 = route_lengths.T[None, :, :]
+        banned_mid_edges = shared.transpose(1, 2, 0) \
+            | (l1 + l2 - 1 > self.max_detour * l) | (l1 == 0) | (l2 == 0)
+
+        # the origin and destination are not mid edges, and orders from an
+        # edge to itself have no mid edges
+        index = np.arange(n_edge)
+        banned_mid_edges[index, :, index] = False
+        banned_mid_edges[:, index, index] = False
+        banned_mid_edges[index, index, :] = False
+
+        return predecessors, route_lengths, banned_mid_edges
+
+    def get_route(self, from_id, to_id):
+        """Return the edges of the route between two edges.
+
+        Parameters
+        ----------
+        from_id : int
+            index of the origin edge in self.edges
+        to_id : int
+            index of the destination edge in self.edges
+
+        Returns
+        -------
+        list of str
+            edges of the route, empty if the destination cannot be reached
+        """
+        if self.route_lengths[from_id, to_id] == 0:
+            return []
+        route = [to_id]
+        while route[-1] != from_id:
+            route.append(self.route_predecessors[from_id, route[-1]])
+        return [self.edges[i] for i in reversed(route)]
 
     def get_action_mask(self):
         mask = torch.zeros_like(self.action_mask[0])
         if self.__need_reposition:
-            taxi_id = self.taxis.index(self.__need_reposition)
+            taxi_id = self.taxi_index[self.__need_reposition]
             # print(self.action_mask[taxi_id].unsqueeze(0))
             mask = torch.logical_or(mask, self.action_mask[taxi_id])
         if self.__need_mid_edge:
-            taxi_id = self.taxis.index(self.__need_mid_edge)
+            taxi_id = self.taxi_index[self.__need_mid_edge]
             mask = torch.logical_or(mask, self.action_mask[taxi_id])
         if len(self.__reservations) > 0:
             mask = torch.logical_or(mask, self.action_mask[self.num_taxi])
@@ -318,48 +415,76 @@ class DispatchAndRepositionEnv(Env):
         )
         return state_box
 
-    def get_state(self):
-        """See class definition."""
-
-        time_feature = [self.time_counter / (self.env_params.horizon * self.env_params.sims_per_step)]
+    def _edge_point(self, edge_ids, pos):
+        """Return the 2D coordinates of positions on edges.
+
+        Parameters
+        ----------
+        edge_ids : int or array_like
+            indices of the edges in self.edges
+        pos : float or array_like
+            positions on the edges
+
+        Returns
+        -------
+        np.ndarray
+            x and y coordinates of the positions, in the last axis
+        """
+        start = self._edge_start[edge_ids]
+        end = self._edge_end[edge_ids]
+        ratio = np.asarray(pos) / self._edge_length[edge_ids]
+        return start + (end - start) * np.expand_dims(ratio, -1)
 
-        edges_feature = [
-            self.k.kernel_api.edge.getLastStepVehicleNumber(edge) for edge in self.edges
-        ]
-        taxi_feature = []
-        empty_taxi = self.k.vehicle.get_taxi_fleet(0)
-        pickup_taxi = self.k.vehicle.get_taxi_fleet(1)               
-        
-        for taxi in self.taxis:
-            while taxi not in self.k.vehicle.get_rl_ids():
+    def get_state(self):
+        """See class definition.
+
+        The observation is written in a preallocated buffer, which is
+        overwritten by the next call.
+        """
+        state = self._state
+        slices = self._state_slices
+
+        state[slices['time']] = self.time_counter / (self.env_params.horizon * self.env_params.sims_per_step)
+
+        # number of vehicles on each edge
+        state[slices['edges']] = self.k.network.get_edge_stats()[:, 0]
+
+        # status, position, and endpoints of the route of each taxi
+        taxi_feature = state[slices['taxis']].reshape(self.num_taxi, 9)
+        taxi_feature[:] = 0
+        empty_taxi = set(self.k.vehicle.get_taxi_fleet(0))
+        pickup_taxi = set(self.k.vehicle.get_taxi_fleet(1))
+        rl_ids = set(self.k.vehicle.get_rl_ids())
+        from_ids = np.zeros(self.num_taxi, dtype=int)
+        to_ids = np.zeros(self.num_taxi, dtype=int)
+        to_pos = np.zeros(self.num_taxi)
+        for i, taxi in enumerate(self.taxis):
+            if taxi not in rl_ids:
                 raise KeyError
-            x, y = self.k.vehicle.get_2d_position(taxi, error=(-1, -1))
-            from_x, from_y = self.k.kernel_api.simulation.convert2D(self.k.kernel_api.vehicle.getRoute(taxi)[0], 0)
-            to_edge = self.k.kernel_api.vehicle.getRoute(taxi)[-1]
-            to_pos = self.inner_length - 2 if 'out' not in to_edge else self.outer_length - 2
-            to_x, to_y = self.k.kernel_api.simulation.convert2D(to_edge, to_pos)
-            # cur_taxi_feature = [0, x, y, self.edges.index(self.k.kernel_api.vehicle.getRoute(taxi)[0]), self.edges.index(self.k.kernel_api.vehicle.getRoute(taxi)[-1])]
-            cur_taxi_feature = [0, 0, 0, x, y, from_x, from_y, to_x, to_y] # use (x, y) or edge id
-            cur_taxi_feature[0 if taxi in empty_taxi else 1 if taxi in pickup_taxi else 2] = 1
-            taxi_feature += cur_taxi_feature
+            route = self.k.vehicle.get_route(taxi)
+            from_ids[i] = self.edge_index[route[0]]
+            to_ids[i] = self.edge_index[route[-1]]
+            to_pos[i] = self.inner_length - 2 if 'out' not in route[-1] else self.outer_length - 2
+            taxi_feature[i, 0 if taxi in empty_taxi else 1 if taxi in pickup_taxi else 2] = 1
+            taxi_feature[i, 3:5] = self.k.vehicle.get_2d_position(taxi, error=(-1, -1))
+        taxi_feature[:, 5:7] = self._edge_start[from_ids]
+        taxi_feature[:, 7:9] = self._edge_point(to_ids, to_pos)
 
         # use traffic light info
-        tl_feature = []
         if self.use_tl:
-            tl = self.k.kernel_api.trafficlight
-            for tl_id in tl.getIDList():
-                phase = tl.getPhase(tl_id)
-                t_next = tl.getNextSwitch(tl_id)
-                links = tl.getControlledLinks(tl_id)
-                logic = tl.getAllProgramLogics(tl_id)[-1]
-                state = tl.getRedYellowGreenState(tl_id)
-
-                len_phases = 4 # TODO: len(logic.phases)
-                ft = [0] * (len_phases + 1)
-                ft[phase % len_phases] = 1
-
-                durations = [phase.duration for phase in logic.phases]
-                cur_time = self.time_counter * self.sim_params.sim_step
+            tl_feature = state[slices['tl']].reshape(-1, self.n_phase + 1)
+            tl_feature[:] = 0
+            tl_ids = self.k.traffic_light.get_ids()
+            if self._tl_durations is None:
+                tl = self.k.kernel_api.trafficlight
+                self._tl_durations = [
+                    [phase.duration for phase in tl.getAllProgramLogics(tl_id)[-1].phases]
+                    for tl_id in tl_ids]
+            cur_time = self.time_counter * self.sim_params.sim_step
+            for i, tl_id in enumerate(tl_ids):
+                tl_feature[i, self.k.traffic_light.get_phase(tl_id) % self.n_phase] = 1
+
+                durations = self._tl_durations[i]
                 phase_time = cur_time % sum(durations)
                 for t in durations:
                     if phase_time > t:
@@ -367,50 +492,46 @@ class DispatchAndRepositionEnv(Env):
                     else:
                         res_time = t - phase_time
                         break
-                ft[-1] = res_time
-                tl_feature += ft
-        
-        order_feature = self._get_order_state.tolist()
+                tl_feature[i, -1] = res_time
+
+        state[slices['orders']] = self._get_order_state
 
-        mid_edge_feature = [-1] * (4 + len(self.taxis))
+        mid_edge_feature = state[slices['mid_edge']]
+        mid_edge_feature[:] = -1
         if self.__need_mid_edge:
             taxi = self.__need_mid_edge
             res = self.k.vehicle.reservation[taxi]
-            from_x, from_y = self.k.kernel_api.simulation.convert2D(res.fromEdge, res.departPos)
-            to_x, to_y = self.k.kernel_api.simulation.convert2D(res.toEdge, 25)
-            veh_id = self.taxis.index(taxi)
-            index = [0] * len(self.taxis)
-            index[veh_id] = 1
-            mid_edge_feature = [from_x, from_y, to_x, to_y] + index
+            mid_edge_feature[0:2] = self._edge_point(self.edge_index[res.fromEdge], res.departPos)
+            mid_edge_feature[2:4] = self._edge_point(self.edge_index[res.toEdge], 25)
+            mid_edge_feature[4:] = 0
+            mid_edge_feature[4 + self.taxi_index[taxi]] = 1
         
         self._update_action_mask()
     
-        index = [0] * len(self.taxis)
         # if self.__reservations:
         #     need_reposition_taxi_feature = index + [-1, -1]
         # else:
         empty_taxi_fleet = self.k.vehicle.get_taxi_fleet(0)
         self.__need_reposition = None
         for taxi in empty_taxi_fleet:
-            edge = self.k.vehicle.get_edge(taxi)
-            edge_id = self.edges.index(edge) if edge in self.edges else -1
+            edge_id = self.edge_index.get(self.k.vehicle.get_edge(taxi))
             # Don't reposit the taxi in flow_edges, in_edges and out_edges
-            if edge_id in self.flow_edges + self.out_edges:
+            if edge_id is not None and (self.is_flow_edge[edge_id] or self.is_out_edge[edge_id]):
                 continue
             elif self.k.kernel_api.vehicle.isStopped(taxi):
                 self.__need_reposition = taxi
                 break
         
+        need_reposition_taxi_feature = state[slices['reposition']]
+        need_reposition_taxi_feature[:] = 0
         if self.__need_reposition:
             # need_reposition_taxi_feature = [self.edges.index(self.k.kernel_api.vehicle.getRoadID(self.__need_reposition)), self.k.vehicle.get_position(self.__need_reposition)]
-            x, y = self.k.vehicle.get_2d_position(self.__need_reposition, error=(-1, -1))
-            index[self.taxis.index(self.__need_reposition)] = 1
-            need_reposition_taxi_feature = index + [x, y]
+            need_reposition_taxi_feature[self.taxi_index[self.__need_reposition]] = 1
+            need_reposition_taxi_feature[-2:] = self.k.vehicle.get_2d_position(self.__need_reposition, error=(-1, -1))
         else:
-            need_reposition_taxi_feature = index + [-1, -1]
+            need_reposition_taxi_feature[-2:] = -1
 
-        state = time_feature + edges_feature + taxi_feature + tl_feature + order_feature + mid_edge_feature + need_reposition_taxi_feature
-        return np.array(state)
+        return state
     
     def _get_info(self):
         return {}
@@ -464,7 +585,7 @@ class DispatchAndRepositionEnv(Env):
         #     self.k.kernel_api.person.appendDrivingStage(per_id, edge_id2, 'taxi')
         #     self.k.kernel_api.person.setColor(per_id, (255, 0, 0))
         # print('add_request', per_id, 'from', str(edge_id1), 'to', str(edge_id2))
-        orders = [[-1, -1, -1, -1, -1]] * self.max_num_order
+        orders = np.full((self.max_num_order, 5), -1.)
         reservations = self.k.person.get_reservations()
         cur_time = self.time_counter * self.sim_params.sim_step
         issued_orders = self.__dispatched_orders + self.__pending_orders
@@ -474,17 +595,17 @@ class DispatchAndRepositionEnv(Env):
 
         count = 0
         for res in self.__reservations:            
-            waiting_time = self.k.kernel_api.person.getWaitingTime(res.persons[0])
+            waiting_time = self.k.person.get_waiting_time(res.persons[0])
             # form_edge = res.fromEdge
             # to_edge = res.toEdge
-            from_x, from_y = self.k.kernel_api.simulation.convert2D(res.fromEdge, res.departPos)
-            to_x, to_y = self.k.kernel_api.simulation.convert2D(res.toEdge, res.arrivalPos)
             # orders[count] = [ waiting_time, self.edges.index(form_edge), self.edges.index(to_edge) ]
-            orders[count] = [waiting_time, from_x, from_y, to_x, to_y]
+            orders[count, 0] = waiting_time
+            orders[count, 1:3] = self._edge_point(self.edge_index[res.fromEdge], res.departPos)
+            orders[count, 3:5] = self._edge_point(self.edge_index[res.toEdge], res.arrivalPos)
             count += 1
             if count == self.max_num_order:
                 break
-        return np.array(orders).reshape(-1)
+        return orders.reshape(-1)
 
     # def _apply_rl_actions(self, rl_actions):
         # pass
@@ -550,15 +671,10 @@ class DispatchAndRepositionEnv(Env):
         n_edge = len(self.edges)
 
         # collect the mean velocity and total emission of edges
-        num_congestion = 0.0
-        for i, edge in enumerate(self.edges):
-            n_veh = self.k.kernel_api.edge.getLastStepVehicleNumber(edge)
-            mean_vel = self.k.kernel_api.edge.getLastStepMeanSpeed(edge) # if n_veh > 0 else 10.0 # MAX_SPEED = 10.0
-            co2 = self.k.kernel_api.edge.getCO2Emission(edge)
-            self.mean_velocity[i] = mean_vel #/ 10.0 / self.env_params.horizon
-            self.total_co2[i] = co2
-            if n_veh > 0 and mean_vel < 3.0: # a threshold for congestion
-                num_congestion += 1
+        n_veh, mean_vel, co2, _ = self.k.network.get_edge_stats().T
+        self.mean_velocity[:] = mean_vel #/ 10.0 / self.env_params.horizon
+        self.total_co2[:] = co2
+        num_congestion = np.sum((n_veh > 0) & (mean_vel < 3.0)) # a threshold for congestion
         self.congestion_rate = num_congestion / len(self.edges)
 
         #  collect the velocities and co2 emissions of vehicles
@@ -588,8 +704,8 @@ class DispatchAndRepositionEnv(Env):
         cnt = self.statistics['route']['free']
         for taxi in free_taxi:
             edge = self.k.vehicle.get_edge(taxi)
-            if edge in self.edges and self.last_edge[taxi] != edge:
-                cnt[self.edges.index(edge)] += 1
+            if edge in self.edge_index and self.last_edge[taxi] != edge:
+                cnt[self.edge_index[edge]] += 1
             self.last_edge[taxi] = edge
 
         # collect the background vehicle density
@@ -597,11 +713,11 @@ class DispatchAndRepositionEnv(Env):
             self.statistics['route']['background'] = np.zeros((n_edge))
         cnt = self.statistics['route']['background']
         for veh in self.k.vehicle.get_ids():
-            if veh in self.taxis:
+            if veh in self.taxi_index:
                 continue
             edge = self.k.vehicle.get_edge(veh)
-            if edge in self.edges and (veh not in self.last_edge or self.last_edge[veh] != edge):
-                cnt[self.edges.index(edge)] += 1
+            if edge in self.edge_index and (veh not in self.last_edge or self.last_edge[veh] != edge):
+                cnt[self.edge_index[edge]] += 1
             self.last_edge[veh] = edge
 
 
@@ -613,8 +729,8 @@ class DispatchAndRepositionEnv(Env):
         for taxi in pickup_taxi:
             edge = self.k.vehicle.get_edge(taxi)
             tp = self.k.vehicle.get_res_type(taxi)
-            if edge in self.edges and self.last_edge[taxi] != edge:
-                cnt[tp][self.edges.index(edge)] += 1
+            if edge in self.edge_index and self.last_edge[taxi] != edge:
+                cnt[tp][self.edge_index[edge]] += 1
             self.last_edge[taxi] = edge
 
         # collect the on-service vehicle density
@@ -625,8 +741,8 @@ class DispatchAndRepositionEnv(Env):
         for taxi in occupied_taxi:
             edge = self.k.vehicle.get_edge(taxi)
             tp = self.k.vehicle.get_res_type(taxi)
-            if edge in self.edges and self.last_edge[taxi] != edge:
-                cnt[tp][self.edges.index(edge)] += 1
+            if edge in self.edge_index and self.last_edge[taxi] != edge:
+                cnt[tp][self.edge_index[edge]] += 1
             self.last_edge[taxi] = edge
 
         pre_reward = reward
@@ -656,9 +772,8 @@ class DispatchAndRepositionEnv(Env):
                     print('taxi {} pickup successfully'.format(taxi))
 
         # miss penalty
-        persons = self.k.kernel_api.person.getIDList()
-        for person in persons:
-            if self.k.kernel_api.person.getWaitingTime(person) > self.max_waiting_time:
+        for person in self.k.person.get_ids():
+            if self.k.person.get_waiting_time(person) > self.max_waiting_time:
                 if not self.k.person.is_matched(person) and not self.k.person.is_removed(person):
                     reward -= self.miss_penalty
                     self.k.person.remove(person)
@@ -732,9 +847,8 @@ class DispatchAndRepositionEnv(Env):
     def _check_outside(self):
         candidate_edges = self.in_edges.copy()
         for i, veh_id in enumerate(self.background_cars):
-            edge = self.k.vehicle.get_edge(veh_id)
-            edge_idx = self.edges.index(edge) if edge in self.edges else -1
-            if edge_idx in self.out_edges:
+            edge_idx = self.edge_index.get(self.k.vehicle.get_edge(veh_id))
+            if edge_idx is not None and self.is_out_edge[edge_idx]:
                 in_edge_idx = np.random.choice(candidate_edges)
                 candidate_edges.remove(in_edge_idx)
                 in_edge = self.edges[in_edge_idx]
@@ -742,8 +856,6 @@ class DispatchAndRepositionEnv(Env):
                 self.k.kernel_api.vehicle.moveToXY(veh_id, in_edge, lane='0', x=x, y=y, keepRoute=0)
 
         for i, taxi in enumerate(self.taxis):
-            edge = self.k.vehicle.get_edge(taxi)
-            edge_idx = self.edges.index(edge) if edge in self.edges else -1
             if taxi in self.outside_taxis:
                 in_edge_idx = np.random.choice(candidate_edges)
                 in_edge = self.edges[in_edge_idx]
@@ -849,8 +961,7 @@ class DispatchAndRepositionEnv(Env):
                     if self.stop_time[i] == 3 * self.env_params.sims_per_step:
                         self.stop_time[i] = None
                         edge = self.k.vehicle.get_edge(taxi)
-                        edge_idx = self.edges.index(edge)
-                        is_outside = edge_idx in self.out_edges
+                        is_outside = bool(self.is_out_edge[self.edge_index[edge]])
                         self.k.vehicle.dropoff(taxi, is_outside)
                         if is_outside:
                             self.outside_taxis.append(taxi)
@@ -878,7 +989,7 @@ class DispatchAndRepositionEnv(Env):
         #             return True
         #     return False
 
-        self.action_mask = torch.zeros((self.num_taxi + 1, sum(self.action_space.nvec)), dtype=bool)
+        self.action_mask.zero_()
         # distances = [self.k.vehicle.get_distance(taxi) for taxi in self.taxis]
         # unavailable = self.k.vehicle.get_taxi_fleet(1) + self.k.vehicle.get_taxi_fleet(2)
 
@@ -888,16 +999,15 @@ class DispatchAndRepositionEnv(Env):
         # mid point mask
         if self.__need_mid_edge is not None:
             res = self.k.vehicle.reservation[self.__need_mid_edge]
-            from_id, to_id = self.edges.index(res.fromEdge), self.edges.index(res.toEdge)
-            taxi_id =  self.taxis.index(self.__need_mid_edge)
-            
+            from_id, to_id = self.edge_index[res.fromEdge], self.edge_index[res.toEdge]
+            taxi_id = self.taxi_index[self.__need_mid_edge]
+
             # mask from edge, to edge
-            for i in range(self.n_mid_edge):
-                self.action_mask[taxi_id][n_edge + n_taxi + 1 + i * n_edge + from_id] = True
-                self.action_mask[taxi_id][n_edge + n_taxi + 1 + i * n_edge + to_id] = True
-                # mask flow edges, in edges and out edges
-                for j in self.flow_edges + self.in_edges + self.out_edges:
-                    self.action_mask[taxi_id][n_edge + n_taxi + 1 + i * n_edge + j] = True
+            mid_edge_mask = self.action_mask[taxi_id][n_edge + n_taxi + 1:].view(self.n_mid_edge, n_edge)
+            mid_edge_mask[:, from_id] = True
+            mid_edge_mask[:, to_id] = True
+            # mask flow edges, in edges and out edges
+            mid_edge_mask |= self._banned_edges
 
             if self.n_mid_edge == 0:
                 pass
@@ -936,29 +1046,24 @@ class DispatchAndRepositionEnv(Env):
             assert cur_edge != ""
 
             # reposition mask, mask current edge
-            if cur_edge in self.edges:
-                edge_id = self.edges.index(cur_edge)
-                self.action_mask[i][edge_id] = True
+            edge_idx = self.edge_index.get(cur_edge)
+            if edge_idx is not None:
+                self.action_mask[i][edge_idx] = True
 
             # reposition mask, mask flow edges, in edges and out edges
-            for j in self.flow_edges + self.in_edges + self.out_edges:
-                self.action_mask[i][j] = True
+            self.action_mask[i][:n_edge] |= self._banned_edges
 
             # taxi mask
             if len(self.__reservations) > 0:
                 res = self.__reservations[0]
-                edge = self.k.vehicle.get_edge(taxi)
                 pos = self.k.vehicle.get_position(taxi)
                 # Do not dispath the order to the taxi on out edges
-                edge_idx = self.edges.index(edge) if edge in self.edges else -1
-                if edge == res.fromEdge and pos > res.departPos:
+                if cur_edge == res.fromEdge and pos > res.departPos:
                     self.action_mask[self.num_taxi][n_edge + i] = True
-                if edge_idx in self.out_edges:
+                if edge_idx is not None and self.is_out_edge[edge_idx]:
+                    self.action_mask[self.num_taxi][n_edge + i] = True
+                elif any(self.is_out_edge[self.edge_index[edge]] for edge in self.k.vehicle.get_route(taxi)):
                     self.action_mask[self.num_taxi][n_edge + i] = True
-                for edge in self.k.vehicle.get_route(taxi):
-                    if self.edges.index(edge) in self.out_edges:
-                        self.action_mask[self.num_taxi][n_edge + i] = True
-                        break
                 
                 # from_id = self.edges.index(res.fromEdge)    
                 # to_id = self.edges.index(res.toEdge)
@@ -979,9 +1084,8 @@ class DispatchAndRepositionEnv(Env):
 
 
     def _remove_tle_request(self):
-        idlist = self.k.kernel_api.person.getIDList()
-        for person in idlist:
-            if self.k.kernel_api.person.getWaitingTime(person) > self.max_waiting_time:
+        for person in self.k.person.get_ids():
+            if self.k.person.get_waiting_time(person) > self.max_waiting_time:
                 if not self.k.person.is_matched(person) and not self.k.person.is_removed(person):
                     self.k.person.remove(person)
                     self.k.person.set_color(person, (0, 255, 255)) # Cyan
@@ -1000,7 +1104,7 @@ class DispatchAndRepositionEnv(Env):
             # if the taxi is occupied now, we should dispatch this order later
             if self.k.kernel_api.vehicle.getRoadID(veh_id).startswith(':') or veh_id not in self.k.vehicle.get_taxi_fleet(0):
                 remain_pending_orders.append([res, veh_id])
-            elif self.k.kernel_api.person.getWaitingTime(res.persons[0]) <= self.max_waiting_time:
+            elif self.k.person.get_waiting_time(res.persons[0]) <= self.max_waiting_time:
                 self.__dispatched_orders.append((res, veh_id))
                 self.k.vehicle.dispatch_taxi(veh_id, res, tp=self.k.person.get_type(res.persons[0]))
                 self.k.person.match(res.persons[0], veh_id)
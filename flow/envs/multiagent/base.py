@@ -11,6 +11,7 @@ from traci.exceptions import TraCIException
 
 from ray.rllib.env import MultiAgentEnv
 
+from flow.controllers.batch import get_actions
 from flow.envs.base import Env
 from flow.utils.exceptions import FatalFlowError
 
@@ -54,11 +55,7 @@ class MultiEnv(MultiAgentEnv, Env):
 
             # perform acceleration actions for controlled human-driven vehicles
             if len(self.k.vehicle.get_controlled_ids()) > 0:
-                accel = []
-                for veh_id in self.k.vehicle.get_controlled_ids():
-                    accel_contr = self.k.vehicle.get_acc_controller(veh_id)
-                    action = accel_contr.get_action(self)
-                    accel.append(action)
+                accel = get_actions(self, self.k.vehicle.get_controlled_ids())
                 self.k.vehicle.apply_acceleration(
                     self.k.vehicle.get_controlled_ids(), accel)
 
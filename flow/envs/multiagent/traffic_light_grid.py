@@ -149,21 +149,13 @@ class MultiTrafficLightGridPOEnv(TrafficLightGridPOEnv, MultiEnv):
             edge_number.append(local_edge_numbers)
 
         # Edge information
-        density = []
-        velocity_avg = []
-        for edge in self.k.network.get_edge_list():
-            ids = self.k.vehicle.get_ids_by_edge(edge)
-            if len(ids) > 0:
-                # TODO(cathywu) Why is there a 5 here?
-                density += [5 * len(ids) / self.k.network.edge_length(edge)]
-                velocity_avg += [np.mean(
-                    [self.k.vehicle.get_speed(veh_id) for veh_id in
-                     ids]) / max_speed]
-            else:
-                density += [0]
-                velocity_avg += [0]
-        density = np.array(density)
-        velocity_avg = np.array(velocity_avg)
+        num_vehicles, mean_speed, _, _ = self.k.network.get_edge_stats().T
+        edge_length = np.array([
+            self.k.network.edge_length(edge)
+            for edge in self.k.network.get_edge_list()])
+        # TODO(cathywu) Why is there a 5 here?
+        density = 5 * num_vehicles / edge_length
+        velocity_avg = np.where(num_vehicles > 0, mean_speed / max_speed, 0)
         self.observed_ids = all_observed_ids
 
         # Traffic light information
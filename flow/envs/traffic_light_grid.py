@@ -694,20 +694,13 @@ class TrafficLightGridPOEnv(TrafficLightGridEnv):
                     edge_number += [0] * diff
 
         # now add in the density and average velocity on the edges
-        density = []
-        velocity_avg = []
-        for edge in self.k.network.get_edge_list():
-            ids = self.k.vehicle.get_ids_by_edge(edge)
-            if len(ids) > 0:
-                vehicle_length = 5
-                density += [vehicle_length * len(ids) /
-                            self.k.network.edge_length(edge)]
-                velocity_avg += [np.mean(
-                    [self.k.vehicle.get_speed(veh_id) for veh_id in
-                     ids]) / max_speed]
-            else:
-                density += [0]
-                velocity_avg += [0]
+        vehicle_length = 5
+        num_vehicles, mean_speed, _, _ = self.k.network.get_edge_stats().T
+        edge_length = np.array([
+            self.k.network.edge_length(edge)
+            for edge in self.k.network.get_edge_list()])
+        density = vehicle_length * num_vehicles / edge_length
+        velocity_avg = np.where(num_vehicles > 0, mean_speed / max_speed, 0)
         self.observed_ids = all_observed_ids
         return np.array(
             np.concatenate([
@@ -4,6 +4,7 @@ from flow.core.params import InitialConfig
 from flow.core.params import PersonParams, TrafficLightParams
 from flow.core.params import SumoCarFollowingParams
 from flow.core.params import SumoLaneChangeParams
+import threading
 import time
 import xml.etree.ElementTree as ElementTree
 from lxml import etree
@@ -335,7 +336,9 @@ class Network(object):
         """
         self.orig_name = name  # To avoid repeated concatenation upon reset
         import os
-        self.name = name + '_' + str(os.getpid()) + time.strftime('_%Y%m%d-%H%M%S') + str(time.time())
+        # unique across the processes and threads that generate networks
+        self.name = name + '_' + str(os.getpid()) + '_' + str(threading.get_ident()) + \
+            time.strftime('_%Y%m%d-%H%M%S') + str(time.time())
 
         self.vehicles = vehicles
         self.persons = persons
@@ -131,6 +131,8 @@ class Monitor(gym.Wrapper):
             ep_info['total_co2s'] = self.total_co2s
             ep_info['edge_position'] = self.env.edge_position
             ep_info['statistics'] = self.env.statistics
+            ep_info['route_oracle_hit_rate'] = \
+                self.env.k.network.route_oracle.hit_rate
             ep_info.update(self.current_reset_info)
             if self.logger:
                 self.logger.writerow(ep_info)
@@ -6,10 +6,14 @@ being the time (in seconds), the y-axis being the position of a vehicle, and
 color representing the speed of te vehicles.
 
 If the number of simulation steps is too dense, you can plot every nth step in
-the plot by setting the input `--steps=n`.
+the plot by setting the input `--steps=n`. For long simulations, the option
+`--raster` averages the speeds over a grid of time and position bins (of size
+`--dt` and `--dx`) instead of plotting every segment, so that neither the
+memory nor the plotting time depends on the number of samples.
 
 Note: This script assumes that the provided network has only one lane on the
-each edge, or one lane on the main highway in the case of MergeNetwork.
+each edge, or one lane on the main highway in the case of MergeNetwork. In the
+traffic light grid networks, every row and column is plotted separately.
 
 Usage
 -----
@@ -17,9 +21,11 @@ Usage
     python time_space_diagram.py </path/to/emission>.csv </path/to/params>.json
 """
 from flow.utils.rllib import get_flow_params
-from flow.networks import RingNetwork, FigureEightNetwork, MergeNetwork, I210SubNetwork, HighwayNetwork
+from flow.networks import RingNetwork, FigureEightNetwork, MergeNetwork, I210SubNetwork, HighwayNetwork, \
+    TrafficLightGridNetwork, GridnxmNetwork, GridnxmNetworkInflow, GridnxmNetworkExpand
 
 import argparse
+import re
 from collections import defaultdict
 try:
     from matplotlib import pyplot as plt
@@ -40,11 +46,76 @@ ACCEPTABLE_NETWORKS = [
     FigureEightNetwork,
     MergeNetwork,
     I210SubNetwork,
-    HighwayNetwork
+    HighwayNetwork,
+    TrafficLightGridNetwork,
+    GridnxmNetwork,
+    GridnxmNetworkInflow,
+    GridnxmNetworkExpand,
 ]
 
+# networks in which every row and column is plotted separately
+GRID_NETWORKS = [
+    TrafficLightGridNetwork,
+    GridnxmNetwork,
+    GridnxmNetworkInflow,
+    GridnxmNetworkExpand,
+]
+
+# columns of the trajectory file that are used to plot the diagrams, the other
+# ones are not read
+TRAJECTORY_COLUMNS = [
+    'time', 'id', 'x', 'y', 'speed', 'edge_id', 'lane_number',
+    'relative_position', 'distance',
+]
+
+# number of rows of the trajectory file read at once
+CHUNK_SIZE = 100000
+
+# edges of the merge that are plotted, the other ones are ghost edges
+MERGE_EDGES = {'inflow_merge', 'bottom', ':bottom_0'}
+
+# edges of the grid networks, e.g. "bot0_1" or "bot0_1_2" for the sub-edges
+GRID_EDGE = re.compile(r'^(top|bot|left|right)(\d+)_(\d+)')
+
+
+def iter_trajectory(fp, params=dict(), chunksize=CHUNK_SIZE):
+    r"""Read and preprocess the Flow trajectory (.csv) file in chunks.
+
+    Only the columns listed in TRAJECTORY_COLUMNS are read.
+
+    Parameters
+    ----------
+    fp : str
+        file path (for the .csv formatted file)
+    params : dict
+        flow-specific parameters, see import_data_from_trajectory
+    chunksize : int, optional
+        number of rows of every chunk
 
-def import_data_from_trajectory(fp, params=dict()):
+    Yields
+    ------
+    pd.DataFrame
+        the rows of a chunk, with their absolute position in the "distance"
+        column
+    """
+    # Convert column names for backwards compatibility using emissions csv
+    column_conversions = {
+        'time': 'time_step',
+        'lane_number': 'lane_id',
+    }
+
+    for df in pd.read_csv(fp, usecols=lambda c: c in TRAJECTORY_COLUMNS,
+                          dtype={'id': str, 'edge_id': str},
+                          chunksize=chunksize):
+        df = df.rename(columns=column_conversions)
+        # the positions in the grids are computed along every row and column,
+        # instead of along the route of the vehicles
+        if 'distance' not in df.columns or params.get('network') in GRID_NETWORKS:
+            df['distance'] = _get_abs_pos(df, params)
+        yield df
+
+
+def import_data_from_trajectory(fp, params=dict(), chunksize=CHUNK_SIZE):
     r"""Import and preprocess data from the Flow trajectory (.csv) file.
 
     Parameters
@@ -60,26 +131,26 @@ def import_data_from_trajectory(fp, params=dict()):
         * "net_params" (flow.core.params.NetParams): network-specific
           parameters. This is used to collect the lengths of various network
           links.
+    chunksize : int, optional
+        number of rows of the file read at once
 
     Returns
     -------
     pd.DataFrame
     """
     # Read trajectory csv into pandas dataframe
-    df = pd.read_csv(fp)
-
-    # Convert column names for backwards compatibility using emissions csv
-    column_conversions = {
-        'time': 'time_step',
-        'lane_number': 'lane_id',
-    }
-    df = df.rename(columns=column_conversions)
-    if 'distance' not in df.columns:
-        df['distance'] = _get_abs_pos(df, params)
+    df = pd.concat(iter_trajectory(fp, params, chunksize), ignore_index=True)
 
     # Compute line segment ends by shifting dataframe by 1 row
     df[['next_pos', 'next_time']] = df.groupby('id')[['distance', 'time_step']].shift(-1)
 
+    # In the grids, a segment ends in the row or column it starts in, even
+    # when the vehicle turns between two samples
+    if params.get('network') in GRID_NETWORKS:
+        corridor = _get_corridor(df['edge_id'])
+        next_corridor = corridor.groupby(df['id']).shift(-1)
+        df.loc[corridor != next_corridor, ['next_pos', 'next_time']] = np.nan
+
     # Remove nans from data
     df = df[df['next_time'].notna()]
 
@@ -112,7 +183,8 @@ def get_time_space_data(data, params):
 
         in the case of I210, the nested arrays are wrapped into a dict,
         keyed on the lane number, so that each lane can be plotted
-        separately.
+        separately. In the case of the grids, they are keyed on the row or
+        column, e.g. "row 0" or "column 2".
 
     Raises
     ------
@@ -131,6 +203,7 @@ def get_time_space_data(data, params):
         I210SubNetwork: _i210_subnetwork,
         HighwayNetwork: _highway,
     }
+    switcher.update({network: _grid for network in GRID_NETWORKS})
 
     # Get the function from switcher dictionary
     func = switcher[params['network']]
@@ -141,6 +214,182 @@ def get_time_space_data(data, params):
     return segs, data
 
 
+class SpeedRaster:
+    """Mean speeds of the vehicles over a grid of time and position bins.
+
+    The grid is extended as samples are added, and only holds the sum and the
+    number of the speeds in every bin, so that its size depends on the time
+    and position ranges but not on the number of samples.
+
+    Attributes
+    ----------
+    dt : float
+        duration of the time bins, in seconds
+    dx : float
+        length of the position bins, in meters
+    origin : (int, int)
+        indices of the first time and position bins of the grid, bin i
+        covering [i * dt, (i + 1) * dt) in time
+    sums : np.ndarray
+        sum of the speeds in every (position, time) bin
+    counts : np.ndarray
+        number of speeds in every (position, time) bin
+    """
+
+    def __init__(self, dt, dx):
+        """Instantiate an empty raster."""
+        self.dt = dt
+        self.dx = dx
+        self.origin = (0, 0)
+        self.sums = np.zeros((0, 0))
+        self.counts = np.zeros((0, 0), dtype=int)
+
+    @property
+    def speeds(self):
+        """Return the mean speed in every bin, nan in the empty bins."""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.counts > 0, self.sums / self.counts, np.nan)
+
+    @property
+    def extent(self):
+        """Return the time and position bounds of the grid.
+
+        Returns
+        -------
+        (float, float, float, float)
+            minimum and maximum times and positions, as expected by imshow
+        """
+        t0, x0 = self.origin
+        nx, nt = self.sums.shape
+        return (t0 * self.dt, (t0 + nt) * self.dt,
+                x0 * self.dx, (x0 + nx) * self.dx)
+
+    def add(self, times, positions, speeds):
+        """Add samples to the grid.
+
+        Parameters
+        ----------
+        times : np.ndarray
+            times of the samples
+        positions : np.ndarray
+            positions of the samples, those that are nan are ignored
+        speeds : np.ndarray
+            speeds of the samples
+        """
+        valid = np.isfinite(positions) & np.isfinite(speeds)
+        if not valid.any():
+            return
+        # rounded first so that e.g. 0.6 / 0.1 falls in bin 6
+        ti = np.floor(np.round(times[valid] / self.dt, 6)).astype(int)
+        xi = np.floor(np.round(positions[valid] / self.dx, 6)).astype(int)
+
+        self._extend(ti.min(), ti.max(), xi.min(), xi.max())
+        t0, x0 = self.origin
+        nx, nt = self.sums.shape
+        bins = (xi - x0) * nt + (ti - t0)
+        self.sums += np.bincount(
+            bins, weights=speeds[valid], minlength=nx * nt).reshape(nx, nt)
+        self.counts += np.bincount(bins, minlength=nx * nt).reshape(nx, nt)
+
+    def merge(self, other):
+        """Add the samples of another raster with the same bins."""
+        if other.counts.size == 0:
+            return
+        t0, x0 = other.origin
+        nx, nt = other.sums.shape
+        self._extend(t0, t0 + nt - 1, x0, x0 + nx - 1)
+        rows = slice(x0 - self.origin[1], x0 - self.origin[1] + nx)
+        cols = slice(t0 - self.origin[0], t0 - self.origin[0] + nt)
+        self.sums[rows, cols] += other.sums
+        self.counts[rows, cols] += other.counts
+
+    def _extend(self, t_min, t_max, x_min, x_max):
+        """Extend the grid so that it contains the given bins."""
+        t0, x0 = self.origin
+        nx, nt = self.sums.shape
+        if nx == 0:
+            t0, x0 = t_min, x_min
+            nt, nx = 0, 0
+        new_t0, new_x0 = min(t0, t_min), min(x0, x_min)
+        pad = ((x0 - new_x0, max(x0 + nx, x_max + 1) - x0 - nx),
+               (t0 - new_t0, max(t0 + nt, t_max + 1) - t0 - nt))
+        if any(p for bounds in pad for p in bounds):
+            if self.sums.size == 0:
+                shape = (pad[0][0] + pad[0][1], pad[1][0] + pad[1][1])
+                self.sums = np.zeros(shape)
+                self.counts = np.zeros(shape, dtype=int)
+            else:
+                self.sums = np.pad(self.sums, pad)
+                self.counts = np.pad(self.counts, pad)
+        self.origin = (new_t0, new_x0)
+
+
+def get_time_space_raster(fp, params, dt=1., dx=5., chunksize=CHUNK_SIZE):
+    r"""Compute the mean speeds over time and position bins.
+
+    The trajectory file is read one chunk at a time, so that the memory used
+    does not depend on its number of rows.
+
+    Parameters
+    ----------
+    fp : str
+        file path (for the .csv formatted file)
+    params : dict
+        flow-specific parameters, see get_time_space_data
+    dt : float, optional
+        duration of the time bins, in seconds
+    dx : float, optional
+        length of the position bins, in meters
+    chunksize : int, optional
+        number of rows of the file read at once
+
+    Returns
+    -------
+    SpeedRaster (or dict < str, SpeedRaster >)
+        the mean speeds. In the case of I210 and of the grids, the rasters
+        are wrapped into a dict keyed on the lanes, rows or columns, as the
+        segments of get_time_space_data.
+
+    Raises
+    ------
+    AssertionError
+        if the specified network is not supported by this method
+    """
+    network = params['network']
+    assert network in ACCEPTABLE_NETWORKS, \
+        'Network must be one of: ' + ', '.join([network.__name__ for network in ACCEPTABLE_NETWORKS])
+
+    rasters = defaultdict(lambda: SpeedRaster(dt, dx))
+    for df in iter_trajectory(fp, params, chunksize):
+        if network == MergeNetwork:
+            groups = [(None, df[df['edge_id'].isin(MERGE_EDGES)])]
+        elif network == I210SubNetwork:
+            # the lanes of the edges are only known to be offset by a ramp
+            # lane once all the data is read
+            groups = df.groupby(['lane_id', 'edge_id'])
+        elif network in GRID_NETWORKS:
+            groups = df.groupby(_get_corridor(df['edge_id']))
+        else:
+            groups = [(None, df)]
+
+        for key, group in groups:
+            rasters[key].add(group['time_step'].values,
+                             group['distance'].values,
+                             group['speed'].values)
+
+    if network == I210SubNetwork:
+        # Reset lane numbers that are offset by ramp lanes
+        offset_edges = {edge for lane, edge in rasters if lane == 5}
+        lanes = defaultdict(lambda: SpeedRaster(dt, dx))
+        for (lane, edge), raster in rasters.items():
+            lanes[lane - 1 if edge in offset_edges else lane].merge(raster)
+        return dict(lanes)
+    elif network in GRID_NETWORKS:
+        return dict(rasters)
+    else:
+        return rasters[None]
+
+
 def _merge(data):
     r"""Generate time and position data for the merge.
 
@@ -162,8 +411,7 @@ def _merge(data):
         modified trajectory dataframe
     """
     # Omit ghost edges
-    keep_edges = {'inflow_merge', 'bottom', ':bottom_0'}
-    data = data[data['edge_id'].isin(keep_edges)]
+    data = data[data['edge_id'].isin(MERGE_EDGES)]
 
     segs = data[['time_step', 'distance', 'next_time', 'next_pos']].values.reshape((len(data), 2, 2))
 
@@ -250,6 +498,65 @@ def _i210_subnetwork(data):
     return segs, data
 
 
+def _grid(data):
+    r"""Generate time and position data for the traffic light grids.
+
+    Every row and column of the grid is plotted separately, so the segments
+    are wrapped in a dictionary. The positions are the x coordinates of the
+    vehicles in the rows and their y coordinates in the columns. Vehicles in
+    the intersections are omitted.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        cleaned dataframe of the trajectory data
+
+    Returns
+    -------
+    dict < str, np.ndarray >
+        dictionary of 3d array (n_segments x 2 x 2) containing segments
+        to be plotted. the dictionary is keyed on rows and columns, e.g.
+        "row 0" or "column 2", with the values being the 3d array
+        representing the segments. every inner 2d array is comprised of two
+        1d arrays representing [start time, start distance] and [end time,
+        end distance] pairs.
+    pd.DataFrame
+        modified trajectory dataframe, with the row or column of every
+        sample in the "corridor" column
+    """
+    data = data.assign(corridor=_get_corridor(data['edge_id']))
+    data = data[data['corridor'].notna() & data['next_pos'].notna()]
+
+    segs = dict()
+    for corridor, df in data.groupby('corridor'):
+        segs[corridor] = df[['time_step', 'distance', 'next_time', 'next_pos']].values.reshape((len(df), 2, 2))
+
+    return segs, data
+
+
+def _get_corridor(edge_ids):
+    """Return the row or column of the grid containing each edge.
+
+    Parameters
+    ----------
+    edge_ids : pd.Series
+        ids of the edges
+
+    Returns
+    -------
+    pd.Series
+        "row {i}" for the horizontal edges, "column {j}" for the vertical
+        edges, and nan for the intersections
+    """
+    parts = edge_ids.astype(str).str.extract(GRID_EDGE)
+    horizontal = parts[0].isin(['top', 'bot'])
+    corridors = pd.Series(np.nan, index=edge_ids.index, dtype=object)
+    corridors[horizontal] = 'row ' + parts.loc[horizontal, 1]
+    vertical = parts[0].isin(['left', 'right'])
+    corridors[vertical] = 'column ' + parts.loc[vertical, 2]
+    return corridors
+
+
 def _figure_eight(data):
     r"""Generate time and position data for the figure eight.
 
@@ -352,6 +659,13 @@ def _get_abs_pos(df, params):
         }
     elif params['network'] == HighwayNetwork:
         return df['x']
+    elif params['network'] in GRID_NETWORKS:
+        # rows are horizontal and columns vertical, and the intersections
+        # belong to neither
+        corridors = _get_corridor(df['edge_id'])
+        rows = corridors.str.startswith('row', na=False)
+        columns = corridors.str.startswith('column', na=False)
+        return df['x'].where(rows, df['y'].where(columns))
     elif params['network'] == I210SubNetwork:
         edgestarts = {
             '119257914': -5.0999999999995795,
@@ -371,7 +685,7 @@ def _get_abs_pos(df, params):
     else:
         edgestarts = defaultdict(float)
 
-    ret = df.apply(lambda x: x['relative_position'] + edgestarts[x['edge_id']], axis=1)
+    ret = df['relative_position'] + df['edge_id'].map(edgestarts)
 
     if params['network'] == FigureEightNetwork:
         # reorganize data for space-time plot
@@ -460,6 +774,45 @@ def plot_tsd(ax, df, segs, args, lane=None, ghost_edges=None, ghost_bounds=None)
     cbar.ax.tick_params(labelsize=18)
 
 
+def plot_tsd_raster(ax, raster, args, title=None):
+    """Plot the time-space diagram from the mean speeds over bins.
+
+    Parameters
+    ----------
+    ax : matplotlib.axes.Axes
+        figure axes that will be plotted on
+    raster : SpeedRaster
+        mean speeds to be plotted
+    args : dict
+        parsed arguments
+    title : str, optional
+        plot title, default is "Time-Space Diagram"
+
+    Returns
+    -------
+    None
+    """
+    norm = plt.Normalize(args.min_speed, args.max_speed)
+
+    im = ax.imshow(raster.speeds, origin='lower', extent=raster.extent,
+                   aspect='auto', interpolation='nearest', cmap=my_cmap,
+                   norm=norm)
+
+    xmin = raster.extent[0]
+    if args.start > xmin:
+        ax.axvspan(xmin, args.start, facecolor='grey', alpha=0.5, zorder=20)
+
+    ax.set_title(title or 'Time-Space Diagram', fontsize=25)
+    ax.set_ylabel('Position (m)', fontsize=20)
+    ax.set_xlabel('Time (s)', fontsize=20)
+    plt.xticks(fontsize=18)
+    plt.yticks(fontsize=18)
+
+    cbar = plt.colorbar(im, ax=ax, norm=norm)
+    cbar.set_label('Velocity (m/s)', fontsize=20)
+    cbar.ax.tick_params(labelsize=18)
+
+
 if __name__ == '__main__':
     # create the parser
     parser = argparse.ArgumentParser(
@@ -485,6 +838,13 @@ if __name__ == '__main__':
                         help='The minimum speed in the color range.')
     parser.add_argument('--start', type=float, default=0,
                         help='initial time (in sec) in the plot.')
+    parser.add_argument('--raster', action='store_true',
+                        help='plot the mean speeds over time and position '
+                             'bins instead of every segment.')
+    parser.add_argument('--dt', type=float, default=1.,
+                        help='duration (in sec) of the time bins.')
+    parser.add_argument('--dx', type=float, default=5.,
+                        help='length (in m) of the position bins.')
 
     args = parser.parse_args()
 
@@ -503,30 +863,61 @@ if __name__ == '__main__':
     }
     my_cmap = colors.LinearSegmentedColormap('my_colormap', cdict, 1024)
 
-    # Read trajectory csv into pandas dataframe
-    traj_df = import_data_from_trajectory(args.trajectory_path, flow_params)
+    if args.raster:
+        # Average the speeds over bins while reading the trajectory csv
+        rasters = get_time_space_raster(
+            args.trajectory_path, flow_params, args.dt, args.dx)
+
+        if isinstance(rasters, dict):
+            fig = plt.figure(figsize=(16, 9*len(rasters)))
+
+            for i, key in enumerate(sorted(rasters)):
+                ax = plt.subplot(len(rasters), 1, i+1)
+                if flow_params['network'] == I210SubNetwork:
+                    title = 'Time-Space Diagram: Lane {}'.format(int(key+1))
+                else:
+                    title = 'Time-Space Diagram: {}'.format(key.capitalize())
+                plot_tsd_raster(ax, rasters[key], args, title)
+            plt.tight_layout()
+        else:
+            fig = plt.figure(figsize=(16, 9))
+            ax = plt.axes()
+            plot_tsd_raster(ax, rasters, args)
+    else:
+        # Read trajectory csv into pandas dataframe
+        traj_df = import_data_from_trajectory(args.trajectory_path, flow_params)
 
-    # Convert df data into segments for plotting
-    segs, traj_df = get_time_space_data(traj_df, flow_params)
+        # Convert df data into segments for plotting
+        segs, traj_df = get_time_space_data(traj_df, flow_params)
 
-    if flow_params['network'] == I210SubNetwork:
-        nlanes = traj_df['lane_id'].nunique()
-        fig = plt.figure(figsize=(16, 9*nlanes))
+        if flow_params['network'] == I210SubNetwork:
+            nlanes = traj_df['lane_id'].nunique()
+            fig = plt.figure(figsize=(16, 9*nlanes))
 
-        for lane, df in traj_df.groupby('lane_id'):
-            ax = plt.subplot(nlanes, 1, lane+1)
+            for lane, df in traj_df.groupby('lane_id'):
+                ax = plt.subplot(nlanes, 1, lane+1)
 
-            plot_tsd(ax, df, segs[lane], args, int(lane+1), ghost_edges={'ghost0', '119257908#3'})
-        plt.tight_layout()
-    else:
-        # perform plotting operation
-        fig = plt.figure(figsize=(16, 9))
-        ax = plt.axes()
+                plot_tsd(ax, df, segs[lane], args, int(lane+1), ghost_edges={'ghost0', '119257908#3'})
+            plt.tight_layout()
+        elif flow_params['network'] in GRID_NETWORKS:
+            ncorridors = len(segs)
+            fig = plt.figure(figsize=(16, 9*ncorridors))
+
+            for i, (corridor, df) in enumerate(traj_df.groupby('corridor')):
+                ax = plt.subplot(ncorridors, 1, i+1)
 
-        if flow_params['network'] == HighwayNetwork:
-            plot_tsd(ax, traj_df, segs, args, ghost_bounds=(500, 2300))
+                plot_tsd(ax, df, segs[corridor], args)
+                ax.set_title('Time-Space Diagram: {}'.format(corridor.capitalize()), fontsize=25)
+            plt.tight_layout()
         else:
-            plot_tsd(ax, traj_df, segs, args)
+            # perform plotting operation
+            fig = plt.figure(figsize=(16, 9))
+            ax = plt.axes()
+
+            if flow_params['network'] == HighwayNetwork:
+                plot_tsd(ax, traj_df, segs, args, ghost_bounds=(500, 2300))
+            else:
+                plot_tsd(ax, traj_df, segs, args)
 
     ###########################################################################
     #                       Note: For MergeNetwork only                       #
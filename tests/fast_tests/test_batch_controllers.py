@@ -0,0 +1,99 @@
+import unittest
+
+import numpy as np
+
+from flow.controllers import IDMController, OVMController, LinearOVM, \
+    CFMController, BCMController, LACController, GippsController, \
+    BandoFTLController, SimCarFollowingController, FollowerStopper
+from flow.controllers.batch import get_actions
+from flow.core.params import SumoParams, VehicleParams, \
+    SumoCarFollowingParams
+
+from tests.setup_scripts import grid_nxm_exp_setup
+
+FAILSAFES = ['instantaneous', 'safe_velocity', 'feasible_accel',
+             'obey_speed_limit']
+
+
+def grid_env():
+    """Create a grid with vehicles of every supported controller class."""
+    vehicles = VehicleParams()
+    controllers = [
+        (IDMController, {"noise": 0.2, "fail_safe": FAILSAFES}),
+        (IDMController, {"v0": 20, "T": 2, "noise": 0.1}),
+        (OVMController, {"fail_safe": "feasible_accel"}),
+        (LinearOVM, {"fail_safe": ["safe_velocity", "instantaneous"]}),
+        (CFMController, {"noise": 0.3}),
+        (BCMController, {"fail_safe": "obey_speed_limit"}),
+        (LACController, {}),
+        (GippsController, {"fail_safe": "feasible_accel"}),
+        (BandoFTLController, {"want_max_accel": True}),
+        (SimCarFollowingController, {}),
+        (FollowerStopper, {"v_des": 5}),
+    ]
+    for i, controller in enumerate(controllers):
+        vehicles.add(
+            veh_id="veh{}_".format(i),
+            acceleration_controller=controller,
+            car_following_params=SumoCarFollowingParams(
+                accel=2.6, decel=7.5, speed_mode="obey_safe_speed"),
+            num_vehicles=2)
+
+    env, _, _ = grid_nxm_exp_setup(
+        sim_params=SumoParams(sim_step=0.1, render=False),
+        vehicles=vehicles,
+        inner_length=300,
+        speed_limit=15)
+    return env
+
+
+class TestBatchControllers(unittest.TestCase):
+    """Tests the batched computation of the controller actions."""
+
+    def setUp(self):
+        self.env = grid_env()
+
+    def tearDown(self):
+        self.env.terminate()
+
+    def test_same_as_get_action(self):
+        kv = self.env.k.vehicle
+        metrics = [(noise, failsafe) for noise in (False, True)
+                   for failsafe in (False, True)]
+
+        for _ in range(50):
+            self.env.step(None)
+            veh_ids = kv.get_controlled_ids()
+
+            # the state of the LAC controllers is updated by both methods
+            lac_state = {veh_id: kv.get_acc_controller(veh_id).a
+                         for veh_id in veh_ids
+                         if isinstance(kv.get_acc_controller(veh_id),
+                                       LACController)}
+
+            np.random.seed(0)
+            actions = get_actions(self.env, veh_ids)
+            stored = [[kv.get_accel(veh_id, *m) for m in metrics]
+                      for veh_id in veh_ids]
+
+            for veh_id, a in lac_state.items():
+                kv.get_acc_controller(veh_id).a = a
+
+            np.random.seed(0)
+            expected = [kv.get_acc_controller(veh_id).get_action(self.env)
+                        for veh_id in veh_ids]
+            expected_stored = [[kv.get_accel(veh_id, *m) for m in metrics]
+                               for veh_id in veh_ids]
+
+            self.assertListEqual([a is None for a in actions],
+                                 [a is None for a in expected])
+            np.testing.assert_array_almost_equal(
+                np.array(actions, dtype=float),
+                np.array(expected, dtype=float))
+            np.testing.assert_array_almost_equal(
+                np.array(stored, dtype=float),
+                np.array(expected_stored, dtype=float))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+
+import numpy as np
+
+from flow.controllers import IDMController
+from flow.controllers.routing_controllers import MinicityRouter
+from flow.core.params import InitialConfig, VehicleParams
+
+from tests.setup_scripts import grid_nxm_exp_setup
+
+
+def grid_env():
+    """Create a small grid environment."""
+    vehicles = VehicleParams()
+    vehicles.add(
+        veh_id="idm",
+        acceleration_controller=(IDMController, {}),
+        routing_controller=(MinicityRouter, {}),
+        num_vehicles=20)
+
+    env, _, _ = grid_nxm_exp_setup(
+        vehicles=vehicles,
+        initial_config=InitialConfig(spacing="random", min_gap=5))
+    return env
+
+
+class TestEdgeStats(unittest.TestCase):
+    """Tests the subscribed edge data of the TraCI network kernel."""
+
+    def test_same_as_getters(self):
+        """Check that the edge data matches the per-edge TraCI getters."""
+        env = grid_env()
+        edge_api = env.k.kernel_api.edge
+        edges = env.k.network.get_edge_list()
+
+        for _ in range(20):
+            env.step(None)
+            stats = env.k.network.get_edge_stats()
+            self.assertEqual(stats.shape, (len(edges), 4))
+
+            expected = np.array([
+                [edge_api.getLastStepVehicleNumber(edge),
+                 edge_api.getLastStepMeanSpeed(edge),
+                 edge_api.getCO2Emission(edge),
+                 edge_api.getLastStepOccupancy(edge)]
+                for edge in edges])
+            np.testing.assert_allclose(stats, expected)
+
+            # the counts and speeds are consistent with the vehicle kernel
+            for i, edge in enumerate(edges):
+                ids = env.k.vehicle.get_ids_by_edge(edge)
+                self.assertEqual(stats[i, 0], len(ids))
+                if len(ids) > 0:
+                    self.assertAlmostEqual(
+                        stats[i, 1], np.mean(env.k.vehicle.get_speed(ids)))
+
+        env.terminate()
+
+
+if __name__ == '__main__':
+    unittest.main()
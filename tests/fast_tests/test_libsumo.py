@@ -0,0 +1,113 @@
+import random
+import unittest
+
+import numpy as np
+
+from flow.controllers import IDMController
+from flow.controllers.routing_controllers import MinicityRouter
+from flow.core.kernel.simulation.traci import libsumo
+from flow.core.params import SumoParams, InitialConfig
+from flow.core.params import VehicleParams, SumoCarFollowingParams
+from flow.utils.exceptions import FatalFlowError
+
+from tests.setup_scripts import grid_nxm_exp_setup
+
+NUM_STEPS = 50
+
+
+def grid_env(use_libsumo, render=False):
+    """Create a small grid environment with a given simulator backend."""
+    vehicles = VehicleParams()
+    vehicles.add(
+        veh_id="idm",
+        acceleration_controller=(IDMController, {}),
+        routing_controller=(MinicityRouter, {}),
+        car_following_params=SumoCarFollowingParams(
+            speed_mode="all_checks",
+            min_gap=2.5,
+        ),
+        num_vehicles=20)
+
+    sim_params = SumoParams(
+        sim_step=0.5,
+        render=render,
+        print_warnings=False,
+        seed=0,
+        use_libsumo=use_libsumo)
+
+    env, _, _ = grid_nxm_exp_setup(
+        sim_params=sim_params,
+        vehicles=vehicles,
+        initial_config=InitialConfig(spacing="random", min_gap=5),
+        row_num=3,
+        col_num=3)
+    return env
+
+
+def rollout(use_libsumo):
+    """Return the trajectories of all vehicles over a short rollout."""
+    np.random.seed(0)
+    random.seed(0)
+    env = grid_env(use_libsumo)
+
+    trajectories = []
+    for _ in range(NUM_STEPS):
+        env.step(None)
+        veh_ids = sorted(env.k.vehicle.get_ids())
+        trajectories.append([
+            (veh_id,
+             env.k.vehicle.get_edge(veh_id),
+             env.k.vehicle.get_lane(veh_id),
+             env.k.vehicle.get_position(veh_id),
+             env.k.vehicle.get_speed(veh_id),
+             env.k.vehicle.get_leader(veh_id),
+             env.k.vehicle.get_headway(veh_id))
+            for veh_id in veh_ids
+        ])
+    env.terminate()
+    return trajectories
+
+
+@unittest.skipIf(libsumo is None, "libsumo is not installed")
+class TestLibsumo(unittest.TestCase):
+    """Tests the in-process libsumo simulator backend."""
+
+    def test_parity_with_traci(self):
+        """Check that both backends produce identical trajectories."""
+        traci_traj = rollout(use_libsumo=False)
+        libsumo_traj = rollout(use_libsumo=True)
+
+        self.assertEqual(len(traci_traj), len(libsumo_traj))
+        for t, (expected, actual) in enumerate(zip(traci_traj, libsumo_traj)):
+            self.assertListEqual(expected, actual, msg="step {}".format(t))
+
+    def test_no_port(self):
+        """Check that no port is allocated for in-process simulations."""
+        env = grid_env(use_libsumo=True)
+        self.assertIsNone(env.sim_params.port)
+        self.assertIsNone(env.k.simulation.sumo_proc)
+        env.terminate()
+
+    def test_one_simulation_per_process(self):
+        """Check that a second libsumo simulation raises an error."""
+        env = grid_env(use_libsumo=True)
+        env.step(None)
+        time = env.k.kernel_api.simulation.getTime()
+        self.assertRaises(FatalFlowError, grid_env, use_libsumo=True)
+        # the first simulation was left untouched
+        self.assertEqual(env.k.kernel_api.simulation.getTime(), time)
+        env.step(None)
+        env.terminate()
+
+        # once closed, another simulation can be started
+        env = grid_env(use_libsumo=True)
+        env.terminate()
+
+    def test_render_not_supported(self):
+        """Check that rendering with libsumo raises an error."""
+        self.assertRaises(FatalFlowError, grid_env,
+                          use_libsumo=True, render=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
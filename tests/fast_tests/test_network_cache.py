@@ -0,0 +1,89 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from flow.core.kernel.network import TraCIKernelNetwork
+from flow.core.kernel.network import traci as network_traci
+from flow.core.params import SumoParams, VehicleParams
+
+from tests.setup_scripts import grid_nxm_network
+
+
+def grid_network(name, inner_length=100):
+    """Create a small grid network."""
+    vehicles = VehicleParams()
+    vehicles.add(veh_id="idm", num_vehicles=1)
+    return grid_nxm_network(
+        name=name, vehicles=vehicles, inner_length=inner_length)
+
+
+class TestNetworkCache(unittest.TestCase):
+    """Tests the cache of .net.xml files of the TraCI network kernel."""
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.sim_params = SumoParams(net_cache_dir=self.cache_dir)
+        self.kernels = []
+
+    def tearDown(self):
+        for kernel in self.kernels:
+            kernel.close()
+        shutil.rmtree(self.cache_dir)
+
+    def generate(self, network):
+        kernel = TraCIKernelNetwork(None, self.sim_params)
+        kernel.generate_network(network)
+        self.kernels.append(kernel)
+        return kernel
+
+    def test_identical_networks_share_entry(self):
+        """Check that identical networks reuse the cached .net.xml file."""
+        k1 = self.generate(grid_network("test_cache_1"))
+        k2 = self.generate(grid_network("test_cache_2"))
+
+        # a single entry is created and linked to both networks
+        entries = os.listdir(self.cache_dir)
+        self.assertEqual(len(entries), 1)
+        cached = os.stat(os.path.join(self.cache_dir, entries[0]))
+        for kernel in (k1, k2):
+            net = os.stat(kernel.cfg_path + kernel.netfn)
+            self.assertEqual(net.st_ino, cached.st_ino)
+
+        self.assertDictEqual(k1._edges, k2._edges)
+        self.assertDictEqual(k1._connections, k2._connections)
+
+    def test_different_networks(self):
+        """Check that different networks have different entries."""
+        k1 = self.generate(grid_network("test_cache_1", inner_length=100))
+        k2 = self.generate(grid_network("test_cache_2", inner_length=150))
+
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+        self.assertNotEqual(k1.edge_length("bot0_1_0"),
+                            k2.edge_length("bot0_1_0"))
+
+    def test_close_keeps_entry(self):
+        """Check that closing a network does not delete the cache entry."""
+        kernel = self.generate(grid_network("test_cache_1"))
+        kernel.close()
+        self.kernels.remove(kernel)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+    def test_no_temporary_files(self):
+        """Check that the temporary .net.xml files are not left behind."""
+        self.generate(grid_network("test_cache_1"))
+        self.assertFalse([fn for fn in os.listdir(self.cache_dir)
+                          if fn.endswith('.tmp')])
+
+    def test_netconvert_version(self):
+        """Check that another netconvert version has another entry."""
+        self.generate(grid_network("test_cache_1"))
+        with mock.patch.object(network_traci, '_netconvert_version',
+                               b'netconvert 0.0.0'):
+            self.generate(grid_network("test_cache_2"))
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
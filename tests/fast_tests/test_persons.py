@@ -0,0 +1,58 @@
+import unittest
+
+from tests.setup_scripts import grid_nxm_exp_setup
+
+
+class TestTraCIPerson(unittest.TestCase):
+    """Tests the subscriptions of the TraCI person kernel."""
+
+    def setUp(self):
+        self.env, _, _ = grid_nxm_exp_setup()
+
+    def tearDown(self):
+        self.env.terminate()
+
+    def test_same_as_getters(self):
+        """Check that the person data matches the TraCI getters."""
+        person_api = self.env.k.kernel_api.person
+        for i in range(12):
+            # persons waiting for a taxi that never comes
+            self.env.k.person.add_request(
+                "per_{}".format(i), "bot0_1_0", "top1_1_0", 10)
+            self.env.step(None)
+
+            self.assertListEqual(
+                list(self.env.k.person.get_ids()),
+                list(person_api.getIDList()))
+            for per_id in self.env.k.person.get_ids():
+                self.assertEqual(self.env.k.person.get_waiting_time(per_id),
+                                 person_api.getWaitingTime(per_id))
+                self.assertEqual(self.env.k.person.get_position(per_id),
+                                 person_api.getLanePosition(per_id))
+                self.assertEqual(self.env.k.person.get_lane(per_id),
+                                 person_api.getLaneID(per_id))
+                self.assertEqual(self.env.k.person.get_2d_position(per_id),
+                                 person_api.getPosition(per_id))
+
+        self.assertEqual(len(self.env.k.person.get_ids()), 12)
+        self.assertCountEqual(self.env.k.person.get_waiting_ids(),
+                              self.env.k.person.get_ids())
+        self.assertEqual(self.env.k.person.get_driving_ids(), [])
+
+    def test_arrived_persons(self):
+        """Check that persons that leave the network are removed."""
+        for i in range(3):
+            self.env.k.person.add_request(
+                "per_{}".format(i), "bot0_1_0", "top1_1_0", 10)
+        self.env.step(None)
+        self.assertEqual(len(self.env.k.person.get_ids()), 3)
+
+        self.env.k.kernel_api.person.remove("per_1")
+        self.env.step(None)
+        self.assertListEqual(
+            list(self.env.k.person.get_ids()), ["per_0", "per_2"])
+        self.assertEqual(self.env.k.person.num_persons, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+
+import numpy as np
+
+from tests.setup_scripts import grid_nxm_exp_setup
+
+
+class TestShortestPaths(unittest.TestCase):
+    """Tests the routes computed by the TraCI network kernel."""
+
+    def setUp(self):
+        self.env, _, _ = grid_nxm_exp_setup(
+            row_num=3, col_num=3, horizontal_lanes=2, vertical_lanes=2)
+
+    def tearDown(self):
+        self.env.terminate()
+
+    def route(self, predecessors, i, j):
+        route = [j]
+        while route[-1] != i:
+            route.append(predecessors[i, route[-1]])
+        return route[::-1]
+
+    def test_same_as_sumo(self):
+        """Check that the routes are as fast as the ones of sumo's router."""
+        edges = self.env.k.network.get_edge_list()
+        travel_times, predecessors = self.env.k.network.get_shortest_paths()
+        self.assertEqual(travel_times.shape, (len(edges), len(edges)))
+
+        for i, from_edge in enumerate(edges):
+            for j, to_edge in enumerate(edges):
+                route = self.env.k.kernel_api.simulation.findRoute(
+                    from_edge, to_edge)
+                if len(route.edges) == 0:
+                    self.assertEqual(travel_times[i, j], np.inf)
+                    self.assertEqual(predecessors[i, j], -1)
+                    continue
+
+                # sumo also includes the travel time of the last edge
+                last_edge = route.travelTime - travel_times[i, j]
+                self.assertAlmostEqual(
+                    last_edge,
+                    self.env.k.network.edge_length(to_edge) /
+                    self.env.k.network.speed_limit(to_edge), places=3)
+                self.assertEqual(
+                    len(self.route(predecessors, i, j)), len(route.edges))
+
+    def test_route_oracle(self):
+        """Check the routes of the route oracle and its counters."""
+        oracle = self.env.k.network.route_oracle
+        edges = self.env.k.network.get_edge_list()
+        for from_edge in edges:
+            for to_edge in edges:
+                route = oracle.find_route(from_edge, to_edge)
+                expected = self.env.k.kernel_api.simulation.findRoute(
+                    from_edge, to_edge).edges
+                self.assertEqual(len(route), len(expected))
+                if len(route) > 0:
+                    self.assertEqual(route[0], from_edge)
+                    self.assertEqual(route[-1], to_edge)
+        self.assertEqual(oracle.hits, len(edges) ** 2)
+        self.assertEqual(oracle.misses, 0)
+
+        # routes from internal edges are requested from sumo once
+        internal_edge = self.env.k.network.get_junction_list()[0]
+        expected = self.env.k.kernel_api.simulation.findRoute(
+            internal_edge, edges[0]).edges
+        for _ in range(2):
+            self.assertEqual(
+                oracle.find_route(internal_edge, edges[0]), tuple(expected))
+        self.assertEqual(oracle.misses, 1)
+        self.assertEqual(oracle.cache_hits, 1)
+        self.assertAlmostEqual(
+            oracle.hit_rate, (len(edges) ** 2 + 1) / (len(edges) ** 2 + 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import os
+import unittest
+
+from flow.controllers import IDMController
+from flow.controllers.routing_controllers import MinicityRouter
+from flow.core.params import SumoParams, InitialConfig, VehicleParams
+
+from tests.setup_scripts import grid_nxm_exp_setup
+
+
+def grid_env(snapshot_reset):
+    """Create a small grid environment."""
+    vehicles = VehicleParams()
+    vehicles.add(
+        veh_id="idm",
+        acceleration_controller=(IDMController, {}),
+        routing_controller=(MinicityRouter, {}),
+        num_vehicles=10)
+
+    sim_params = SumoParams(
+        sim_step=0.5,
+        render=False,
+        print_warnings=False,
+        snapshot_reset=snapshot_reset)
+
+    env, _, _ = grid_nxm_exp_setup(
+        sim_params=sim_params,
+        vehicles=vehicles,
+        initial_config=InitialConfig(spacing="random", min_gap=5))
+    return env
+
+
+class TestSnapshotReset(unittest.TestCase):
+    """Tests resetting the environment from a saved simulation state."""
+
+    def test_reuses_sumo_instance(self):
+        """Check that later resets restore the snapshot in-process."""
+        env = grid_env(snapshot_reset=True)
+        snapshot = env.k.simulation.snapshot
+        sumo_proc = env.k.simulation.sumo_proc
+        self.assertTrue(os.path.isfile(snapshot))
+
+        for _ in range(3):
+            for _ in range(20):
+                env.step(None)
+            env.reset()
+
+            # the same sumo instance is used, and its clock is rewound
+            self.assertIs(env.k.simulation.sumo_proc, sumo_proc)
+            self.assertEqual(env.k.kernel_api.simulation.getTime(), 2.0 * 0.5)
+            self.assertEqual(env.time_counter, 0)
+
+            # all initial vehicles are re-introduced
+            self.assertCountEqual(env.k.vehicle.get_ids(), env.initial_ids)
+            for veh_id in env.initial_ids:
+                self.assertEqual(env.k.vehicle.get_speed(veh_id), 0)
+
+        # the snapshot is removed with the simulation
+        env.terminate()
+        self.assertFalse(os.path.isfile(snapshot))
+
+    def test_disabled_by_default(self):
+        """Check that no snapshot is saved unless requested."""
+        env = grid_env(snapshot_reset=False)
+        env.reset()
+        self.assertIsNone(env.k.simulation.snapshot)
+        env.terminate()
+
+
+if __name__ == '__main__':
+    unittest.main()
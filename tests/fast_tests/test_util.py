@@ -3,6 +3,11 @@ import csv
 import os
 import json
 import collections
+import tempfile
+from multiprocessing import Pool
+from unittest import mock
+
+import numpy as np
 
 from flow.envs import AccelEnv
 from flow.networks import FigureEightNetwork
@@ -11,7 +16,10 @@ from flow.core.params import TrafficLightParams
 from flow.controllers import IDMController, ContinuousRouter, RLController
 from flow.core.params import SumoParams, EnvParams, NetParams, InitialConfig, \
     InFlows, SumoCarFollowingParams
-from flow.core.util import emission_to_csv
+from flow.core.util import emission_to_csv, reserve_port
+from flow.core.emission import EmissionRecorder, load_emission
+from flow.core import emission
+from flow.utils.exceptions import FatalFlowError
 from flow.envs import MergePOEnv
 from flow.networks import MergeNetwork
 from flow.utils.registry import make_create_env
@@ -58,6 +66,150 @@ class TestEmissionToCSV(unittest.TestCase):
         # I don't think is a problem
         self.assertEqual(len(dict1), 104)
 
+    def test_chunks(self):
+        current_path = os.path.realpath(__file__).rsplit("/", 1)[0]
+        emission_path = current_path + "/test_files/test-emission.xml"
+        out_dir = tempfile.mkdtemp()
+
+        # the output does not depend on the number of rows written at once
+        outputs = []
+        for chunk_size in [1, 7, 10000]:
+            output_path = os.path.join(out_dir, "{}.csv".format(chunk_size))
+            self.assertEqual(
+                emission_to_csv(emission_path, output_path, chunk_size),
+                output_path)
+            with open(output_path) as f:
+                outputs.append(f.read())
+            os.remove(output_path)
+        os.rmdir(out_dir)
+
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertEqual(outputs[0], outputs[2])
+
+
+class TestEmissionRecorder(unittest.TestCase):
+    """Tests the columnar emission recorder."""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "test_emission.npz")
+
+    def tearDown(self):
+        for name in os.listdir(self.dir):
+            os.remove(os.path.join(self.dir, name))
+        os.rmdir(self.dir)
+
+    def _record(self, recorder, num_steps):
+        for t in range(num_steps):
+            recorder.append({
+                "time": [0.1 * t] * 3,
+                "id": ["idm_0", "idm_1", "rl_0"],
+                "speed": [t, t + 1, t + 2],
+                "leader_id": ["idm_1", None, "idm_0"],
+                "lane_number": [0, 1, 0],
+                "target_accel_with_noise_with_failsafe": [None, 1.5, 0.5],
+            })
+
+    def test_chunks(self):
+        fields = ["speed", "leader_id", "lane_number",
+                  "target_accel_with_noise_with_failsafe"]
+        recorder = EmissionRecorder(self.path, fields=fields, chunk_size=4)
+        self._record(recorder, 5)
+
+        # full chunks are written as soon as they are filled
+        self.assertEqual(recorder.num_chunks, 3)
+        self.assertEqual(recorder.num_rows, 3)
+        self.assertEqual(recorder.close(), self.path)
+
+        data = load_emission(self.path)
+        self.assertListEqual(list(data.keys()), ["time", "id"] + fields)
+        self.assertEqual(len(data["id"]), 15)
+        self.assertListEqual(data["id"][:4].tolist(),
+                             ["idm_0", "idm_1", "rl_0", "idm_0"])
+        self.assertListEqual(data["speed"][-3:].tolist(), [4, 5, 6])
+        self.assertListEqual(data["leader_id"][:3].tolist(),
+                             ["idm_1", "", "idm_0"])
+        self.assertEqual(data["lane_number"].dtype.kind, "i")
+        self.assertTrue(np.isnan(
+            data["target_accel_with_noise_with_failsafe"][0]))
+
+        # only the requested columns are read
+        data = load_emission(self.path, fields=["id", "speed"])
+        self.assertListEqual(list(data.keys()), ["id", "speed"])
+
+    def test_emission_to_csv(self):
+        fields = ["speed", "leader_id", "target_accel_with_noise_with_failsafe"]
+        recorder = EmissionRecorder(self.path, fields=fields, chunk_size=4)
+        self._record(recorder, 2)
+        recorder.close()
+
+        csv_path = emission.emission_to_csv(self.path)
+        self.assertEqual(csv_path, self.path[:-3] + "csv")
+        with open(csv_path) as f:
+            rows = list(csv.reader(f))
+        self.assertListEqual(rows[0], ["time", "id"] + fields)
+        self.assertListEqual(rows[1:4], [
+            ["0.0", "idm_0", "0.0", "idm_1", ""],
+            ["0.0", "idm_1", "1.0", "", "1.5"],
+            ["0.0", "rl_0", "2.0", "idm_0", "0.5"],
+        ])
+        self.assertEqual(len(rows), 7)
+
+    def test_emissions_to_csv(self):
+        paths = []
+        for i in range(3):
+            path = os.path.join(self.dir, "test_emission_{}.npz".format(i))
+            recorder = EmissionRecorder(path, fields=["speed"])
+            self._record(recorder, i + 1)
+            recorder.close()
+            paths.append(path)
+
+        # the files are converted in separate processes
+        csv_paths = emission.emissions_to_csv(paths, num_workers=2)
+        self.assertListEqual(csv_paths, [path[:-3] + "csv" for path in paths])
+        for i, csv_path in enumerate(csv_paths):
+            with open(csv_path) as f:
+                self.assertEqual(len(list(csv.reader(f))), 3 * (i + 1) + 1)
+
+    def test_empty(self):
+        recorder = EmissionRecorder(self.path)
+        self.assertIsNone(recorder.close())
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_errors(self):
+        self.assertRaises(FatalFlowError, EmissionRecorder, self.path,
+                          fields=["speed", "co2"])
+        self.assertRaises(FatalFlowError, EmissionRecorder, self.path,
+                          fmt="hdf5")
+        with mock.patch.object(emission, "pyarrow", None):
+            self.assertRaises(FatalFlowError, EmissionRecorder, self.path,
+                              fmt="parquet")
+
+
+class TestReservePort(unittest.TestCase):
+    """Tests the reserve_port function."""
+
+    def setUp(self):
+        self.registry_path = os.path.join(tempfile.mkdtemp(), 'ports')
+
+    def test_lease(self):
+        # a port found free again is skipped while it is leased
+        with mock.patch('sumolib.miscutils.getFreeSocketPort',
+                        side_effect=[5000, 5000, 5001, 5000]):
+            self.assertEqual(reserve_port(registry_path=self.registry_path),
+                             5000)
+            self.assertEqual(reserve_port(registry_path=self.registry_path),
+                             5001)
+            self.assertEqual(reserve_port(lease_time=0,
+                                          registry_path=self.registry_path),
+                             5000)
+
+    def test_concurrent_processes(self):
+        with Pool(8) as pool:
+            ports = pool.starmap(reserve_port,
+                                 [(60., self.registry_path)] * 64)
+        self.assertEqual(len(set(ports)), 64)
+
 
 class TestRegistry(unittest.TestCase):
     """Tests the methods located in flow/utils/registry.py"""
@@ -1,6 +1,8 @@
 import unittest
+from unittest import mock
 import os
 import numpy as np
+from traci.exceptions import TraCIException
 
 from flow.core.params import VehicleParams
 from flow.core.params import SumoCarFollowingParams, NetParams, \
@@ -10,7 +12,8 @@ from flow.controllers.car_following_models import IDMController, \
 from flow.controllers.lane_change_controllers import StaticLaneChanger
 from flow.controllers.rlcontroller import RLController
 
-from tests.setup_scripts import ring_road_exp_setup, highway_exp_setup
+from tests.setup_scripts import ring_road_exp_setup, highway_exp_setup, \
+    grid_nxm_exp_setup
 
 os.environ["TEST_FLAG"] = "True"
 
@@ -600,5 +603,164 @@ class TestObservedIDs(unittest.TestCase):
         self.assertCountEqual(env.k.vehicle.get_observed_ids(), ["test_1"])
 
 
+def grid_env(**kwargs):
+    """Create a small grid with IDM vehicles.
+
+    The keyword arguments are passed to SumoParams.
+    """
+    vehicles = VehicleParams()
+    vehicles.add(
+        veh_id="idm",
+        acceleration_controller=(IDMController, {}),
+        car_following_params=SumoCarFollowingParams(
+            speed_mode="obey_safe_speed"),
+        num_vehicles=10)
+
+    sim_params = SumoParams(sim_step=0.1, render=False, **kwargs)
+
+    env, _, _ = grid_nxm_exp_setup(
+        sim_params=sim_params,
+        vehicles=vehicles,
+        inner_length=300,
+        speed_limit=15)
+    return env
+
+
+class TestCommandBuffer(unittest.TestCase):
+    """Tests the buffering of the setter commands sent to sumo."""
+
+    def test_same_trajectories(self):
+        # the buffered commands lead to the same simulation
+        positions = []
+        for buffer_commands in (False, True):
+            env = grid_env(buffer_commands=buffer_commands)
+            for _ in range(50):
+                env.step(None)
+            ids = sorted(env.k.vehicle.get_ids())
+            positions.append(env.k.vehicle.get_position(ids))
+            env.terminate()
+
+        np.testing.assert_array_almost_equal(positions[0], positions[1])
+
+    def test_elided_commands(self):
+        env = grid_env(buffer_commands=True)
+        kv = env.k.vehicle
+        veh_id = kv.get_ids()[0]
+        issued, elided = kv.get_command_counts()
+
+        # only the last color is sent during a step
+        kv.set_color(veh_id, (255, 0, 0))
+        kv.set_color(veh_id, (0, 255, 0))
+        self.assertTupleEqual(kv.get_command_counts(), (issued, elided + 1))
+        env.step(None)
+        issued, elided = kv.get_command_counts()
+        self.assertEqual(kv.get_color(veh_id), (0, 255, 0))
+
+        # unchanged colors and maximum speeds are not sent again
+        kv.set_color(veh_id, (0, 255, 0))
+        kv.set_max_speed(veh_id, 10)
+        env.k.simulation.simulation_step()
+        kv.set_max_speed(veh_id, 10)
+        env.k.simulation.simulation_step()
+        self.assertTupleEqual(kv.get_command_counts(),
+                              (issued + 1, elided + 2))
+        self.assertEqual(kv.get_max_speed(veh_id), 10)
+
+        # the last route sent is not sent again
+        edge = kv.get_edge(veh_id)
+        junction = env.k.network.next_edge(edge, 0)[0][0]
+        route = [edge, env.k.network.next_edge(junction, 0)[0][0]]
+        kv.choose_routes(veh_id, route)
+        env.k.simulation.simulation_step()
+        env.k.update(reset=False)
+        kv.choose_routes(veh_id, route)
+        env.k.simulation.simulation_step()
+        env.k.update(reset=False)
+        self.assertTupleEqual(kv.get_command_counts(),
+                              (issued + 2, elided + 3))
+
+        # unless sumo reports another route since
+        env.k.kernel_api.vehicle.setRoute(veh_id, [edge])
+        env.k.simulation.simulation_step()
+        env.k.update(reset=False)
+        kv.choose_routes(veh_id, route)
+        env.k.simulation.simulation_step()
+        env.k.update(reset=False)
+        self.assertTupleEqual(kv.get_command_counts(),
+                              (issued + 3, elided + 3))
+        self.assertListEqual(list(kv.get_route(veh_id)), list(route))
+
+        # commands of removed vehicles are dropped
+        kv.set_color(veh_id, (0, 0, 255))
+        kv.remove(veh_id)
+        env.k.simulation.simulation_step()
+        self.assertTupleEqual(kv.get_command_counts(),
+                              (issued + 3, elided + 3))
+        env.terminate()
+
+
+class TestVehicleColors(unittest.TestCase):
+    """Tests the update of the vehicle colors when rendering."""
+
+    def test_colors(self):
+        env = grid_env()
+        kv = env.k.vehicle
+        ids = kv.get_ids()
+
+        kv.update_vehicle_colors()
+        issued, _ = kv.get_command_counts()
+        for veh_id in ids:
+            self.assertEqual(kv.get_color(veh_id), (255, 255, 255))
+
+        # only the vehicles whose color changed are updated
+        kv.update_vehicle_colors()
+        self.assertEqual(kv.get_command_counts()[0], issued)
+        kv.set_observed(ids[0])
+        kv.set_observed(ids[1])
+        kv.update_vehicle_colors()
+        self.assertEqual(kv.get_command_counts()[0], issued + 2)
+        self.assertEqual(kv.get_color(ids[0]), (0, 255, 255))
+        self.assertListEqual(kv.get_observed_ids(), [])
+
+        # observed vehicles return to white once no longer observed
+        kv.update_vehicle_colors()
+        self.assertEqual(kv.get_command_counts()[0], issued + 4)
+        self.assertEqual(kv.get_color(ids[0]), (255, 255, 255))
+        env.terminate()
+
+    def test_failed_colors(self):
+        env = grid_env(buffer_commands=True)
+        kv = env.k.vehicle
+        ids = kv.get_ids()
+
+        # the colors that sumo failed to set are sent again
+        with mock.patch.object(env.k.kernel_api.vehicle, "setColor",
+                               side_effect=TraCIException("failed")):
+            kv.update_vehicle_colors()
+            env.k.simulation.simulation_step()
+        issued, _ = kv.get_command_counts()
+        kv.update_vehicle_colors()
+        env.k.simulation.simulation_step()
+        self.assertEqual(kv.get_command_counts()[0], issued + len(ids))
+        for veh_id in ids:
+            self.assertEqual(kv.get_color(veh_id), (255, 255, 255))
+        env.terminate()
+
+    def test_color_by_speed(self):
+        env = grid_env(color_by_speed=True)
+        for _ in range(20):
+            env.step(None)
+        kv = env.k.vehicle
+        kv.update_vehicle_colors()
+
+        max_speed = env.k.network.max_speed()
+        speed_ranges = np.linspace(0, max_speed, 10)
+        for veh_id in kv.get_ids():
+            i = np.digitize(kv.get_speed(veh_id), speed_ranges)
+            self.assertEqual(kv.get_color(veh_id),
+                             (int(255 - 25.5 * i), int(25.5 * i), 0))
+        env.terminate()
+
+
 if __name__ == '__main__':
     unittest.main()
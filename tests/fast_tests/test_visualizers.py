@@ -5,6 +5,7 @@ import flow.visualize.time_space_diagram as tsd
 import flow.visualize.plot_ray_results as prr
 
 import os
+import tempfile
 import unittest
 import ray
 import numpy as np
@@ -312,6 +313,77 @@ class TestPlotters(unittest.TestCase):
 
         np.testing.assert_array_almost_equal(segs, expected_segs)
 
+    def test_time_space_diagram_grid(self):
+        flow_params = {'network': tsd.TrafficLightGridNetwork}
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as f:
+            f.write('time,id,x,y,speed,edge_id,lane_number,relative_position\n'
+                    '1.0,human_0,10.0,0.0,5.0,bot0_1,0,10.0\n'
+                    '1.0,human_1,100.0,20.0,4.0,right1_1,0,20.0\n'
+                    '2.0,human_0,15.0,0.0,5.0,bot0_1,0,15.0\n'
+                    '2.0,human_1,100.0,24.0,4.0,right1_1,0,24.0\n'
+                    '3.0,human_0,20.0,0.0,5.0,:center1_0,0,0.0\n'
+                    '3.0,human_1,100.0,28.0,4.0,right1_1,0,28.0\n')
+            f.flush()
+            emission_data = tsd.import_data_from_trajectory(
+                f.name, flow_params, chunksize=2)
+
+        segs, _ = tsd.get_time_space_data(emission_data, flow_params)
+
+        # positions are along the rows and columns, excluding intersections
+        self.assertListEqual(sorted(segs.keys()), ['column 1', 'row 0'])
+        np.testing.assert_array_almost_equal(
+            segs['row 0'], [[[1., 10.], [2., 15.]]])
+        np.testing.assert_array_almost_equal(
+            segs['column 1'], [[[1., 20.], [2., 24.]], [[2., 24.], [3., 28.]]])
+
+    def test_time_space_diagram_grid_turn(self):
+        flow_params = {'network': tsd.TrafficLightGridNetwork}
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as f:
+            # the vehicle turns from row 0 into column 1 between two samples
+            f.write('time,id,x,y,speed,edge_id,lane_number,relative_position\n'
+                    '1.0,human_0,10.0,0.0,5.0,bot0_1,0,10.0\n'
+                    '2.0,human_0,15.0,0.0,5.0,bot0_1,0,15.0\n'
+                    '3.0,human_0,100.0,30.0,5.0,right1_1,0,30.0\n'
+                    '4.0,human_0,100.0,35.0,5.0,right1_1,0,35.0\n')
+            f.flush()
+            emission_data = tsd.import_data_from_trajectory(f.name, flow_params)
+
+        segs, _ = tsd.get_time_space_data(emission_data, flow_params)
+
+        # no segment joins the samples of the row and of the column
+        np.testing.assert_array_almost_equal(
+            segs['row 0'], [[[1., 10.], [2., 15.]]])
+        np.testing.assert_array_almost_equal(
+            segs['column 1'], [[[3., 30.], [4., 35.]]])
+
+    def test_time_space_raster(self):
+        dir_path = os.path.dirname(os.path.realpath(__file__))
+        fp = os.path.join(dir_path, 'test_files/ring_230_emission.csv')
+        flow_params = tsd.get_flow_params(
+            os.path.join(dir_path, 'test_files/ring_230.json'))
+
+        raster = tsd.get_time_space_raster(fp, flow_params, dt=0.1, dx=10.)
+        data = tsd.import_data_from_trajectory(fp, flow_params)
+
+        # every bin holds the mean speed of the samples it contains
+        t0, t1, x0, x1 = raster.extent
+        self.assertAlmostEqual(t0, 0.1)
+        self.assertAlmostEqual(t1, 0.7)
+        self.assertAlmostEqual(x0, 0.)
+        # the last sample of each of the 22 vehicles ends no segment
+        self.assertEqual(raster.counts.sum(), len(data) + 22)
+        bins = raster.speeds[:, 0]
+        np.testing.assert_array_almost_equal(
+            bins[~np.isnan(bins)],
+            data[data['time_step'] == 0.1].groupby(
+                data['distance'] // 10.)['speed'].mean().values)
+
+        # the result does not depend on the size of the chunks
+        chunked = tsd.get_time_space_raster(
+            fp, flow_params, dt=0.1, dx=10., chunksize=7)
+        np.testing.assert_array_equal(chunked.counts, raster.counts)
+        np.testing.assert_array_almost_equal(chunked.sums, raster.sums)
+
     def test_plot_ray_results(self):
         dir_path = os.path.dirname(os.path.realpath(__file__))
         file_path = os.path.join(dir_path, 'test_files/progress.csv')
@@ -0,0 +1,200 @@
+import unittest
+
+import torch
+from gym.spaces import MultiDiscrete
+
+from train.myppo.a2c_ppo_acktr.storage import RolloutStorage
+
+try:
+    from train.myppo.a2c_ppo_acktr.algo.ppo import PPO
+    from train.myppo.a2c_ppo_acktr.model import Policy
+except ImportError:
+    # the policy imports the vectorized envs of baselines
+    Policy = None
+
+NUM_STEPS = 12
+NUM_PROCESSES = 4
+OBS_SHAPE = (5, )
+ACTION_SPACE = MultiDiscrete([3, 4])
+
+
+def random_rollout(seed):
+    """Create a rollout with random rewards, terminations and truncations."""
+    torch.manual_seed(seed)
+    rollout = RolloutStorage(NUM_STEPS, NUM_PROCESSES, 1, OBS_SHAPE,
+                             ACTION_SPACE, 1)
+    rollout.obs.normal_()
+    rollout.rewards.normal_()
+    rollout.masks[1:] = (torch.rand(NUM_STEPS, NUM_PROCESSES, 1) > 0.2).float()
+    # a time limit truncation also ends the episode
+    rollout.bad_masks[1:] = (torch.rand(NUM_STEPS, NUM_PROCESSES, 1) > 0.2).float()
+    rollout.masks[1:] *= rollout.bad_masks[1:]
+    return rollout
+
+
+def vtrace_loop(rollout, values, action_log_probs, gamma, rho_bar, c_bar,
+                use_proper_time_limits):
+    """Compute the v-trace targets and advantages step by step."""
+    rhos = torch.exp(action_log_probs - rollout.action_log_probs)
+    vs = values.clone()
+    advantages = torch.zeros_like(rollout.rewards)
+    for t in reversed(range(NUM_STEPS)):
+        rho = rhos[t].clamp(max=rho_bar)
+        c = rhos[t].clamp(max=c_bar)
+        discount = gamma * rollout.masks[t + 1]
+        delta = rho * (rollout.rewards[t] + discount * values[t + 1] - values[t])
+        vs[t] = values[t] + delta + discount * c * (vs[t + 1] - values[t + 1])
+        advantages[t] = rho * (rollout.rewards[t] + discount * vs[t + 1] - values[t])
+        if use_proper_time_limits:
+            truncated = rollout.bad_masks[t + 1] == 0
+            vs[t] = torch.where(truncated, values[t], vs[t])
+            advantages[t] = torch.where(truncated, 0., advantages[t])
+    return vs, advantages
+
+
+class TestVtraceReturns(unittest.TestCase):
+    """Tests the v-trace targets computed by RolloutStorage."""
+
+    def setUp(self):
+        self.rollout = random_rollout(seed=1)
+        self.values = torch.randn(NUM_STEPS + 1, NUM_PROCESSES, 1)
+        self.rollout.action_log_probs.normal_()
+        # ratios on both sides of the truncation levels
+        self.action_log_probs = self.rollout.action_log_probs + \
+            torch.randn(NUM_STEPS, NUM_PROCESSES, 1)
+
+    def test_one_step_truncation(self):
+        """The importance weight of a step is truncated at rho_bar."""
+        rollout = RolloutStorage(1, 1, 1, OBS_SHAPE, ACTION_SPACE, 1)
+        rollout.rewards.fill_(1.)
+        values = torch.tensor([[[2.]], [[4.]]])
+        # the trained policy is twice as likely to take the action
+        log_probs = rollout.action_log_probs + torch.log(torch.tensor(2.))
+
+        # delta = 1 + 0.5 * 4 - 2 = 1
+        rollout.compute_vtrace_returns(values, log_probs, 0.5, 1., 1.)
+        self.assertAlmostEqual(rollout.returns[0].item(), 3.)
+        self.assertAlmostEqual(rollout.advantages[0].item(), 1.)
+        rollout.compute_vtrace_returns(values, log_probs, 0.5, 3., 1.)
+        self.assertAlmostEqual(rollout.returns[0].item(), 4.)
+        self.assertAlmostEqual(rollout.advantages[0].item(), 2.)
+
+    def test_two_step_trace(self):
+        """The trace of the later steps is cut by the c coefficients."""
+        rollout = RolloutStorage(2, 1, 1, OBS_SHAPE, ACTION_SPACE, 1)
+        rollout.rewards.fill_(1.)
+        values = torch.zeros(3, 1, 1)
+        # ratios of 4 and 1/2
+        log_probs = torch.log(torch.tensor([[[4.]], [[0.5]]]))
+
+        # vs_1 = 1/2 * 1, vs_0 = min(rho_bar, 4) * 1 + min(c_bar, 4) * vs_1
+        rollout.compute_vtrace_returns(values, log_probs, 1., 2., 0.5)
+        self.assertAlmostEqual(rollout.returns[1].item(), 0.5)
+        self.assertAlmostEqual(rollout.returns[0].item(), 2.25)
+        # the advantage bootstraps from the whole target of the next step
+        self.assertAlmostEqual(rollout.advantages[0].item(), 3.)
+        self.assertAlmostEqual(rollout.advantages[1].item(), 0.5)
+
+    def test_truncation_levels(self):
+        """The targets match the step by step recursion for any truncation levels."""
+        for rho_bar, c_bar in [(1., 1.), (2., 0.5), (0.5, 2.), (100., 100.)]:
+            for use_proper_time_limits in [False, True]:
+                self.rollout.compute_vtrace_returns(
+                    self.values, self.action_log_probs, 0.9, rho_bar, c_bar,
+                    use_proper_time_limits)
+                vs, advantages = vtrace_loop(
+                    self.rollout, self.values, self.action_log_probs, 0.9,
+                    rho_bar, c_bar, use_proper_time_limits)
+                torch.testing.assert_close(self.rollout.returns, vs)
+                torch.testing.assert_close(self.rollout.advantages, advantages)
+                torch.testing.assert_close(self.rollout.value_preds, self.values)
+
+    def test_bad_masks(self):
+        """A time limit truncation ends the trace without being terminal."""
+        self.rollout.compute_vtrace_returns(
+            self.values, self.action_log_probs, 0.9, 1., 1., True)
+        truncated = self.rollout.bad_masks[1:] == 0
+        self.assertTrue(truncated.any())
+        torch.testing.assert_close(self.rollout.returns[:-1][truncated],
+                                   self.values[:-1][truncated])
+        self.assertTrue((self.rollout.advantages[truncated] == 0).all())
+
+        # without proper time limits, the truncations are terminal states
+        self.rollout.compute_vtrace_returns(
+            self.values, self.action_log_probs, 0.9, 1., 1., False)
+        rhos = torch.exp(self.action_log_probs - self.rollout.action_log_probs)
+        torch.testing.assert_close(
+            self.rollout.advantages[truncated],
+            (rhos.clamp(max=1.) * (self.rollout.rewards - self.values[:-1]))[truncated])
+
+    def test_on_policy(self):
+        """On-policy targets are the GAE returns with lambda = 1."""
+        for use_proper_time_limits in [False, True]:
+            expected = random_rollout(seed=1)
+            expected.value_preds.copy_(self.values)
+            expected.compute_returns(self.values[-1], True, 0.9, 1.,
+                                     use_proper_time_limits)
+            self.rollout.compute_vtrace_returns(
+                self.values, self.rollout.action_log_probs, 0.9, 1., 1.,
+                use_proper_time_limits)
+            torch.testing.assert_close(self.rollout.returns[:-1],
+                                       expected.returns[:-1])
+            torch.testing.assert_close(
+                self.rollout.advantages,
+                expected.returns[:-1] - self.values[:-1])
+
+
+@unittest.skipIf(Policy is None, "baselines is not installed")
+class TestActionMasks(unittest.TestCase):
+    """Tests the PPO updates of rollouts sampled with action masks."""
+
+    def setUp(self):
+        self.rollout = random_rollout(seed=0)
+        # every other action is masked, but no segment is fully masked
+        self.rollout.action_masks[:, :, 1::2] = True
+
+        torch.manual_seed(0)
+        self.actor_critic = Policy(OBS_SHAPE, ACTION_SPACE)
+        self.agent = PPO(self.actor_critic, 0.2, 1, 1, 0.5, 0.01, lr=1e-3,
+                         eps=1e-5, max_grad_norm=0.5)
+        with torch.no_grad():
+            for step in range(NUM_STEPS):
+                value, action, action_log_prob, _ = self.actor_critic.act(
+                    self.rollout.obs[step],
+                    self.rollout.recurrent_hidden_states[step],
+                    self.rollout.masks[step],
+                    action_masks=self.rollout.action_masks[step])
+                self.rollout.value_preds[step] = value
+                self.rollout.actions[step] = action.float()
+                self.rollout.action_log_probs[step] = action_log_prob
+            self.next_value = self.actor_critic.get_value(
+                self.rollout.obs[-1], self.rollout.recurrent_hidden_states[-1],
+                self.rollout.masks[-1])
+
+    def test_on_policy_vtrace(self):
+        """With the sampling policy, the targets are the GAE returns with lambda = 1."""
+        expected = RolloutStorage(NUM_STEPS, NUM_PROCESSES, 1, OBS_SHAPE,
+                                  ACTION_SPACE, 1)
+        expected.copy_(self.rollout)
+        expected.compute_returns(self.next_value, True, 0.99, 1.0, True)
+
+        self.agent.compute_vtrace_returns(self.rollout, 0.99, 1.0, 1.0, True)
+        torch.testing.assert_close(self.rollout.returns[:-1],
+                                   expected.returns[:-1])
+        torch.testing.assert_close(
+            self.rollout.advantages,
+            expected.returns[:-1] - expected.value_preds[:-1])
+
+    def test_on_policy_ratios(self):
+        """With the sampling policy, the ratios of the minibatches are 1."""
+        advantages = torch.zeros(NUM_STEPS, NUM_PROCESSES, 1)
+        for sample in self.rollout.feed_forward_generator(advantages, 3):
+            obs, hxs, actions, _, _, masks, old_log_probs, _, action_masks = sample
+            with torch.no_grad():
+                _, log_probs, _, _ = self.actor_critic.evaluate_actions(
+                    obs, hxs, masks, actions, action_masks)
+            torch.testing.assert_close(log_probs, old_log_probs)
+
+
+if __name__ == '__main__':
+    unittest.main()
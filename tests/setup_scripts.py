@@ -9,17 +9,20 @@ import logging
 from numpy import pi, sin, cos, linspace
 
 from flow.controllers.car_following_models import IDMController
-from flow.controllers.routing_controllers import ContinuousRouter, GridRouter
+from flow.controllers.routing_controllers import ContinuousRouter, GridRouter, \
+    MinicityRouter
 from flow.core.params import SumoParams, EnvParams, InitialConfig, NetParams, \
     SumoCarFollowingParams
 from flow.core.params import TrafficLightParams
 from flow.core.params import VehicleParams
 from flow.envs.traffic_light_grid import TrafficLightGridTestEnv
+from flow.envs.test import TestEnv
 
 from flow.networks.figure_eight import FigureEightNetwork
 from flow.networks.traffic_light_grid import TrafficLightGridNetwork
 from flow.networks.highway import HighwayNetwork
 from flow.networks.ring import RingNetwork
+from flow.networks.grid_nxm import GridnxmNetwork
 from flow.envs.ring.accel import AccelEnv
 
 
@@ -571,6 +574,147 @@ def traffic_light_grid_mxn_exp_setup(row_num=1,
     return env, network, flow_params
 
 
+def grid_nxm_network(name="GridnxmTest",
+                     vehicles=None,
+                     initial_config=None,
+                     **net_kwargs):
+    """
+    Create a grid network for test experiments.
+
+    Parameters
+    ----------
+    name : str, optional
+        name of the network
+    vehicles : Vehicles type
+        vehicles to be placed in the network, default is one vehicle with an
+        IDM acceleration controller and MinicityRouter routing controller.
+    initial_config : flow.core.params.InitialConfig
+        specifies starting positions of vehicles, defaults to evenly
+        distributed vehicles across the length of the network
+    net_kwargs : dict
+        replace the default network-specific parameters of a 2x2 grid with
+        single lane edges of length 100 m and a speed limit of 35 m/s. The
+        "row_num", "col_num", "inner_length" and "sub_edge_num" keys are
+        placed in the grid array, and the other keys in the additional
+        parameters of the network
+    """
+    if vehicles is None:
+        # set default vehicles configuration
+        vehicles = VehicleParams()
+        vehicles.add(
+            veh_id="idm",
+            acceleration_controller=(IDMController, {}),
+            routing_controller=(MinicityRouter, {}),
+            num_vehicles=1)
+
+    if initial_config is None:
+        # set default initial_config configuration
+        initial_config = InitialConfig()
+
+    grid_array = {
+        "row_num": 2,
+        "col_num": 2,
+        "inner_length": 100,
+        "sub_edge_num": 1,
+    }
+    additional_net_params = {
+        "grid_array": grid_array,
+        "speed_limit": 35,
+        "horizontal_lanes": 1,
+        "vertical_lanes": 1,
+        "print_warnings": False,
+    }
+    for key, value in net_kwargs.items():
+        if key in grid_array:
+            grid_array[key] = value
+        else:
+            additional_net_params[key] = value
+
+    return GridnxmNetwork(
+        name=name,
+        vehicles=vehicles,
+        net_params=NetParams(additional_params=additional_net_params),
+        initial_config=initial_config)
+
+
+def grid_nxm_exp_setup(sim_params=None,
+                       vehicles=None,
+                       env_params=None,
+                       initial_config=None,
+                       **net_kwargs):
+    """
+    Create an environment and network pair for grid test experiments.
+
+    Parameters
+    ----------
+    sim_params : flow.core.params.SumoParams
+        sumo-related configuration parameters, defaults to a time step of 0.5s
+        without sumo warnings
+    vehicles : Vehicles type
+        vehicles to be placed in the network, see grid_nxm_network
+    env_params : flow.core.params.EnvParams
+        environment-specific parameters, defaults to the default EnvParams
+    initial_config : flow.core.params.InitialConfig
+        specifies starting positions of vehicles, see grid_nxm_network
+    net_kwargs : dict
+        network-specific parameters, see grid_nxm_network
+    """
+    logging.basicConfig(level=logging.WARNING)
+
+    if sim_params is None:
+        # set default sim_params configuration
+        sim_params = SumoParams(
+            sim_step=0.5, render=False, print_warnings=False)
+
+    if env_params is None:
+        # set default env_params configuration
+        env_params = EnvParams()
+
+    # create the network
+    network = grid_nxm_network(
+        vehicles=vehicles, initial_config=initial_config, **net_kwargs)
+
+    flow_params = dict(
+        # name of the experiment
+        exp_tag="GridnxmTest",
+
+        # name of the flow environment the experiment is running on
+        env_name=TestEnv,
+
+        # name of the network class the experiment is running on
+        network=GridnxmNetwork,
+
+        # simulator that is used by the experiment
+        simulator='traci',
+
+        # sumo-related parameters (see flow.core.params.SumoParams)
+        sim=sim_params,
+
+        # environment related parameters (see flow.core.params.EnvParams)
+        env=env_params,
+        # network-related parameters (see flow.core.params.NetParams and the
+        # network's documentation or ADDITIONAL_NET_PARAMS component)
+        net=network.net_params,
+
+        # vehicles to be placed in the network at the start of a rollout (see
+        # flow.core.params.VehicleParams)
+        veh=network.vehicles,
+
+        # parameters specifying the positioning of vehicles upon initialization/
+        # reset (see flow.core.params.InitialConfig)
+        initial=network.initial_config,
+    )
+
+    # create the environment
+    env = TestEnv(
+        env_params=env_params, sim_params=sim_params, network=network)
+
+    # reset the environment
+    env.reset()
+
+    return env, network, flow_params
+
+
 def variable_lanes_exp_setup(sim_params=None,
                              vehicles=None,
                              env_params=None,
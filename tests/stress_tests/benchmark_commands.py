@@ -0,0 +1,49 @@
+"""Benchmark the buffering of the setter commands sent to the vehicles.
+
+Runs a grid network populated with an increasing number of IDM vehicles that
+are colored at every step (as when rendering), once with the commands sent
+immediately and once with ``SumoParams(buffer_commands=True)``, and prints the
+steps/sec of each along with the number of commands issued and elided per
+step.
+
+Usage:
+    python tests/stress_tests/benchmark_commands.py --num_vehicles 100 500
+"""
+import argparse
+import time
+
+from benchmark_utils import create_grid_env
+
+
+def benchmark(num_vehicles, buffer_commands, num_steps, grid_size):
+    """Return the steps/sec and the commands issued and elided per step."""
+    env = create_grid_env(num_vehicles, grid_size, color_by_speed=True,
+                          buffer_commands=buffer_commands)
+    issued, elided = env.k.vehicle.get_command_counts()
+    t = time.time()
+    for _ in range(num_steps):
+        env.step(None)
+        env.k.vehicle.update_vehicle_colors()
+    steps_per_sec = num_steps / (time.time() - t)
+    new_issued, new_elided = env.k.vehicle.get_command_counts()
+    env.terminate()
+    return steps_per_sec, (new_issued - issued) / num_steps, \
+        (new_elided - elided) / num_steps
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num_vehicles", type=int, nargs="+",
+                        default=[100, 250, 500, 1000])
+    parser.add_argument("--num_steps", type=int, default=200)
+    parser.add_argument("--grid_size", type=int, default=8)
+    args = parser.parse_args()
+
+    print("{:>10} {:>10} {:>16} {:>10} {:>10}".format(
+        "vehicles", "buffered", "steps/sec", "issued", "elided"))
+    for n in args.num_vehicles:
+        for buffer_commands in (False, True):
+            steps_per_sec, issued, elided = benchmark(
+                n, buffer_commands, args.num_steps, args.grid_size)
+            print("{:>10} {:>10} {:>12.1f} s/s {:>10.1f} {:>10.1f}".format(
+                n, str(buffer_commands), steps_per_sec, issued, elided))
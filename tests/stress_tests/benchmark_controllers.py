@@ -0,0 +1,66 @@
+"""Benchmark the computation of the actions of the acceleration controllers.
+
+Runs a grid network populated with an increasing number of IDM vehicles with
+noise and failsafes, and times the computation of their actions, once by
+calling get_action for every vehicle and once through
+``flow.controllers.batch.get_actions``.
+
+Usage:
+    python tests/stress_tests/benchmark_controllers.py --num_vehicles 100 500
+"""
+import argparse
+import time
+
+from flow.controllers import IDMController
+from flow.controllers.batch import get_actions
+
+from benchmark_utils import create_grid_env
+
+
+# parameters of the IDM controllers of the vehicles
+IDM_PARAMS = {
+    "noise": 0.2,
+    "fail_safe": ["instantaneous", "safe_velocity", "feasible_accel"],
+    "display_warnings": False,
+}
+
+
+def benchmark(num_vehicles, num_steps, grid_size):
+    """Return the time (in ms) to compute the actions, per step."""
+    env = create_grid_env(
+        num_vehicles, grid_size, (IDMController, IDM_PARAMS))
+    per_vehicle, batched = 0, 0
+    for _ in range(num_steps):
+        env.step(None)
+        veh_ids = env.k.vehicle.get_controlled_ids()
+
+        t = time.time()
+        [env.k.vehicle.get_acc_controller(veh_id).get_action(env)
+         for veh_id in veh_ids]
+        per_vehicle += time.time() - t
+
+        t = time.time()
+        get_actions(env, veh_ids)
+        batched += time.time() - t
+
+    num_in_network = len(env.k.vehicle.get_ids())
+    env.terminate()
+    return 1e3 * per_vehicle / num_steps, 1e3 * batched / num_steps, \
+        num_in_network
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num_vehicles", type=int, nargs="+",
+                        default=[100, 250, 500, 1000])
+    parser.add_argument("--num_steps", type=int, default=100)
+    parser.add_argument("--grid_size", type=int, default=8)
+    args = parser.parse_args()
+
+    print("{:>10} {:>10} {:>16} {:>16}".format(
+        "vehicles", "in network", "per-vehicle", "batched"))
+    for n in args.num_vehicles:
+        per_vehicle, batched, n_net = benchmark(
+            n, args.num_steps, args.grid_size)
+        print("{:>10} {:>10} {:>13.2f} ms {:>13.2f} ms".format(
+            n, n_net, per_vehicle, batched))
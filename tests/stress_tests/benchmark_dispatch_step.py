@@ -0,0 +1,89 @@
+"""Benchmark the step time of the taxi dispatch environment at scale.
+
+Scales the grid and the taxi fleet of an experiment config (as located in
+train/exp_configs/rl/singleagent), runs the environment without dispatching
+any order, and prints the mean time spent in ``step``.
+
+Usage:
+    python tests/stress_tests/benchmark_dispatch_step.py \
+        --rows 8 --cols 8 --num_taxis 100
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from copy import deepcopy
+
+import numpy as np
+
+from flow.core.params import VehicleParams
+from flow.utils.registry import env_constructor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from benchmark_get_state import load_flow_params  # noqa: E402
+
+
+def scale_flow_params(flow_params, rows, cols, num_taxis):
+    """Return a copy of flow_params with a larger grid and taxi fleet."""
+    flow_params = deepcopy(flow_params)
+    flow_params["sim"].render = False
+
+    grid_array = flow_params["net"].additional_params["grid_array"]
+    grid_array["row_num"] = rows
+    grid_array["col_num"] = cols
+
+    vehicles = VehicleParams()
+    old_vehicles = flow_params["veh"]
+    for initial, veh_type in zip(old_vehicles.initial, old_vehicles.types):
+        is_taxi = veh_type["taxi"]
+        vehicles.add(
+            veh_id=initial["veh_id"],
+            acceleration_controller=initial["acceleration_controller"],
+            lane_change_controller=initial["lane_change_controller"],
+            routing_controller=initial["routing_controller"],
+            initial_speed=initial["initial_speed"],
+            num_vehicles=num_taxis if is_taxi else initial["num_vehicles"],
+            car_following_params=initial["car_following_params"],
+            lane_change_params=initial["lane_change_params"],
+            is_taxi=is_taxi)
+    flow_params["veh"] = vehicles
+
+    # traffic lights of the original config may not fit the new grid
+    flow_params.pop("tls", None)
+    return flow_params
+
+
+def benchmark(exp_config, rows, cols, num_taxis, num_steps):
+    """Return the number of edges and the latencies (in seconds) of step."""
+    flow_params = scale_flow_params(
+        load_flow_params(exp_config), rows, cols, num_taxis)
+
+    create_env = env_constructor(flow_params, save_path=tempfile.mkdtemp())
+    env = create_env().unwrapped
+
+    latencies = []
+    env.reset()
+    for _ in range(num_steps):
+        t = time.time()
+        env.step(None)
+        latencies.append(time.time() - t)
+    num_edges = len(env.edges)
+    env.terminate()
+    return num_edges, latencies
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--exp_config", type=str,
+                        default="grid_nxm_4x4x100_10_20_1000_1_notle")
+    parser.add_argument("--rows", type=int, default=8)
+    parser.add_argument("--cols", type=int, default=8)
+    parser.add_argument("--num_taxis", type=int, default=100)
+    parser.add_argument("--num_steps", type=int, default=200)
+    args = parser.parse_args()
+
+    num_edges, latencies = benchmark(
+        args.exp_config, args.rows, args.cols, args.num_taxis, args.num_steps)
+    print("{} edges, {} taxis: {:.3f} ms per step".format(
+        num_edges, args.num_taxis, 1000 * np.mean(latencies)))
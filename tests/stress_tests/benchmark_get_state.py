@@ -0,0 +1,60 @@
+"""Benchmark the observation latency of the taxi dispatch environments.
+
+Runs the environment of each requested experiment config without dispatching
+any order, and prints the mean time spent in ``get_state`` per step.
+
+Usage:
+    python tests/stress_tests/benchmark_get_state.py \
+        --exp_configs grid_nxm_4x4x100_10_20_1000_1_notle
+"""
+import argparse
+import tempfile
+import time
+from copy import deepcopy
+
+import numpy as np
+
+from flow.utils.registry import env_constructor
+
+from benchmark_utils import load_flow_params
+
+
+def benchmark(exp_config, num_steps):
+    """Return the latencies (in seconds) of get_state for an experiment."""
+    flow_params = deepcopy(load_flow_params(exp_config))
+    flow_params["sim"].render = False
+
+    create_env = env_constructor(flow_params, save_path=tempfile.mkdtemp())
+    env = create_env().unwrapped
+
+    latencies = []
+    get_state = env.get_state
+
+    def timed_get_state():
+        t = time.time()
+        state = get_state()
+        latencies.append(time.time() - t)
+        return state
+
+    env.get_state = timed_get_state
+    env.reset()
+    for _ in range(num_steps):
+        env.step(None)
+    env.terminate()
+    return latencies
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--exp_configs", type=str, nargs="+", default=[
+        "grid_nxm_4x4x100_10_20_1000_1_notle",
+        "test-mtl-nw-m-utl-0",
+    ])
+    parser.add_argument("--num_steps", type=int, default=300)
+    args = parser.parse_args()
+
+    print("{:>40} {:>14}".format("exp config", "get_state"))
+    for exp_config in args.exp_configs:
+        latencies = benchmark(exp_config, args.num_steps)
+        print("{:>40} {:>11.3f} ms".format(
+            exp_config, 1000 * np.mean(latencies)))
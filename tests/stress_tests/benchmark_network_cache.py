@@ -0,0 +1,88 @@
+"""Benchmark the construction time of environments with a network cache.
+
+Constructs the environment of each requested experiment config several times,
+without a network cache, with an empty (cold) cache, and with a cache that
+already contains the network (warm), and prints the mean construction time and
+the time spent generating the network files in each case.
+
+Usage:
+    python tests/stress_tests/benchmark_network_cache.py \
+        --exp_configs grid_nxm_4x4x100_10_20_1000_1_notle
+"""
+import argparse
+import shutil
+import tempfile
+import time
+from copy import deepcopy
+
+import numpy as np
+
+from flow.core.kernel.network.traci import TraCIKernelNetwork
+from flow.utils.registry import env_constructor
+
+from benchmark_utils import load_flow_params
+
+
+def construct(flow_params, net_cache_dir, save_path):
+    """Return the construction and network generation times of an env."""
+    flow_params = deepcopy(flow_params)
+    flow_params["sim"].render = False
+    flow_params["sim"].net_cache_dir = net_cache_dir
+
+    # time the network generation within the construction of the env
+    generate_network = TraCIKernelNetwork.generate_network
+    timer = {"network": 0}
+
+    def timed_generate_network(self, network):
+        t = time.time()
+        generate_network(self, network)
+        timer["network"] += time.time() - t
+
+    TraCIKernelNetwork.generate_network = timed_generate_network
+    try:
+        t = time.time()
+        env = env_constructor(flow_params, save_path=save_path)()
+        construction = time.time() - t
+    finally:
+        TraCIKernelNetwork.generate_network = generate_network
+
+    env.unwrapped.terminate()
+    return construction, timer["network"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--exp_configs", type=str, nargs="+", default=[
+        "grid_nxm_4x4x100_10_20_1000_1_notle",
+        "grid_nxm_4x4x50_10_20_36000",
+    ])
+    parser.add_argument("--num_envs", type=int, default=4)
+    args = parser.parse_args()
+
+    print("{:>40} {:>8} {:>14} {:>14}".format(
+        "exp config", "cache", "construction", "network"))
+    for exp_config in args.exp_configs:
+        flow_params = load_flow_params(exp_config)
+        save_path = tempfile.mkdtemp()
+        cache_dir = tempfile.mkdtemp()
+
+        # the first construction also computes the preprocessed data of the
+        # environment, which is stored in save_path for the others
+        construct(flow_params, None, save_path)
+
+        results = {"none": [], "cold": [], "warm": []}
+        for _ in range(args.num_envs):
+            results["none"].append(construct(flow_params, None, save_path))
+            shutil.rmtree(cache_dir)
+            results["cold"].append(
+                construct(flow_params, cache_dir, save_path))
+            results["warm"].append(
+                construct(flow_params, cache_dir, save_path))
+
+        for cache, times in results.items():
+            construction, network = np.mean(times, axis=0)
+            print("{:>40} {:>8} {:>12.3f} s {:>12.3f} s".format(
+                exp_config, cache, construction, network))
+
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        shutil.rmtree(save_path, ignore_errors=True)
@@ -0,0 +1,84 @@
+"""Benchmark the return computation and the action head of the PPO trainer.
+
+Times RolloutStorage.compute_returns on a rollout of the PPO replay buffer
+of train/myppo in each of its four modes, and the forward and backward pass
+of the masked multi-categorical action distribution on a minibatch, as in
+PPO.update. The action dimensions default to the ones of a dispatch env
+with 48 edges, 10 taxis and 2 mid edges.
+
+Usage:
+    python tests/stress_tests/benchmark_ppo_minibatch.py \
+        --num-processes 64 --num-steps 1000 --minibatch-size 1000
+"""
+import argparse
+import os
+import sys
+import time
+
+import torch
+from gym.spaces import MultiDiscrete
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "..", "train"))
+from myppo.a2c_ppo_acktr.distributions import FixedMultiCategorical  # noqa
+from myppo.a2c_ppo_acktr.storage import RolloutStorage  # noqa: E402
+
+
+def time_returns(args, use_gae, use_proper_time_limits):
+    """Return the time (in seconds) of a return computation."""
+    rollout = RolloutStorage(
+        args.num_steps, args.num_processes, 1, (1, ),
+        MultiDiscrete(args.action_dims), 1)
+    rollout.rewards.normal_()
+    rollout.value_preds.normal_()
+    rollout.masks.bernoulli_(0.99)
+    rollout.bad_masks.bernoulli_(0.99)
+    next_value = torch.randn(args.num_processes, 1)
+    t = time.time()
+    for _ in range(args.num_iters):
+        rollout.compute_returns(next_value, use_gae, 0.99, 0.95,
+                                use_proper_time_limits)
+    return (time.time() - t) / args.num_iters
+
+
+def time_action_head(args):
+    """Return the time (in seconds) of the forward and backward passes."""
+    logits = torch.randn(args.minibatch_size, sum(args.action_dims))
+    logits[torch.rand_like(logits) < args.mask_ratio] = -float('inf')
+    logits.requires_grad_()
+    actions = FixedMultiCategorical(logits, args.action_dims).sample()
+    forward = backward = 0
+    for _ in range(args.num_iters):
+        t = time.time()
+        dist = FixedMultiCategorical(logits, args.action_dims)
+        loss = dist.log_probs(actions.clone()).sum() + dist.entropy().sum()
+        forward += time.time() - t
+        t = time.time()
+        loss.backward()
+        backward += time.time() - t
+    return forward / args.num_iters, backward / args.num_iters
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-processes", type=int, default=64)
+    parser.add_argument("--num-steps", type=int, default=1000)
+    parser.add_argument("--minibatch-size", type=int, default=1000)
+    parser.add_argument("--action-dims", type=int, nargs="+",
+                        default=[48, 11, 48, 48])
+    parser.add_argument("--mask-ratio", type=float, default=0.3)
+    parser.add_argument("--num-iters", type=int, default=50)
+    parser.add_argument("--num-threads", type=int, default=1)
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.num_threads)
+    for use_gae in [True, False]:
+        for use_proper_time_limits in [True, False]:
+            print("returns (gae={}, proper time limits={}): {:.2f} ms".format(
+                use_gae, use_proper_time_limits,
+                1000 * time_returns(args, use_gae, use_proper_time_limits)))
+    forward, backward = time_action_head(args)
+    print("action head: forward {:.2f} ms, backward {:.2f} ms".format(
+        1000 * forward, 1000 * backward))
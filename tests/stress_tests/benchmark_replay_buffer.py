@@ -0,0 +1,88 @@
+"""Benchmark the rollout pushes of the PPO replay buffer.
+
+Fills the ReplayBuffer of train/myppo with synthetic steps, as
+Trainer.select_action does in the default synchronous mode, and consumes the
+pushed rollouts as Trainer.train does. Prints the time spent in the steps
+that push a rollout, the time of the other steps, and the peak RSS of the
+process.
+
+Usage:
+    python tests/stress_tests/benchmark_replay_buffer.py \
+        --num-envs 64 --num-steps 1000 --obs-dim 215
+"""
+import argparse
+import os
+import resource
+import sys
+import time
+from argparse import Namespace
+
+import numpy as np
+import torch
+from gym.spaces import MultiDiscrete
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "..", "train"))
+from myppo.a2c_ppo_acktr.storage import ReplayBuffer  # noqa: E402
+
+
+def benchmark(args):
+    """Return the latencies (in seconds) of the pushing and other steps."""
+    buffer = ReplayBuffer(Namespace(
+        num_steps=args.num_steps, num_actors=args.num_actors,
+        num_envs=args.num_envs, num_splits=args.num_splits,
+        queue_size=args.queue_size, reuse=1, use_gae=True, gamma=0.99,
+        gae_lambda=0.95, use_proper_time_limits=False, cuda=False,
+        dynamic_batching=False, vtrace=False, shm_transport=False),
+        (args.obs_dim, ), MultiDiscrete([args.action_dim - 11, 11]), 1)
+
+    n_env = args.num_envs // args.num_actors // args.num_splits
+    n_proc = n_env * args.num_actors
+    obs = torch.randn(n_env, args.obs_dim)
+    reward = torch.randn(n_env, 1)
+    action_masks = torch.rand(n_env, args.action_dim) < 0.2
+    masks = torch.ones(n_env, 1)
+    done = torch.zeros(n_env, dtype=bool)
+    outputs = (torch.zeros(n_proc, 1), torch.zeros(n_proc, 2),
+               torch.zeros(n_proc, 1), torch.zeros(n_proc, 1))
+
+    push_latencies, step_latencies = [], []
+    for step in range(args.num_rollouts * args.num_steps + 1):
+        for split_id in range(args.num_splits):
+            t = time.time()
+            for actor_id in range(args.num_actors):
+                buffer.insert_before_inference(
+                    actor_id, split_id, obs, reward, action_masks, masks,
+                    masks, done, step == 0)
+            buffer.get_policy_inputs(split_id, 'cpu')
+            pushed_rewards = buffer.insert_after_inference(
+                split_id, *outputs, rewards=torch.zeros(n_proc))
+            latency = time.time() - t
+            if pushed_rewards is not None:
+                push_latencies.append(latency)
+                # the trainer trains on the rollout before the next push
+                rollout = buffer.get()
+                rollout.returns.sum()
+                buffer.release(rollout)
+            else:
+                step_latencies.append(latency)
+    buffer.close()
+    return push_latencies, step_latencies
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-envs", type=int, default=64)
+    parser.add_argument("--num-actors", type=int, default=4)
+    parser.add_argument("--num-splits", type=int, default=1)
+    parser.add_argument("--num-steps", type=int, default=1000)
+    parser.add_argument("--queue-size", type=int, default=1)
+    parser.add_argument("--num-rollouts", type=int, default=10)
+    parser.add_argument("--obs-dim", type=int, default=215)
+    parser.add_argument("--action-dim", type=int, default=59)
+    args = parser.parse_args()
+
+    push_latencies, step_latencies = benchmark(args)
+    print("push: {:.1f} ms, other steps: {:.3f} ms, peak RSS: {:.0f} MB".format(
+        1000 * np.mean(push_latencies), 1000 * np.mean(step_latencies),
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
@@ -0,0 +1,65 @@
+"""Benchmark the reset latency of the taxi dispatch environments.
+
+Times a number of resets of the environment of each requested experiment
+config, once by restarting sumo and regenerating the network, and once with
+``SumoParams(snapshot_reset=True)``.
+
+Usage:
+    python tests/stress_tests/benchmark_reset.py \
+        --exp_configs grid_nxm_4x4x100_10_20_1000_1_notle
+"""
+import argparse
+import tempfile
+import time
+from copy import deepcopy
+
+import numpy as np
+
+from flow.utils.registry import env_constructor
+
+from benchmark_utils import load_flow_params
+
+
+def benchmark(exp_config, snapshot_reset, num_resets, num_steps):
+    """Return the reset latencies (in seconds) of an experiment config.
+
+    The first reset, which always starts a new sumo instance, is excluded.
+    """
+    flow_params = deepcopy(load_flow_params(exp_config))
+    flow_params["sim"].render = False
+    flow_params["sim"].snapshot_reset = snapshot_reset
+
+    create_env = env_constructor(
+        flow_params, save_path=tempfile.mkdtemp())
+    env = create_env()
+
+    env.reset()
+    latencies = []
+    for _ in range(num_resets):
+        for _ in range(num_steps):
+            env.step(None)
+        t = time.time()
+        env.reset()
+        latencies.append(time.time() - t)
+    env.unwrapped.terminate()
+    return latencies
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--exp_configs", type=str, nargs="+", default=[
+        "grid_nxm_4x4x100_10_20_1000_1_notle",
+        "grid_nxm_4x4x50_10_20_36000",
+    ])
+    parser.add_argument("--num_resets", type=int, default=5)
+    parser.add_argument("--num_steps", type=int, default=50)
+    args = parser.parse_args()
+
+    print("{:>40} {:>14} {:>14}".format("exp config", "restart", "snapshot"))
+    for exp_config in args.exp_configs:
+        restart = benchmark(
+            exp_config, False, args.num_resets, args.num_steps)
+        snapshot = benchmark(
+            exp_config, True, args.num_resets, args.num_steps)
+        print("{:>40} {:>12.3f} s {:>12.3f} s".format(
+            exp_config, np.mean(restart), np.mean(snapshot)))
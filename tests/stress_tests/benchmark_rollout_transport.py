@@ -0,0 +1,233 @@
+"""Benchmark the transport of rollouts from the actors to the PPO trainer.
+
+Starts a trainer and several actors connected through torch.distributed.rpc,
+as in train/myppo/train_ppo.py. The actors send synthetic step outputs shaped
+like the ones of the taxi dispatch environment (observation, reward, done and
+the infos of flow.utils.registry.Monitor) either as rpc arguments or through
+the shared memory slots of the replay buffer (--shm-transport). The trainer
+stores them in the replay buffer and samples random actions, so that the
+environments and the policy do not hide the cost of the transport.
+
+Prints the rpc bytes sent per step and the number of env steps per second
+received by the trainer for both transports.
+
+Usage:
+    python tests/stress_tests/benchmark_rollout_transport.py --num-actors 4
+"""
+import argparse
+import os
+import sys
+import time
+from argparse import Namespace
+
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+from gym.spaces import MultiDiscrete
+from torch.distributed import rpc
+from torch.distributed.rpc.internal import _internal_rpc_pickler
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "..", "train"))
+from myppo.a2c_ppo_acktr.storage import ReplayBuffer  # noqa: E402
+
+
+def buffer_args(args, shm_transport):
+    """Return the arguments of the replay buffer."""
+    return Namespace(
+        num_steps=args.num_steps, num_actors=args.num_actors,
+        num_envs=args.num_actors * args.num_envs_per_actor, num_splits=1,
+        queue_size=1, reuse=1, use_gae=False, gamma=0.99, gae_lambda=0.95,
+        use_proper_time_limits=False, cuda=False, dynamic_batching=False,
+        vtrace=False,
+        shm_transport=shm_transport, shm_slots=2)
+
+
+def action_space(args):
+    """Return the action space of a dispatch env with args.action_dim."""
+    n_edge = args.action_dim - args.num_taxis - 1
+    return MultiDiscrete([n_edge, args.num_taxis + 1])
+
+
+class Trainer:
+    """Stores the steps of the actors and returns random actions."""
+
+    def __init__(self, args, shm_transport):
+        self.args = args
+        self.action_space = action_space(args)
+        self.buffer = ReplayBuffer(
+            buffer_args(args, shm_transport), (args.obs_dim, ),
+            self.action_space, 1)
+        self.n_env = args.num_envs_per_actor
+        self.num_steps = 0
+
+    def _select_action(self, actor_id, obs, reward, action_masks):
+        span = slice(actor_id * self.n_env, (actor_id + 1) * self.n_env)
+        rollout = self.buffer.current_rollouts[0]
+        rollout.obs[0, span] = obs
+        if action_masks is not None:
+            rollout.rewards[0, span] = reward
+            rollout.action_masks[0, span] = action_masks
+        self.num_steps += self.n_env
+        return torch.stack([torch.randint(n, (self.n_env, ))
+                            for n in self.action_space.nvec], dim=1)
+
+    def select_action(self, actor_id, split_id, model_inputs, init=False):
+        """Store a step sent through rpc, as Trainer.select_action does.
+
+        Parameters
+        ----------
+        actor_id : int
+            index of the actor
+        split_id : int
+            index of the split of the actor
+        model_inputs : torch.Tensor or tuple
+            observations of the first step if init, otherwise the
+            observations, rewards, dones and infos of the step
+        init : bool
+            whether this is the first step after a reset
+
+        Returns
+        -------
+        torch.Tensor
+            random actions of the envs of the actor
+        """
+        if init:
+            return self._select_action(actor_id, model_inputs, None, None)
+        obs, reward, done, infos = model_inputs
+        action_masks = torch.cat([info['action_mask'] for info in infos])
+        return self._select_action(actor_id, obs, reward, action_masks)
+
+    def select_action_from_slot(self, actor_id, split_id, slot, init=False):
+        """Store a step written in a shared slot, as Trainer does.
+
+        Parameters
+        ----------
+        actor_id : int
+            index of the actor
+        split_id : int
+            index of the split of the actor
+        slot : int
+            index of the slot in which the actor wrote the step
+        init : bool
+            whether this is the first step after a reset
+
+        Returns
+        -------
+        torch.Tensor
+            random actions of the envs of the actor
+        """
+        obs, reward, _, _, _, action_masks = \
+            self.buffer.shared_slots.read(actor_id, split_id, slot)
+        if init:
+            action_masks = None
+        return self._select_action(actor_id, obs, reward, action_masks)
+
+
+def rpc_bytes(func, args):
+    """Return the number of bytes sent by rpc for a call."""
+    payload, tensors = _internal_rpc_pickler.serialize(
+        rpc.internal.PythonUDF(func, args, {}))
+    return len(payload) + sum(t.numel() * t.element_size() for t in tensors)
+
+
+def run_actor(actor_id, trainer_rref, shared_slots, args):
+    """Send synthetic steps to the trainer, and return the bytes per step."""
+    n_env = args.num_envs_per_actor
+    obs = torch.randn(n_env, args.obs_dim)
+    reward = torch.randn(n_env, 1)
+    done = np.zeros(n_env, dtype=bool)
+    infos = [{
+        'action_mask': torch.rand(1, args.action_dim) < 0.2,
+        'reward': 0.0,
+        'background_velocity': np.random.rand(args.num_background),
+        'background_co2': np.random.rand(args.num_background),
+        'taxi_velocity': np.random.rand(args.num_taxis),
+        'taxi_co2': np.random.rand(args.num_taxis),
+    } for _ in range(n_env)]
+
+    sent = 0
+    for step in range(args.num_iters):
+        init = step == 0
+        model_inputs = obs if init else (obs, reward, done, infos)
+        if shared_slots is None:
+            func = Trainer.select_action
+            call_args = (actor_id, 0, model_inputs, init)
+        else:
+            if init:
+                slot = shared_slots.write(actor_id, 0, obs)
+            else:
+                slot = shared_slots.write(actor_id, 0, *model_inputs)
+            func = Trainer.select_action_from_slot
+            call_args = (actor_id, 0, slot, init)
+        if not init:
+            sent += rpc_bytes(func, call_args)
+        rpc.rpc_sync(trainer_rref.owner(), _call,
+                     args=(trainer_rref, func.__name__) + call_args)
+    return sent / (args.num_iters - 1)
+
+
+def _call(rref, name, *args):
+    return getattr(rref.local_value(), name)(*args)
+
+
+def worker(rank, args, shm_transport, results):
+    """Run the trainer (rank 0) or an actor."""
+    os.environ['MASTER_ADDR'] = 'localhost'
+    os.environ['MASTER_PORT'] = str(args.master_port)
+    world_size = args.num_actors + 1
+    opts = rpc.TensorPipeRpcBackendOptions(num_worker_threads=16)
+    if rank == 0:
+        rpc.init_rpc('agent', rank=0, world_size=world_size,
+                     rpc_backend_options=opts)
+        trainer = Trainer(args, shm_transport)
+        trainer_rref = rpc.RRef(trainer)
+        t = time.time()
+        futs = [rpc.rpc_async(
+            'actor_{}'.format(i), run_actor,
+            args=(i, trainer_rref, trainer.buffer.shared_slots, args))
+            for i in range(args.num_actors)]
+        sent = [fut.wait() for fut in futs]
+        results['fps'] = trainer.num_steps / (time.time() - t)
+        results['bytes'] = np.mean(sent)
+        rpc.shutdown()
+        trainer.buffer.close()
+    else:
+        rpc.init_rpc('actor_{}'.format(rank - 1), rank=rank,
+                     world_size=world_size, rpc_backend_options=opts)
+        rpc.shutdown()
+
+
+def benchmark(args, shm_transport):
+    """Return the rpc bytes per step and the steps per second."""
+    import sumolib
+    args.master_port = sumolib.miscutils.getFreeSocketPort()
+    results = mp.Manager().dict()
+    procs = [mp.Process(target=worker, args=(i, args, shm_transport, results))
+             for i in range(args.num_actors + 1)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    return results['bytes'], results['fps']
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-actors", type=int, default=4)
+    parser.add_argument("--num-envs-per-actor", type=int, default=4)
+    parser.add_argument("--num-iters", type=int, default=2000)
+    parser.add_argument("--num-steps", type=int, default=5)
+    # sizes of the grid_nxm_4x4x100 taxi config
+    parser.add_argument("--obs-dim", type=int, default=215)
+    parser.add_argument("--action-dim", type=int, default=59)
+    parser.add_argument("--num-taxis", type=int, default=10)
+    parser.add_argument("--num-background", type=int, default=20)
+    args = parser.parse_args()
+
+    mp.set_start_method('spawn')
+    print("{:>10} {:>16} {:>14}".format("transport", "rpc bytes/step", "env steps/s"))
+    for shm_transport in [False, True]:
+        num_bytes, fps = benchmark(args, shm_transport)
+        print("{:>10} {:>16.0f} {:>14.0f}".format(
+            "shm" if shm_transport else "rpc", num_bytes, fps))
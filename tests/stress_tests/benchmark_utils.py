@@ -0,0 +1,97 @@
+"""Helpers shared by the benchmark scripts of the stress tests.
+
+The scripts are run directly (``python tests/stress_tests/<script>.py``), so
+they import this module from their own directory.
+"""
+import importlib
+import os
+import sys
+
+from flow.controllers import IDMController
+from flow.controllers.routing_controllers import MinicityRouter
+from flow.core.params import SumoParams, InitialConfig
+from flow.core.params import VehicleParams, SumoCarFollowingParams
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")
+TRAIN_DIR = os.path.join(ROOT_DIR, "train")
+
+
+def load_flow_params(exp_config):
+    """Import the flow_params of an experiment config.
+
+    Parameters
+    ----------
+    exp_config : str
+        name of the experiment config, as located in
+        train/exp_configs/rl/singleagent
+
+    Returns
+    -------
+    dict
+        the flow_params of the experiment
+    """
+    if TRAIN_DIR not in sys.path:
+        sys.path.insert(0, TRAIN_DIR)
+    module = importlib.import_module(
+        "exp_configs.rl.singleagent.{}".format(exp_config))
+    return module.flow_params
+
+
+def create_grid_env(num_vehicles,
+                    grid_size,
+                    acceleration_controller=None,
+                    **sim_kwargs):
+    """Create a grid environment with the requested number of vehicles.
+
+    The vehicles are randomly spaced on a square grid with two-lane edges of
+    length 200 m, and are routed by the MinicityRouter.
+
+    Parameters
+    ----------
+    num_vehicles : int
+        number of vehicles in the network
+    grid_size : int
+        number of rows and columns of the grid
+    acceleration_controller : tuple, optional
+        acceleration controller class and parameters of the vehicles,
+        defaults to an IDMController
+    sim_kwargs : dict
+        additional SumoParams, which default to a time step of 1s without
+        rendering or sumo warnings
+
+    Returns
+    -------
+    flow.envs.TestEnv
+        the environment, after its first reset
+    """
+    if ROOT_DIR not in sys.path:
+        sys.path.insert(0, ROOT_DIR)
+    from tests.setup_scripts import grid_nxm_exp_setup
+
+    if acceleration_controller is None:
+        acceleration_controller = (IDMController, {})
+
+    vehicles = VehicleParams()
+    vehicles.add(
+        veh_id="idm",
+        acceleration_controller=acceleration_controller,
+        routing_controller=(MinicityRouter, {}),
+        car_following_params=SumoCarFollowingParams(
+            speed_mode="all_checks",
+            min_gap=2.5,
+        ),
+        num_vehicles=num_vehicles)
+
+    sim_params = dict(sim_step=1, render=False, print_warnings=False)
+    sim_params.update(sim_kwargs)
+
+    env, _, _ = grid_nxm_exp_setup(
+        sim_params=SumoParams(**sim_params),
+        vehicles=vehicles,
+        initial_config=InitialConfig(spacing="random", min_gap=5),
+        row_num=grid_size,
+        col_num=grid_size,
+        inner_length=200,
+        horizontal_lanes=2,
+        vertical_lanes=2)
+    return env
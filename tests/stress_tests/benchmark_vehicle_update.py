@@ -0,0 +1,44 @@
+"""Benchmark the simulation steps/sec of the vehicle kernel update.
+
+Runs a grid network populated with an increasing number of IDM vehicles, once
+with the per-vehicle subscription path and once with
+``SumoParams(bulk_subscriptions=True)``, and prints the steps/sec of each.
+
+Usage:
+    python tests/stress_tests/benchmark_vehicle_update.py --num_vehicles 100 500
+"""
+import argparse
+import time
+
+from benchmark_utils import create_grid_env
+
+
+def benchmark(num_vehicles, bulk_subscriptions, num_steps, grid_size):
+    """Return the number of simulation steps per second."""
+    env = create_grid_env(
+        num_vehicles, grid_size, bulk_subscriptions=bulk_subscriptions)
+    t = time.time()
+    for _ in range(num_steps):
+        env.step(None)
+    steps_per_sec = num_steps / (time.time() - t)
+    num_in_network = len(env.k.vehicle.get_ids())
+    env.terminate()
+    return steps_per_sec, num_in_network
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num_vehicles", type=int, nargs="+",
+                        default=[100, 250, 500, 1000])
+    parser.add_argument("--num_steps", type=int, default=200)
+    parser.add_argument("--grid_size", type=int, default=8)
+    args = parser.parse_args()
+
+    print("{:>10} {:>10} {:>16} {:>16}".format(
+        "vehicles", "in network", "per-vehicle", "bulk"))
+    for n in args.num_vehicles:
+        per_vehicle, n_net = benchmark(n, False, args.num_steps,
+                                       args.grid_size)
+        bulk, _ = benchmark(n, True, args.num_steps, args.grid_size)
+        print("{:>10} {:>10} {:>12.1f} s/s {:>12.1f} s/s".format(
+            n, n_net, per_vehicle, bulk))
@@ -0,0 +1,103 @@
+"""Compare the wall-clock-to-reward of synchronous and v-trace PPO training.
+
+Trains the taxi dispatch policy of an experiment config with train/train.py
+for a fixed wall-clock budget, once in the default synchronous mode and once with --vtrace, in which
+the actors select their actions locally and never wait for the learner.
+
+The running mean reward printed by the trainer after each rollout is parsed
+from its output, and the best running mean reached within each fraction of
+the budget is printed for both modes. A run that ends without completing any
+rollout (e.g. when the training stack cannot be imported) is reported with the
+end of its output, and no table is printed. benchmark_vtrace_synthetic.py makes
+the same comparison in process, without the simulator and the RPC actors.
+
+Usage:
+    python tests/stress_tests/benchmark_vtrace.py \
+        --exp_config grid_nxm_4x4x100_10_20_1000_1_notle --budget 3600
+"""
+import argparse
+import re
+import subprocess
+import sys
+import tempfile
+
+from benchmark_utils import TRAIN_DIR
+
+REWARD_RE = re.compile(r"running mean (-?[\d.]+)")
+TIME_RE = re.compile(r"time ([\d.]+) sec")
+
+
+def train(exp_config, budget, extra_args):
+    """Train for budget seconds.
+
+    Returns
+    -------
+    list of (float, float)
+        the time and running mean reward after each rollout
+    str
+        the output of the training run
+    """
+    cmd = [sys.executable, "train.py", exp_config,
+           "--algo", "ppo",
+           "--save-dir", tempfile.mkdtemp(),
+           "--num-env-steps", str(10 ** 9)] + extra_args
+    proc = subprocess.Popen(cmd, cwd=TRAIN_DIR, stdout=subprocess.PIPE,
+                            stderr=subprocess.STDOUT, text=True)
+    try:
+        output, _ = proc.communicate(timeout=budget)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        output, _ = proc.communicate()
+
+    points = []
+    reward = None
+    for line in output.splitlines():
+        match = REWARD_RE.search(line)
+        if match:
+            reward = float(match.group(1))
+            continue
+        match = TIME_RE.search(line)
+        if match and reward is not None:
+            points.append((float(match.group(1)), reward))
+            reward = None
+    return points, output
+
+
+def best_reward(points, time_limit):
+    """Return the best running mean reward reached before time_limit."""
+    rewards = [reward for t, reward in points if t <= time_limit]
+    return max(rewards) if rewards else float("nan")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--exp_config", type=str,
+                        default="grid_nxm_4x4x100_10_20_1000_1_notle")
+    parser.add_argument("--budget", type=float, default=3600,
+                        help="wall-clock budget of each run, in seconds")
+    parser.add_argument("--train_args", type=str, nargs=argparse.REMAINDER,
+                        default=["--num-envs", "8", "--num-actors", "4",
+                                 "--num-splits", "1", "--num-steps", "1000",
+                                 "--num-mini-batch", "8", "--lr", "2.5e-4",
+                                 "--use-gae", "--no-cuda"],
+                        help="arguments passed to both training runs")
+    args = parser.parse_args()
+
+    runs = {}
+    for name, extra_args in [("sync", []), ("vtrace", ["--vtrace"])]:
+        points, output = train(args.exp_config, args.budget,
+                               args.train_args + extra_args)
+        if len(points) == 0:
+            print("the {} run completed no rollout, its output ends with:\n{}"
+                  .format(name, "\n".join(output.splitlines()[-20:])))
+            sys.exit(1)
+        runs[name] = points
+
+    print("{:>10} {:>12} {:>12}".format("time (s)", "sync", "vtrace"))
+    for fraction in [0.25, 0.5, 0.75, 1.0]:
+        time_limit = fraction * args.budget
+        print("{:>10.0f} {:>12.3f} {:>12.3f}".format(
+            time_limit, best_reward(runs["sync"], time_limit),
+            best_reward(runs["vtrace"], time_limit)))
+    for name, points in runs.items():
+        print("{}: {} rollouts".format(name, len(points)))
@@ -0,0 +1,266 @@
+"""Compare synchronous and v-trace PPO training on a synthetic env, in process.
+
+benchmark_vtrace.py makes this comparison on the taxi dispatch env through
+train.py, which needs the whole training stack (sumo, baselines, RPC actors).
+This benchmark runs the policy, PPO and rollout storage of train/myppo on a
+masked multi-discrete env whose steps sleep for --step-time, as a stand-in for
+the time spent in the simulator. The action of each segment is rewarded when
+it is the unmasked one of largest observation, and the episodes end with a
+time limit truncation, so that both the action masks and the bad masks are
+exercised.
+
+In the synchronous mode, as in the default mode of the trainer, a rollout is
+collected with the current policy, and the actors wait for the update. With
+--vtrace, an actor thread collects rollouts with the last weights broadcast
+by the learner, which trains on the queued rollouts in the meantime with the
+v-trace targets of PPO.compute_vtrace_returns.
+
+The best running mean episode reward reached within each fraction of the
+budget is printed for both modes.
+
+Usage:
+    python tests/stress_tests/benchmark_vtrace_synthetic.py --budget 300
+"""
+import argparse
+import copy
+import os
+import queue
+import sys
+import threading
+import time
+from collections import deque
+
+import torch
+from gym.spaces import MultiDiscrete
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "..", "train"))
+from myppo.a2c_ppo_acktr.algo.ppo import PPO  # noqa: E402
+from myppo.a2c_ppo_acktr.model import Policy  # noqa: E402
+from myppo.a2c_ppo_acktr.storage import RolloutStorage  # noqa: E402
+
+
+class MaskedEnv:
+    """Vectorized env rewarding the unmasked actions of largest observation."""
+
+    def __init__(self, num_envs, nvec, episode_length, step_time):
+        self.num_envs = num_envs
+        self.nvec = nvec
+        self.episode_length = episode_length
+        self.step_time = step_time
+        self.t = 0
+
+    def _observe(self):
+        self.obs = torch.randn(self.num_envs, sum(self.nvec))
+        self.action_masks = torch.rand(self.num_envs, sum(self.nvec)) < 0.5
+        start = 0
+        for n in self.nvec:
+            # keep one valid action per segment
+            keep = start + torch.randint(n, (self.num_envs, ))
+            self.action_masks[torch.arange(self.num_envs), keep] = False
+            start += n
+        return self.obs, self.action_masks
+
+    def reset(self):
+        """Start new episodes, and return the observations and action masks."""
+        self.t = 0
+        return self._observe()
+
+    def step(self, actions):
+        """Step the envs, and return the observations, rewards, done and action masks."""
+        time.sleep(self.step_time)
+        reward = torch.zeros(self.num_envs, 1)
+        scores = self.obs.masked_fill(self.action_masks, -float('inf'))
+        start = 0
+        for i, n in enumerate(self.nvec):
+            best = scores[:, start:start + n].argmax(1)
+            reward[:, 0] += (actions[:, i].long() == best).float() / len(self.nvec)
+            start += n
+        self.t += 1
+        # the episodes end at the time limit only
+        done = self.t == self.episode_length
+        if done:
+            self.t = 0
+        obs, action_masks = self._observe()
+        return obs, reward, done, action_masks
+
+
+class Actor:
+    """Collect rollouts of the env, recording the episode rewards over time."""
+
+    def __init__(self, args, env, policy):
+        self.env = env
+        self.policy = policy
+        self.num_steps = args.num_steps
+        self.episode_rewards = torch.zeros(env.num_envs)
+        # (time, running mean episode reward) after each episode
+        self.points = []
+        self.recent_rewards = deque(maxlen=10 * env.num_envs)
+        self.rollout = new_rollout(args, env)
+        self.rollout.obs[0], self.rollout.action_masks[0] = env.reset()
+
+    def collect(self, start_time, lock=None):
+        """Fill self.rollout with the policy, and return it."""
+        rollout = self.rollout
+        for step in range(self.num_steps):
+            with torch.no_grad():
+                if lock is not None:
+                    lock.acquire()
+                value, action, action_log_prob, _ = self.policy.act(
+                    rollout.obs[step], rollout.recurrent_hidden_states[step],
+                    rollout.masks[step], action_masks=rollout.action_masks[step])
+                if lock is not None:
+                    lock.release()
+            obs, reward, done, action_masks = self.env.step(action)
+
+            rollout.value_preds[step] = value
+            rollout.actions[step] = action.float()
+            rollout.action_log_probs[step] = action_log_prob
+            rollout.rewards[step] = reward
+            rollout.obs[step + 1] = obs
+            rollout.action_masks[step + 1] = action_masks
+            # a time limit truncation, which is not terminal with proper time limits
+            rollout.masks[step + 1] = 0. if done else 1.
+            rollout.bad_masks[step + 1] = 0. if done else 1.
+
+            self.episode_rewards += reward[:, 0]
+            if done:
+                self.recent_rewards.extend(self.episode_rewards.tolist())
+                self.points.append((time.time() - start_time,
+                                    sum(self.recent_rewards) / len(self.recent_rewards)))
+                self.episode_rewards.zero_()
+        return rollout
+
+
+def new_rollout(args, env):
+    """Create a rollout of the env."""
+    return RolloutStorage(args.num_steps, env.num_envs, 1, (sum(env.nvec), ),
+                          MultiDiscrete(env.nvec), 1)
+
+
+def new_agent(args, env):
+    """Create the policy and its PPO trainer, with the same seed in both modes."""
+    torch.manual_seed(args.seed)
+    actor_critic = Policy((sum(env.nvec), ), MultiDiscrete(env.nvec))
+    agent = PPO(actor_critic, 0.2, args.ppo_epoch, args.num_mini_batch, 0.5,
+                0.01, lr=args.lr, eps=1e-5, max_grad_norm=0.5)
+    return actor_critic, agent
+
+
+def train_sync(args):
+    """Train with rollouts of the current policy, for args.budget seconds.
+
+    Returns
+    -------
+    list of (float, float)
+        the time and running mean episode reward after each episode
+    int
+        the number of updates
+    """
+    env = MaskedEnv(args.num_envs, args.nvec, args.episode_length, args.step_time)
+    actor_critic, agent = new_agent(args, env)
+    actor = Actor(args, env, actor_critic)
+    start_time = time.time()
+    num_updates = 0
+    while time.time() - start_time < args.budget:
+        rollout = actor.collect(start_time)
+        with torch.no_grad():
+            next_value = actor_critic.get_value(
+                rollout.obs[-1], rollout.recurrent_hidden_states[-1], rollout.masks[-1])
+        rollout.compute_returns(next_value, True, args.gamma, args.gae_lambda, True)
+        agent.update(rollout)
+        num_updates += 1
+        rollout.after_update()
+    return actor.points, num_updates
+
+
+def train_vtrace(args):
+    """Train while an actor thread collects rollouts, for args.budget seconds.
+
+    Returns
+    -------
+    list of (float, float)
+        the time and running mean episode reward after each episode
+    int
+        the number of updates
+    """
+    env = MaskedEnv(args.num_envs, args.nvec, args.episode_length, args.step_time)
+    actor_critic, agent = new_agent(args, env)
+    # the actor keeps the last weights broadcast by the learner
+    actor = Actor(args, env, copy.deepcopy(actor_critic))
+    lock = threading.Lock()
+    rollouts = queue.Queue(maxsize=args.queue_size)
+    start_time = time.time()
+
+    def collect():
+        while time.time() - start_time < args.budget:
+            rollout = actor.collect(start_time, lock)
+            pushed = new_rollout(args, env)
+            pushed.copy_(rollout)
+            rollout.after_update()
+            while time.time() - start_time < args.budget:
+                try:
+                    rollouts.put(pushed, timeout=1)
+                    break
+                except queue.Full:
+                    continue
+
+    thread = threading.Thread(target=collect, daemon=True)
+    thread.start()
+    num_updates = 0
+    while time.time() - start_time < args.budget:
+        try:
+            rollout = rollouts.get(timeout=1)
+        except queue.Empty:
+            continue
+        for _ in range(args.reuse):
+            agent.compute_vtrace_returns(rollout, args.gamma, args.rho_bar,
+                                         args.c_bar, True)
+            agent.update(rollout)
+            num_updates += 1
+        with lock:
+            actor.policy.load_state_dict(actor_critic.state_dict())
+    thread.join()
+    return actor.points, num_updates
+
+
+def best_reward(points, time_limit):
+    """Return the best running mean reward reached before time_limit."""
+    rewards = [reward for t, reward in points if t <= time_limit]
+    return max(rewards) if rewards else float("nan")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--budget", type=float, default=300,
+                        help="wall-clock budget of each run, in seconds")
+    parser.add_argument("--step-time", type=float, default=0.005,
+                        help="time of an env step, in seconds")
+    parser.add_argument("--num-envs", type=int, default=16)
+    parser.add_argument("--nvec", type=int, nargs="+", default=[8, 8])
+    parser.add_argument("--num-steps", type=int, default=100)
+    parser.add_argument("--episode-length", type=int, default=50)
+    parser.add_argument("--ppo-epoch", type=int, default=4)
+    parser.add_argument("--num-mini-batch", type=int, default=4)
+    parser.add_argument("--lr", type=float, default=2.5e-4)
+    parser.add_argument("--gamma", type=float, default=0.99)
+    parser.add_argument("--gae-lambda", type=float, default=0.95)
+    parser.add_argument("--queue-size", type=int, default=2)
+    parser.add_argument("--reuse", type=int, default=1)
+    parser.add_argument("--rho-bar", type=float, default=1.0)
+    parser.add_argument("--c-bar", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    runs = {}
+    for name, train in [("sync", train_sync), ("vtrace", train_vtrace)]:
+        runs[name] = train(args)
+
+    print("{:>10} {:>12} {:>12}".format("time (s)", "sync", "vtrace"))
+    for fraction in [0.25, 0.5, 0.75, 1.0]:
+        time_limit = fraction * args.budget
+        print("{:>10.0f} {:>12.3f} {:>12.3f}".format(
+            time_limit, best_reward(runs["sync"][0], time_limit),
+            best_reward(runs["vtrace"][0], time_limit)))
+    for name, (points, num_updates) in runs.items():
+        print("{}: {} episodes, {} updates".format(name, len(points), num_updates))
@@ -1,12 +1,20 @@
+import copy
 import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
 
+import torch
 from baselines.common.vec_env.dummy_vec_env import DummyVecEnv
 from baselines.common.vec_env.shmem_vec_env import ShmemVecEnv
 
+from .checkpoint import merge_ob_rms
 from .envs import make_vec_envs, VecNormalize, Converter
+from .model import Policy
+from .storage import RolloutStorage
 
 class Actor:
-    def __init__(self, actor_id, env_fn, agent_rref, args):
+    def __init__(self, actor_id, env_fn, agent_rref, args, shared_slots=None, ob_rms=None):
+        start_time = time.time()
         self.id = actor_id
         self.n_env_per_actor = args.num_envs // args.num_actors
         self.n_split = args.num_splits
@@ -14,25 +22,121 @@ class Actor:
         self.n_step = args.num_steps
 
         self.agent_rref = agent_rref
+        self.shared_slots = shared_slots
 
-        self.envs = []
-        for i in range(self.n_split):
-            idx = actor_id * self.n_env_per_actor + i * self.n_env_per_split
-            env = [env_fn(version=idx + j) for j in range(self.n_env_per_split)]
-            env = ShmemVecEnv(env) if self.n_env_per_split > 1 else DummyVecEnv(env)
-            env = VecNormalize(env, gamma=args.gamma)
-            env = Converter(env)
-            self.envs.append(env)
+        # the envs of the splits are built and reset concurrently
+        self.startup_times = {}
+        with ThreadPoolExecutor(self.n_split) as executor:
+            splits = list(executor.map(lambda i: self._make_envs(i, env_fn, args, ob_rms), \
+                range(self.n_split)))
+        self.envs = [env for env, _ in splits]
+        self.init_obs = [obs for _, obs in splits]
         self.action_futures = []
+
+        # local copy of the policy, when the actor selects its own actions
+        self.local_inference = args.local_inference
+        if self.local_inference:
+            obs_shape = self.envs[0].observation_space.shape
+            action_space = self.envs[0].action_space
+            self.policy = Policy(obs_shape, action_space, \
+                base_kwargs={'recurrent': args.recurrent_policy})
+            self.policy_lock = Lock()
+            self.policy_version = 0
+            self.rollouts = [RolloutStorage(self.n_step, self.n_env_per_split, 1, obs_shape, \
+                action_space, self.policy.recurrent_hidden_state_size) for i in range(self.n_split)]
+            self.rollout_rewards = [torch.zeros(self.n_env_per_split) for i in range(self.n_split)]
+        self.startup_times['total'] = time.time() - start_time
         print('actor {} init completes'.format(actor_id))
+        self.agent_rref.rpc_sync().actor_ready(actor_id, self.startup_times)
+
+    def _make_envs(self, split_id, env_fn, args, ob_rms):
+        # return the envs of a split and their first observations
+        start_time = time.time()
+        idx = self.id * self.n_env_per_actor + split_id * self.n_env_per_split
+        env = [env_fn(version=idx + j) for j in range(self.n_env_per_split)]
+        env = ShmemVecEnv(env) if self.n_env_per_split > 1 else DummyVecEnv(env)
+        env = VecNormalize(env, gamma=args.gamma)
+        if ob_rms is not None:
+            env.ob_rms = copy.deepcopy(ob_rms)
+        env = Converter(env)
+        build_time = time.time()
+        # waits for the envs built in the subprocesses
+        obs = env.reset()
+        self.startup_times['split {} build'.format(split_id)] = build_time - start_time
+        self.startup_times['split {} reset'.format(split_id)] = time.time() - build_time
+        return env, obs
+
+    def set_weights(self, state_dict, version):
+        with self.policy_lock:
+            self.policy.load_state_dict(state_dict)
+            self.policy_version = version
 
     def get_ob_rms(self):
-        return self.envs[0].ob_rms
+        return merge_ob_rms([env.ob_rms for env in self.envs])
+
+    def select_action(self, split_id, model_inputs, init=False):
+        if self.shared_slots is None:
+            return self.agent_rref.rpc_async().select_action(self.id, split_id, model_inputs, init=init)
+        # only send the index of the slot holding the step outputs
+        if init:
+            slot = self.shared_slots.write(self.id, split_id, model_inputs)
+        else:
+            slot = self.shared_slots.write(self.id, split_id, *model_inputs)
+        return self.agent_rref.rpc_async().select_action_from_slot(self.id, split_id, slot, init=init)
+
+    def _local_act(self, split_id):
+        rollout = self.rollouts[split_id]
+        obs, recurrent_hidden_states, masks, action_masks = rollout.get_inputs('cpu')
+        with self.policy_lock, torch.no_grad():
+            value, action, action_log_prob, recurrent_hidden_states = self.policy.act(obs, \
+                recurrent_hidden_states, masks, action_masks=action_masks)
+            version = self.policy_version
+
+        if rollout.step == self.n_step - 1:
+            # send the complete rollout, it is serialized before the call returns
+            self.agent_rref.rpc_async().add_rollout(self.id, split_id, rollout, \
+                self.rollout_rewards[split_id])
+            self.rollout_rewards[split_id] = torch.zeros(self.n_env_per_split)
+            rollout.after_update()
+        rollout.step = (rollout.step + 1) % self.n_step
+        rollout.insert_after_inference(recurrent_hidden_states, action, action_log_prob, value)
+        rollout.policy_versions[rollout.step] = version
+        return action
+
+    def _local_insert(self, split_id, model_inputs):
+        obs, reward, done, infos = model_inputs
+        done = torch.tensor(done, dtype=bool)
+        masks = (~done).float().unsqueeze(1)
+        bad_masks = torch.FloatTensor([[0.0] if 'bad_transition' in info.keys() else [1.0] \
+            for info in infos])
+        action_masks = torch.cat([info['action_mask'] for info in infos], dim=0)
+        self.rollouts[split_id].insert_before_inference(slice(None), obs, reward, action_masks, \
+            done, masks, bad_masks)
+        self.rollout_rewards[split_id] += torch.tensor([info['reward'] for info in infos])
+
+    def run_local(self):
+        actions = []
+        for i, env in enumerate(self.envs):
+            self.rollouts[i].obs[0].copy_(self.init_obs[i])
+            actions.append(self._local_act(i))
+
+        while True:
+            for j in range(self.n_step):
+                for i, env in enumerate(self.envs):
+                    model_inputs = env.step(actions[i])
+                    obs, reward, done, infos = model_inputs
+                    if j == self.n_step - 1 and any(~done):
+                        print('actor', self.id, 'crash reset')
+                        model_inputs = env.reset(), reward, done, infos
+                    self._local_insert(i, model_inputs)
+                    actions[i] = self._local_act(i)
 
     def run(self):
+        if self.local_inference:
+            return self.run_local()
+
         for i, env in enumerate(self.envs):
-            obs = env.reset()
-            action_fut = self.agent_rref.rpc_async().select_action(self.id, i, obs, init=True)
+            action_fut = self.select_action(i, self.init_obs[i], init=True)
             self.action_futures.append(action_fut)
 
         while True:
@@ -44,4 +148,4 @@ class Actor:
                     if j == self.n_step - 1 and any(~done):
                         print('actor', self.id, 'crash reset')
                         model_inputs = env.reset(), reward, done, infos
-                    self.action_futures[i] = self.agent_rref.rpc_async().select_action(self.id, i, model_inputs)
\ No newline at end of file
+                    self.action_futures[i] = self.select_action(i, model_inputs)
\ No newline at end of file
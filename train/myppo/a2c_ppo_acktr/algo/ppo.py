@@ -31,8 +31,30 @@ class PPO():
 
         self.optimizer = optim.Adam(actor_critic.parameters(), lr=lr, eps=eps)
 
+    def compute_vtrace_returns(self, rollouts, gamma, rho_bar, c_bar, use_proper_time_limits=False):
+        # evaluate the rollout, sampled by older policies, with the current one
+        num_steps, num_processes = rollouts.rewards.size()[0:2]
+        with torch.no_grad():
+            values, action_log_probs, _, _ = self.actor_critic.evaluate_actions(
+                rollouts.obs[:-1].view(-1, *rollouts.obs.size()[2:]),
+                rollouts.recurrent_hidden_states[0],
+                rollouts.masks[:-1].view(-1, 1),
+                rollouts.actions.view(-1, rollouts.actions.size(-1)),
+                rollouts.action_masks[:-1].view(-1, rollouts.action_masks.size(-1)))
+            next_value = self.actor_critic.get_value(
+                rollouts.obs[-1], rollouts.recurrent_hidden_states[-1],
+                rollouts.masks[-1])
+        values = torch.cat([values.view(num_steps, num_processes, 1),
+                            next_value.unsqueeze(0)])
+        rollouts.compute_vtrace_returns(
+            values, action_log_probs.view(num_steps, num_processes, 1),
+            gamma, rho_bar, c_bar, use_proper_time_limits)
+
     def update(self, rollouts):
-        advantages = rollouts.returns[:-1] - rollouts.value_preds[:-1]
+        if rollouts.advantages is not None:
+            advantages = rollouts.advantages
+        else:
+            advantages = rollouts.returns[:-1] - rollouts.value_preds[:-1]
         advantages = (advantages - advantages.mean()) / (
             advantages.std() + 1e-5)
 
@@ -51,12 +73,12 @@ class PPO():
             for sample in data_generator:
                 obs_batch, recurrent_hidden_states_batch, actions_batch, \
                    value_preds_batch, return_batch, masks_batch, old_action_log_probs_batch, \
-                        adv_targ = sample
+                        adv_targ, action_masks_batch = sample
 
                 # Reshape to do in a single forward pass for all steps
                 values, action_log_probs, dist_entropy, _ = self.actor_critic.evaluate_actions(
                     obs_batch, recurrent_hidden_states_batch, masks_batch,
-                    actions_batch)
+                    actions_batch, action_masks_batch)
 
                 ratio = torch.exp(action_log_probs -
                                   old_action_log_probs_batch)
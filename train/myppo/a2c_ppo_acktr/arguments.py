@@ -232,9 +232,84 @@ def get_args(args):
         default=1,
         help='number of times a slot is used in training'
     )
+    parser.add_argument(
+        '--dynamic-batching',
+        action='store_true',
+        default=False,
+        help='run the policy on the requests of any actors instead of waiting for all actors of a split'
+    )
+    parser.add_argument(
+        '--inference-batch-size',
+        type=int,
+        default=None,
+        help='maximum number of requests in a dynamic batch (default: number of actors)'
+    )
+    parser.add_argument(
+        '--inference-deadline',
+        type=float,
+        default=5,
+        help='time to wait for more requests in a dynamic batch, in ms (default: 5)'
+    )
+    parser.add_argument(
+        '--local-inference',
+        action='store_true',
+        default=False,
+        help='run the policy in the actors, which only send complete rollouts to the trainer'
+    )
+    parser.add_argument(
+        '--vtrace',
+        action='store_true',
+        default=False,
+        help='train asynchronously from the actors, with v-trace returns (implies --local-inference)'
+    )
+    parser.add_argument(
+        '--vtrace-rho-bar',
+        type=float,
+        default=1.0,
+        help='truncation level of the importance weights in the v-trace targets (default: 1.0)'
+    )
+    parser.add_argument(
+        '--vtrace-c-bar',
+        type=float,
+        default=1.0,
+        help='truncation level of the trace coefficients in the v-trace targets (default: 1.0)'
+    )
+    parser.add_argument(
+        '--shm-transport',
+        action='store_true',
+        default=False,
+        help='pass the step outputs of the actors through shared memory instead of rpc'
+    )
+    parser.add_argument(
+        '--shm-slots',
+        type=int,
+        default=2,
+        help='number of shared memory slots per actor and split (default: 2)'
+    )
+    parser.add_argument(
+        '--async-eval',
+        action='store_true',
+        default=False,
+        help='evaluate in a separate process, on snapshots of the policy, without pausing training'
+    )
+    parser.add_argument(
+        '--keep-checkpoints',
+        type=int,
+        default=None,
+        help='number of most recent checkpoints to keep (default: all)'
+    )
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        default=False,
+        help='resume training from the latest checkpoint of the experiment'
+    )
     args = parser.parse_args(args) if args is not None else parser.parse_args()
 
     args.cuda = not args.no_cuda and torch.cuda.is_available()
+    if args.vtrace:
+        # the actors select their actions without waiting for the trainer
+        args.local_inference = True
 
     assert args.algo in ['a2c', 'ppo', 'acktr']
     if args.recurrent_policy:
@@ -0,0 +1,99 @@
+import copy
+import glob
+import os
+import queue
+import threading
+
+import torch
+
+
+def merge_ob_rms(ob_rmses):
+    """Merge the running mean and variance of the observations of several envs."""
+    merged = copy.deepcopy(ob_rmses[0])
+    for ob_rms in ob_rmses[1:]:
+        merged.update_from_moments(ob_rms.mean, ob_rms.var, ob_rms.count)
+    return merged
+
+
+def _snapshot(obj):
+    # copy the tensors of nested state dicts to the cpu
+    if torch.is_tensor(obj):
+        return obj.detach().cpu().clone()
+    if isinstance(obj, dict):
+        return {k: _snapshot(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_snapshot(v) for v in obj)
+    return copy.deepcopy(obj)
+
+
+def checkpoint_path(save_path, index):
+    return os.path.join(save_path, str(index) + ".pt")
+
+
+def checkpoint_indices(save_path):
+    """Return the sorted indices of the checkpoints in save_path."""
+    names = [os.path.basename(path)[:-len('.pt')] for path in glob.glob(os.path.join(save_path, '*.pt'))]
+    return sorted(int(name) for name in names if name.isdigit())
+
+
+def load_checkpoint(path, map_location='cpu'):
+    """Load a checkpoint as a dict with the 'model' state dict and the 'ob_rms'.
+
+    Checkpoints of the trainer also hold the 'optimizer' state dict, the
+    'update' they were saved after and the 'policy_version'. Older checkpoints
+    hold the whole module instead of its state dict.
+    """
+    checkpoint = torch.load(path, map_location=map_location)
+    if isinstance(checkpoint, (list, tuple)):
+        actor_critic, ob_rms = checkpoint
+        checkpoint = {'model': actor_critic.state_dict(), 'ob_rms': ob_rms}
+    return checkpoint
+
+
+class CheckpointWriter:
+    """Writes the checkpoints of the trainer in a background thread.
+
+    save() only copies the state dicts to the cpu, so that the trainer can go
+    on updating the policy. The thread then waits for the ob_rms of the
+    actors, merges them, and writes the checkpoint to a temporary file which
+    is renamed into place, so that a checkpoint is never partially written.
+    Only the `keep` most recent checkpoints are kept, or all of them if None.
+    """
+
+    def __init__(self, save_path, keep=None):
+        self.save_path = save_path
+        self.keep = keep
+        self.requests = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def save(self, index, state, ob_rms_futures):
+        """Queue the checkpoint `index` of state, completed with the merged ob_rms."""
+        self.requests.put((index, _snapshot(state), ob_rms_futures))
+
+    def _run(self):
+        while True:
+            request = self.requests.get()
+            if request is None:
+                return
+            index, state, ob_rms_futures = request
+            try:
+                state['ob_rms'] = merge_ob_rms([fut.wait() for fut in ob_rms_futures])
+                self._write(index, state)
+            except Exception as e:
+                print('failed to write checkpoint {}: {}'.format(index, e))
+
+    def _write(self, index, state):
+        path = checkpoint_path(self.save_path, index)
+        tmp_path = path + '.tmp'
+        torch.save(state, tmp_path)
+        os.replace(tmp_path, path)
+
+        if self.keep is not None:
+            for old_index in checkpoint_indices(self.save_path)[:-self.keep]:
+                os.remove(checkpoint_path(self.save_path, old_index))
+
+    def close(self):
+        # waits for the queued checkpoints
+        self.requests.put(None)
+        self.thread.join()
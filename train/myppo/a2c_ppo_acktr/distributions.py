@@ -74,65 +74,69 @@ class Categorical(nn.Module):
         return FixedCategorical(logits=x)
 
 class FixedMultiCategorical:
+    """Independent categorical distributions over consecutive segments of the logits.
+
+    The segments are padded with -inf into a (batch, n_dim, max_dim) tensor, so
+    that the log-softmax, sampling, log-probabilities and entropy of all of
+    them are computed at once. A segment whose logits are all -inf (no valid
+    action) is uniform, its action is -1, and it counts for nothing in the
+    log-probabilities and the entropy (see is_all_inf_mask).
+    """
+
+    _pad_index = {}
 
     def __init__(self, logits=None, action_dims=None):
         self.action_dims = action_dims
-        self.distributions = []
-        self.is_all_inf = [] 
-        for idx, split in enumerate(torch.split(logits, tuple(self.action_dims), dim=1)):
-
-            is_cur_all_inf = torch.isinf(split).sum(1) == split.size(1)
-            self.is_all_inf.append(is_cur_all_inf)
-            split = split.masked_fill(is_cur_all_inf.unsqueeze(1), 1)
-            self.distributions.append(torch.distributions.Categorical(logits=split))
-
-            # if not torch.isinf(split).all():
-            #     self.distributions.append(torch.distributions.Categorical(logits=split))
-            # else:
-            #     assert idx > 1
-            #     self.distributions.append(None)
-                # self.distributions.append(torch.distributions.Categorical(logits=split))
-        self.is_all_inf_mask = torch.stack(self.is_all_inf, dim=1)
-        self.device = self.distributions[0].probs.device
-
-        # self.distributions = [torch.distributions.Categorical(logits=split) for split in torch.split(logits, tuple(self.action_dims), dim=1)]
+        self.n_dim = len(action_dims)
+        self.max_dim = max(action_dims)
+        self.device = logits.device
+        index, uniform = self._padding(tuple(action_dims), self.device)
+
+        padded = logits.new_full((logits.size(0), self.n_dim * self.max_dim), -float('inf'))
+        padded = padded.index_copy(1, index, logits).view(-1, self.n_dim, self.max_dim)
+        self.is_all_inf_mask = padded.amax(-1) == -float('inf')
+        padded = torch.where(self.is_all_inf_mask.unsqueeze(-1), uniform, padded)
+        # normalized, -inf for the masked actions and the padding
+        self.logits = F.log_softmax(padded, dim=-1)
+
+    @classmethod
+    def _padding(cls, action_dims, device):
+        # columns of the logits in the padded tensor, and padded uniform logits
+        key = (action_dims, device)
+        if key not in cls._pad_index:
+            max_dim = max(action_dims)
+            valid = torch.arange(max_dim).unsqueeze(0) < torch.tensor(action_dims).unsqueeze(1)
+            index = torch.nonzero(valid.flatten()).squeeze(1)
+            uniform = torch.zeros(valid.size()).masked_fill(~valid, -float('inf'))
+            cls._pad_index[key] = (index.to(device), uniform.to(device))
+        return cls._pad_index[key]
+
+    @property
+    def probs(self):
+        return self.logits.exp()
 
     def log_probs(self, actions):
-        try:
-            # actions_mask = actions == -1
-            actions.masked_fill_(self.is_all_inf_mask, 0)
-            log_probs_all = torch.stack(
-                    [dist.log_prob(action) for dist, action in zip(self.distributions, torch.unbind(actions, dim=1))], dim=1
-                )
-            log_probs_all.masked_fill_(self.is_all_inf_mask, 0)
-            return log_probs_all.sum(dim=1).unsqueeze(-1)
-        except Exception as e:
-            print(e)
+        actions.masked_fill_(self.is_all_inf_mask, 0)
+        log_probs_all = self.logits.gather(-1, actions.long().unsqueeze(-1)).squeeze(-1)
+        log_probs_all = log_probs_all.masked_fill(self.is_all_inf_mask, 0)
+        return log_probs_all.sum(dim=1).unsqueeze(-1)
 
     def entropy(self):
-        ent = torch.stack(
-            [dist.entropy() for dist in self.distributions], dim=1
-        )
-        ent.masked_fill_(self.is_all_inf_mask, 0)
+        # 0 * -inf is 0 for the actions of probability 0
+        logits = self.logits.masked_fill(torch.isinf(self.logits), 0)
+        ent = -(logits * self.logits.exp()).sum(-1)
+        ent = ent.masked_fill(self.is_all_inf_mask, 0)
         return ent.sum(dim=1)
 
     def sample(self):
-        try:
-            actions = torch.stack(
-                [dist.sample() for dist in self.distributions], dim=1
-            )
-            actions.masked_fill_(self.is_all_inf_mask, -1)
-            return actions
-        except Exception as e:
-            print(self.is_all_inf_mask)
-            print(e)
-            exit()
+        with torch.no_grad():
+            actions = torch.multinomial(self.probs.view(-1, self.max_dim), 1, True)
+        actions = actions.view(-1, self.n_dim)
+        actions.masked_fill_(self.is_all_inf_mask, -1)
+        return actions
 
     def mode(self):
-        # print('=' * 10, [torch.max(dist.probs, dim=1)[0] for dist in self.distributions])
-        actions = torch.stack(
-            [torch.argmax(dist.probs, dim=1) for dist in self.distributions], dim=1
-        )
+        actions = self.logits.argmax(dim=-1)
         actions.masked_fill_(self.is_all_inf_mask, -1)
         return actions
 
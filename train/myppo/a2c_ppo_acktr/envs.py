@@ -16,8 +16,6 @@ from baselines.common.vec_env.shmem_vec_env import ShmemVecEnv
 from baselines.common.vec_env.vec_normalize import \
     VecNormalize as VecNormalize_
 
-import threading
-from exclusiveprocess import Lock, CannotAcquireLock
 
 try:
     import dm_control2gym
@@ -92,52 +90,47 @@ def make_vec_envs(env_name,
                   reward_scale=None,
                   verbose=False):
 
-    while True:
-        try:
-            with Lock(name='make_vec_envs'):
-                if flow_params is None:
-                    envs = [
-                        make_env(env_name, seed, i, log_dir, allow_early_resets)
-                        for i in range(num_processes)
-                    ]
-                else:
-                    envs = []
-                    env_params = copy.deepcopy(flow_params)
-                    env_params['sim'].seed = seed
-                    for i in range(num_processes):
-                        if port is not None:
-                            envs.append(env_constructor(params=env_params, version=i, verbose=verbose, \
-                                port=port + i, popart_reward=popart_reward, gamma=gamma, \
-                                reward_scale=reward_scale, save_path=save_path))
-                        else:
-                            envs.append(env_constructor(params=env_params, version=i, verbose=verbose, \
-                                popart_reward=popart_reward, gamma=gamma, reward_scale=reward_scale, \
-                                save_path=save_path))
-
-                if len(envs) > 1:
-                    # envs = ShmemVecEnv(envs, context='fork')
-                    envs= ShmemVecEnv(envs)
-                else:
-                    envs = DummyVecEnv(envs)
-                
-                if len(envs.observation_space.shape) == 1:
-                    if gamma is None:
-                        envs = VecNormalize(envs, ret=False)
-                    else:
-                        envs = VecNormalize(envs, gamma=gamma)
-
-                if device is not None:
-                    envs = VecPyTorch(envs, device)
-                    if num_frame_stack is not None:
-                        envs = VecPyTorchFrameStack(envs, num_frame_stack, device)
-                    elif len(envs.observation_space.shape) == 3:
-                        envs = VecPyTorchFrameStack(envs, 4, device)
-                else:
-                    envs = Converter(envs)
-                
-                return envs
-        except CannotAcquireLock:
-            print("Try again")
+    if flow_params is None:
+        envs = [
+            make_env(env_name, seed, i, log_dir, allow_early_resets)
+            for i in range(num_processes)
+        ]
+    else:
+        envs = []
+        env_params = copy.deepcopy(flow_params)
+        env_params['sim'].seed = seed
+        for i in range(num_processes):
+            if port is not None:
+                envs.append(env_constructor(params=env_params, version=i, verbose=verbose, \
+                    port=port + i, popart_reward=popart_reward, gamma=gamma, \
+                    reward_scale=reward_scale, save_path=save_path))
+            else:
+                envs.append(env_constructor(params=env_params, version=i, verbose=verbose, \
+                    popart_reward=popart_reward, gamma=gamma, reward_scale=reward_scale, \
+                    save_path=save_path))
+
+    if len(envs) > 1:
+        # envs = ShmemVecEnv(envs, context='fork')
+        envs= ShmemVecEnv(envs)
+    else:
+        envs = DummyVecEnv(envs)
+
+    if len(envs.observation_space.shape) == 1:
+        if gamma is None:
+            envs = VecNormalize(envs, ret=False)
+        else:
+            envs = VecNormalize(envs, gamma=gamma)
+
+    if device is not None:
+        envs = VecPyTorch(envs, device)
+        if num_frame_stack is not None:
+            envs = VecPyTorchFrameStack(envs, num_frame_stack, device)
+        elif len(envs.observation_space.shape) == 3:
+            envs = VecPyTorchFrameStack(envs, 4, device)
+    else:
+        envs = Converter(envs)
+
+    return envs
 
 
 # Checks whether done was caused my timit limits or not
@@ -0,0 +1,85 @@
+import queue
+import threading
+import time
+
+import numpy as np
+import torch
+
+
+class InferenceServer:
+    """Runs the policy on dynamic batches of action requests.
+
+    A request is served together with the ones that arrive within `deadline`
+    seconds after it, up to `max_batch_size` requests, so that a slow actor
+    does not hold back the others. `infer_fn` takes a list of requests and
+    returns the result of each of them.
+    """
+
+    def __init__(self, infer_fn, max_batch_size, deadline):
+        self.infer_fn = infer_fn
+        self.max_batch_size = max_batch_size
+        self.deadline = deadline
+
+        self.requests = queue.Queue()
+        self.stats_lock = threading.Lock()
+        self.queue_depths = []
+        self.batch_sizes = []
+
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+
+    def submit(self, request):
+        """Queue a request, and return the future of its result."""
+        fut = torch.futures.Future()
+        self.requests.put((request, fut))
+        return fut
+
+    def _next_batch(self):
+        item = self.requests.get()
+        if item is None:
+            return None
+        batch = [item]
+        end_time = time.time() + self.deadline
+        while len(batch) < self.max_batch_size:
+            timeout = end_time - time.time()
+            if timeout <= 0:
+                break
+            try:
+                item = self.requests.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is None:
+                # serve the current batch before stopping
+                self.requests.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _serve(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            with self.stats_lock:
+                self.queue_depths.append(self.requests.qsize())
+                self.batch_sizes.append(len(batch))
+
+            try:
+                results = self.infer_fn([request for request, _ in batch])
+            except Exception as e:
+                for _, fut in batch:
+                    fut.set_exception(e)
+                continue
+            for (_, fut), result in zip(batch, results):
+                fut.set_result(result)
+
+    def pop_stats(self):
+        """Return and clear the queue depths and the batch sizes seen so far."""
+        with self.stats_lock:
+            queue_depths, self.queue_depths = self.queue_depths, []
+            batch_sizes, self.batch_sizes = self.batch_sizes, []
+        return np.array(queue_depths), np.array(batch_sizes)
+
+    def close(self):
+        self.requests.put(None)
+        self.thread.join()
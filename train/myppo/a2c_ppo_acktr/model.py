@@ -73,9 +73,13 @@ class Policy(nn.Module):
         value, _, _ = self.base(inputs, rnn_hxs, masks)
         return value
 
-    def evaluate_actions(self, inputs, rnn_hxs, masks, action):
+    def evaluate_actions(self, inputs, rnn_hxs, masks, action, action_masks=None):
         value, actor_features, rnn_hxs = self.base(inputs, rnn_hxs, masks)
-        dist = self.dist(actor_features)
+        if action_masks is None:
+            dist = self.dist(actor_features)
+        else:
+            # the same masks as in act, for the log-probs of the sampling policy
+            dist = self.dist(actor_features, masks=action_masks)
 
         action_log_probs = dist.log_probs(action)
         dist_entropy = dist.entropy().mean()
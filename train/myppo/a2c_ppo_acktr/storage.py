@@ -1,4 +1,3 @@
-import copy
 import queue
 
 from multiprocessing import Condition, Lock
@@ -6,6 +5,8 @@ from multiprocessing import Condition, Lock
 import torch
 from torch.utils.data.sampler import BatchSampler, SubsetRandomSampler
 
+from .transport import SharedRolloutSlots
+
 
 def _flatten_helper(T, N, _tensor):
     return _tensor.view(T * N, *_tensor.size()[2:])
@@ -35,6 +36,35 @@ class ReplayBuffer:
             self.n_actor, obs_shape, action_space, recurrent_hidden_state_size) \
             for i in range(self.n_split)]
         self.use_which_split = 0
+        self.device = torch.device("cuda:0" if args.cuda else "cpu")
+
+        # reused rollouts of the queues, starting with the one being written
+        # (or filled with segments) per split and the one being trained on,
+        # and growing up to the number of rollouts queued at once
+        self.pool = RolloutPool(self.n_split + 1, self.device, self.n_step, \
+            self.n_env_per_split * self.n_actor, self.n_actor, obs_shape, action_space, \
+            recurrent_hidden_state_size)
+
+        # with dynamic batching or local inference, the actors of a split are
+        # not in lockstep, so that each of them fills its own rollout, and the
+        # first n_actor completed ones are copied side by side into a rollout
+        # of the pool
+        self.dynamic_batching = args.dynamic_batching
+        if self.dynamic_batching:
+            self.actor_rollouts = [[RolloutStorage(self.n_step, self.n_env_per_split, 1, obs_shape, \
+                action_space, recurrent_hidden_state_size) for j in range(self.n_actor)] \
+                for i in range(self.n_split)]
+        self.segment_index = [None for i in range(self.n_split)]
+        self.segment_cnt = [0 for i in range(self.n_split)]
+        # reward totals of the envs of the segments, in the same order
+        self.segment_rewards = torch.zeros(self.n_split, self.n_actor * self.n_env_per_split)
+        self.segment_lock = Lock()
+
+        # slots in which the actors write their step outputs
+        self.shared_slots = None
+        if args.shm_transport:
+            self.shared_slots = SharedRolloutSlots(self.n_actor, self.n_split, \
+                self.n_env_per_split, obs_shape, sum(action_space.nvec), args.shm_slots)
 
         self.condition = Condition(Lock())
 
@@ -42,25 +72,33 @@ class ReplayBuffer:
         self.gamma = args.gamma
         self.gae_lambda = args.gae_lambda
         self.use_proper_time_limits = args.use_proper_time_limits
-        self.device = torch.device("cuda:0" if args.cuda else "cpu")
+        self.vtrace = args.vtrace
 
-    def _push(self, split_id, rollout):
-        rollout.to(self.device)
+    def _acquire(self):
+        with self.condition:
+            return self.pool.acquire()
+
+    def _push(self, split_id, index):
+        # the reference to the rollout of the pool is passed to the queue
         q = self.slot_queue[split_id]
         with self.condition:
             if q.qsize() == self.qsize:
-                q.get()
+                self.pool.decref(q.get())
                 self.slot_cnt[split_id] = 0
             print('putting rollout of split', split_id)
-            q.put(rollout)
+            q.put(index)
             if self.use_which_split == split_id:
                 self.condition.notify(1)
 
     def insert_before_inference(self, actor_id, split_id, obs, rewards, action_masks, masks, \
         bad_masks, done, init):
         # print('replay_buffer.insert_before_inference')
-        rollout = self.current_rollouts[split_id]
-        span = slice(actor_id * self.n_env_per_split, (actor_id + 1) * self.n_env_per_split)
+        if self.dynamic_batching:
+            rollout = self.actor_rollouts[split_id][actor_id]
+            span = slice(None)
+        else:
+            rollout = self.current_rollouts[split_id]
+            span = slice(actor_id * self.n_env_per_split, (actor_id + 1) * self.n_env_per_split)
         if init is True:
             rollout.obs[0, span] = obs
             return
@@ -69,22 +107,74 @@ class ReplayBuffer:
         rollout.insert_before_inference(span, obs, rewards, action_masks, done, masks, bad_masks)
         # print('return replay_buffer.insert_before_inference')
 
-    def get_policy_inputs(self, split_id, device):
+    def _add_segment(self, split_id, rollout, rewards):
+        with self.segment_lock:
+            if self.segment_index[split_id] is None:
+                self.segment_index[split_id] = self._acquire()
+            index = self.segment_index[split_id]
+            cnt = self.segment_cnt[split_id]
+            span = slice(cnt * self.n_env_per_split, (cnt + 1) * self.n_env_per_split)
+            self.pool.rollouts[index].copy_(rollout, span)
+            self.segment_rewards[split_id, span] = rewards
+            self.segment_cnt[split_id] = cnt + 1
+            if cnt + 1 < self.n_actor:
+                return None
+            rewards = self.segment_rewards[split_id].clone()
+            self.segment_index[split_id] = None
+            self.segment_cnt[split_id] = 0
+        self._push(split_id, index)
+        return rewards
+
+    def insert_rollout(self, split_id, rollout, rewards):
+        """Insert a complete rollout of an actor, with the reward totals of its envs.
+
+        Returns the reward totals of the envs of the pushed rollout, or None if
+        no rollout was pushed.
+        """
+        if not self.vtrace:
+            # v-trace returns are computed with the policy that is trained on the rollout
+            rollout.compute_returns(torch.zeros(rollout.rewards.size(1), 1), \
+                self.use_gae, self.gamma, self.gae_lambda, self.use_proper_time_limits)
+        return self._add_segment(split_id, rollout, rewards)
+
+    def get_policy_inputs(self, split_id, device, actor_id=None):
         # get the state out
-        rollout = self.current_rollouts[split_id]
+        if actor_id is None:
+            rollout = self.current_rollouts[split_id]
+        else:
+            rollout = self.actor_rollouts[split_id][actor_id]
         return rollout.get_inputs(device)
 
     def insert_after_inference(self, split_id, recurrent_hidden_states, actions, action_log_probs, \
-        value_preds):       
-        
-        rollout = self.current_rollouts[split_id]
+        value_preds, actor_id=None, rewards=None):
+        """Insert the outputs of the policy.
+
+        The rollout of an actor is updated when actor_id is given (with dynamic
+        batching), otherwise the rollout of the whole split. rewards are the
+        reward totals of the envs of that rollout so far, which are stored
+        with it when it is complete.
+
+        Returns the reward totals of the envs of the pushed rollout, or None if
+        no rollout was pushed.
+        """
+        if actor_id is None:
+            rollout = self.current_rollouts[split_id]
+        else:
+            rollout = self.actor_rollouts[split_id][actor_id]
 
+        pushed_rewards = None
         if rollout.step == self.n_step - 1:
             # compute returns
-            rollout.compute_returns(torch.zeros(self.n_env_per_split * self.n_actor, 1), \
+            rollout.compute_returns(torch.zeros(rollout.rewards.size(1), 1), \
                 self.use_gae, self.gamma, self.gae_lambda, self.use_proper_time_limits)
             # store the rollout
-            self._push(split_id, copy.deepcopy(rollout))
+            if actor_id is None:
+                index = self._acquire()
+                self.pool.rollouts[index].copy_(rollout)
+                self._push(split_id, index)
+                pushed_rewards = rewards
+            else:
+                pushed_rewards = self._add_segment(split_id, rollout, rewards)
             # reset the rollout
             rollout.after_update()
 
@@ -93,23 +183,100 @@ class ReplayBuffer:
         # insert the rest of the step
         rollout.insert_after_inference(recurrent_hidden_states, actions, action_log_probs, \
             value_preds)
+        return pushed_rewards
 
     def get(self):
+        """Return the next rollout to train on, which is released with self.release.
+
+        The rollout is not copied, and is not overwritten until it is released.
+        """
         # take one rollout out, counter++
         split_id = self.use_which_split
         q = self.slot_queue[split_id]
         with self.condition:
             self.condition.wait_for(lambda: q.qsize() > 0)
-            rollout = q.queue[0]
+            index = q.queue[0]
+            self.pool.incref(index)
             self.slot_cnt[split_id] += 1
             if self.slot_cnt[split_id] == self.reuse:
-                q.get()
+                self.pool.decref(q.get())
                 self.slot_cnt[split_id] = 0
             self.use_which_split = (self.use_which_split + 1) % self.n_split
-        return rollout
+        return self.pool.rollouts[index]
+
+    def release(self, rollout):
+        with self.condition:
+            self.pool.decref(rollout.pool_index)
+
+    def close(self):
+        if self.shared_slots is not None:
+            self.shared_slots.close()
+
+
+def reverse_scan(coefs, values, last=None):
+    """Return x with x[t] = values[t] + coefs[t] * x[t + 1] for t < T, and x[T] = last.
+
+    Instead of looping over the T steps, the affine maps of the steps are
+    composed pairwise in log2(T) vectorized steps (a Hillis-Steele scan).
+    last defaults to 0.
+    """
+    if last is not None:
+        values = torch.cat([values[:-1], values[-1:] + coefs[-1:] * last])
+    n_step = values.size(0)
+    d = 1
+    while d < n_step:
+        # the map of step t now covers the steps t to t + 2d - 1
+        values = torch.cat([values[:-d] + coefs[:-d] * values[d:], values[-d:]])
+        coefs = torch.cat([coefs[:-d] * coefs[d:], coefs[-d:]])
+        d *= 2
+    return values
+
+
+class RolloutPool:
+    """Rollouts reference counted so that they can be reused once released.
+
+    The methods are not thread-safe, ReplayBuffer calls them under its lock.
+    """
+
+    def __init__(self, size, device, *storage_args):
+        self.device = device
+        self.storage_args = storage_args
+        self.rollouts = []
+        self.refcounts = []
+        for i in range(size):
+            self._allocate()
+
+    def _allocate(self):
+        rollout = RolloutStorage(*self.storage_args)
+        rollout.to(self.device)
+        rollout.pool_index = len(self.rollouts)
+        self.rollouts.append(rollout)
+        self.refcounts.append(0)
+
+    def acquire(self):
+        """Return the index of a free rollout, with one reference to it."""
+        for index, refcount in enumerate(self.refcounts):
+            if refcount == 0:
+                break
+        else:
+            # the pool only grows until it holds the working set of rollouts
+            self._allocate()
+            index = len(self.rollouts) - 1
+        self.refcounts[index] = 1
+        return index
+
+    def incref(self, index):
+        self.refcounts[index] += 1
+
+    def decref(self, index):
+        assert self.refcounts[index] > 0
+        self.refcounts[index] -= 1
 
 
 class RolloutStorage(object):
+    tensor_names = ['obs', 'recurrent_hidden_states', 'rewards', 'value_preds', 'returns', \
+        'action_log_probs', 'actions', 'action_masks', 'dones', 'masks', 'bad_masks', 'policy_versions']
+
     def __init__(self, num_steps, num_processes, n_actor, obs_shape, action_space,
                  recurrent_hidden_state_size):
         self.obs = torch.zeros(num_steps + 1, num_processes, *obs_shape)
@@ -132,6 +299,10 @@ class RolloutStorage(object):
             dtype=bool)
         self.dones = torch.zeros((num_steps, num_processes), dtype=bool)
         self.masks = torch.ones(num_steps + 1, num_processes, 1)
+        # version of the policy that selected each action
+        self.policy_versions = torch.zeros((num_steps, num_processes), dtype=torch.long)
+        # advantages of the v-trace targets, None for the other returns
+        self.advantages = None
 
         # Masks that indicate whether it's a true terminal state
         # or time limit end state
@@ -140,6 +311,12 @@ class RolloutStorage(object):
         self.num_steps = num_steps
         self.step = -1
 
+    def copy_(self, rollout, span=slice(None)):
+        """Copy a rollout in place, into the processes of span."""
+        for name in self.tensor_names:
+            getattr(self, name)[:, span].copy_(getattr(rollout, name))
+        self.advantages = None
+
     def to(self, device):
         self.obs = self.obs.to(device)
         self.recurrent_hidden_states = self.recurrent_hidden_states.to(device)
@@ -148,6 +325,7 @@ class RolloutStorage(object):
         self.returns = self.returns.to(device)
         self.action_log_probs = self.action_log_probs.to(device)
         self.actions = self.actions.to(device)
+        self.action_masks = self.action_masks.to(device)
         self.masks = self.masks.to(device)
         self.bad_masks = self.bad_masks.to(device)
         self.device = device
@@ -190,6 +368,7 @@ class RolloutStorage(object):
     def after_update(self):
         self.obs[0].copy_(self.obs[-1])
         self.recurrent_hidden_states[0].copy_(self.recurrent_hidden_states[-1])
+        self.action_masks[0].copy_(self.action_masks[-1])
         self.masks[0].copy_(self.masks[-1])
         self.bad_masks[0].copy_(self.bad_masks[-1])
 
@@ -199,36 +378,71 @@ class RolloutStorage(object):
                         gamma,
                         gae_lambda,
                         use_proper_time_limits):
-        if use_proper_time_limits:
-            if use_gae:
-                self.value_preds[-1] = next_value
-                gae = 0
-                for step in reversed(range(self.rewards.size(0))):
-                    delta = self.rewards[step] + gamma * self.value_preds[step + 1] * \
-                        self.masks[step + 1] - self.value_preds[step]
-                    gae = delta + gamma * gae_lambda * self.masks[step + 1] * gae
-                    gae = gae * self.bad_masks[step + 1]
-                    self.returns[step] = gae + self.value_preds[step]
-            else:
-                self.returns[-1] = next_value
-                for step in reversed(range(self.rewards.size(0))):
-                    self.returns[step] = (self.returns[step + 1] * gamma * self.masks[step + 1] + \
-                        self.rewards[step]) * self.bad_masks[step + 1] + \
-                        (1 - self.bad_masks[step + 1]) * self.value_preds[step]
+        # the returns (or advantages with gae) follow a linear recurrence, see reverse_scan
+        masks = self.masks[1:]
+        bad_masks = self.bad_masks[1:]
+        if use_gae:
+            self.value_preds[-1] = next_value
+            deltas = self.rewards + gamma * self.value_preds[1:] * masks - self.value_preds[:-1]
+            coefs = gamma * gae_lambda * masks
+            if use_proper_time_limits:
+                deltas = deltas * bad_masks
+                coefs = coefs * bad_masks
+            self.returns[:-1] = reverse_scan(coefs, deltas) + self.value_preds[:-1]
         else:
-            if use_gae:
-                self.value_preds[-1] = next_value
-                gae = 0
-                for step in reversed(range(self.rewards.size(0))):
-                    delta = self.rewards[step] + gamma * self.value_preds[step + 1] * \
-                        self.masks[step + 1] - self.value_preds[step]
-                    gae = delta + gamma * gae_lambda * self.masks[step + 1] * gae
-                    self.returns[step] = gae + self.value_preds[step]
-            else:
-                self.returns[-1] = next_value
-                for step in reversed(range(self.rewards.size(0))):
-                    self.returns[step] = self.returns[step + 1] * gamma * self.masks[step + 1] + \
-                        self.rewards[step]
+            self.returns[-1] = next_value
+            rewards = self.rewards
+            coefs = gamma * masks
+            if use_proper_time_limits:
+                rewards = rewards * bad_masks + (1 - bad_masks) * self.value_preds[:-1]
+                coefs = coefs * bad_masks
+            self.returns[:-1] = reverse_scan(coefs, rewards, self.returns[-1])
+
+    def compute_vtrace_returns(self, values, action_log_probs, gamma, rho_bar, c_bar,
+                               use_proper_time_limits=False):
+        """Compute the v-trace targets of the values of the policy being trained.
+
+        The actions were sampled by older policies, with self.action_log_probs.
+        As in compute_returns, steps that end in a time limit truncation
+        (bad_masks of 0) are not treated as terminal when using proper time
+        limits: their target is their own value, the trace is cut there, and
+        their advantage is zero.
+
+        Parameters
+        ----------
+        values : torch.Tensor
+            values of obs under the trained policy, of shape (num_steps + 1, num_processes, 1)
+        action_log_probs : torch.Tensor
+            log-probabilities of the actions under the trained policy, of shape
+            (num_steps, num_processes, 1)
+        gamma : float
+            discount factor
+        rho_bar : float
+            truncation level of the importance weights
+        c_bar : float
+            truncation level of the trace coefficients
+        use_proper_time_limits : bool
+            whether to bootstrap through the time limit truncations
+        """
+        rhos = torch.exp(action_log_probs - self.action_log_probs)
+        clipped_rhos = rhos.clamp(max=rho_bar)
+        cs = rhos.clamp(max=c_bar)
+        discounts = gamma * self.masks[1:]
+        deltas = clipped_rhos * (self.rewards + discounts * values[1:] - values[:-1])
+        coefs = discounts * cs
+        if use_proper_time_limits:
+            bad_masks = self.bad_masks[1:]
+            deltas = deltas * bad_masks
+            coefs = coefs * bad_masks
+
+        vs_minus_values = reverse_scan(coefs, deltas)
+
+        self.value_preds.copy_(values)
+        self.returns[:-1] = vs_minus_values + values[:-1]
+        self.returns[-1] = values[-1]
+        self.advantages = clipped_rhos * (self.rewards + discounts * self.returns[1:] - values[:-1])
+        if use_proper_time_limits:
+            self.advantages = self.advantages * bad_masks
 
     def feed_forward_generator(self,
                                advantages,
@@ -260,13 +474,16 @@ class RolloutStorage(object):
             masks_batch = self.masks[:-1].view(-1, 1)[indices]
             old_action_log_probs_batch = self.action_log_probs.view(-1,
                                                                     1)[indices]
+            action_masks_batch = self.action_masks[:-1].view(
+                -1, self.action_masks.size(-1))[indices]
             if advantages is None:
                 adv_targ = None
             else:
                 adv_targ = advantages.view(-1, 1)[indices]
 
             yield obs_batch, recurrent_hidden_states_batch, actions_batch, \
-                value_preds_batch, return_batch, masks_batch, old_action_log_probs_batch, adv_targ
+                value_preds_batch, return_batch, masks_batch, old_action_log_probs_batch, \
+                adv_targ, action_masks_batch
 
     def recurrent_generator(self, advantages, num_mini_batch):
         num_processes = self.rewards.size(1)
@@ -285,6 +502,7 @@ class RolloutStorage(object):
             masks_batch = []
             old_action_log_probs_batch = []
             adv_targ = []
+            action_masks_batch = []
 
             for offset in range(num_envs_per_batch):
                 ind = perm[start_ind + offset]
@@ -298,6 +516,7 @@ class RolloutStorage(object):
                 old_action_log_probs_batch.append(
                     self.action_log_probs[:, ind])
                 adv_targ.append(advantages[:, ind])
+                action_masks_batch.append(self.action_masks[:-1, ind])
 
             T, N = self.num_steps, num_envs_per_batch
             # These are all tensors of size (T, N, -1)
@@ -309,6 +528,7 @@ class RolloutStorage(object):
             old_action_log_probs_batch = torch.stack(
                 old_action_log_probs_batch, 1)
             adv_targ = torch.stack(adv_targ, 1)
+            action_masks_batch = torch.stack(action_masks_batch, 1)
 
             # States is just a (N, -1) tensor
             recurrent_hidden_states_batch = torch.stack(
@@ -323,6 +543,8 @@ class RolloutStorage(object):
             old_action_log_probs_batch = _flatten_helper(T, N, \
                     old_action_log_probs_batch)
             adv_targ = _flatten_helper(T, N, adv_targ)
+            action_masks_batch = _flatten_helper(T, N, action_masks_batch)
 
             yield obs_batch, recurrent_hidden_states_batch, actions_batch, \
-                value_preds_batch, return_batch, masks_batch, old_action_log_probs_batch, adv_targ
+                value_preds_batch, return_batch, masks_batch, old_action_log_probs_batch, \
+                adv_targ, action_masks_batch
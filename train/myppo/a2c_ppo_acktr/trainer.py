@@ -13,11 +13,14 @@ from baselines.common.vec_env.dummy_vec_env import DummyVecEnv
 
 from .actor import Actor
 from .algo import PPO
+from .checkpoint import CheckpointWriter, checkpoint_indices, checkpoint_path, load_checkpoint, \
+    merge_ob_rms
+from .inference import InferenceServer
 from .model import Policy
 from .storage import ReplayBuffer, RolloutStorage
 from .utils import tocpu, update_linear_schedule
 from .envs import make_vec_envs
-from ..evaluation import evaluate
+from ..evaluation import AsyncEvaluator, evaluate
 from flow.utils.registry import env_constructor
 
 class Trainer:
@@ -27,6 +30,8 @@ class Trainer:
         self.save_path = os.path.join(os.path.join(args.save_dir, args.algo), args.experiment_name)
         os.makedirs(self.save_path, exist_ok=True)
         self.writer = SummaryWriter(os.path.join(self.save_path, 'tensorboard_logs'))
+        self.startup_times = {}
+        start_time = time.time()
         
         # Set device
         self.device = torch.device("cuda:0" if args.cuda else "cpu")
@@ -38,10 +43,18 @@ class Trainer:
             popart_reward=args.popart_reward, gamma=args.gamma, reward_scale=args.reward_scale, \
             save_path=self.save_path)
         self.example_env = DummyVecEnv([self.env_fn(version=0)])
-
-        # Create eval envs
-        self.eval_envs = make_vec_envs(args.env_name, args.seed, args.eval_num_processes, \
+        self.startup_times['example env'] = time.time() - start_time
+
+        # Create eval envs, or the process that owns them
+        start_time = time.time()
+        self.eval_envs = None
+        self.evaluator = None
+        if args.async_eval:
+            self.evaluator = AsyncEvaluator(args, flow_params, self.save_path)
+        else:
+            self.eval_envs = make_vec_envs(args.env_name, args.seed, args.eval_num_processes, \
                 None, self.save_path, True, device=self.device, flow_params=flow_params)
+        self.startup_times['eval envs'] = time.time() - start_time
 
         # Actor critic network
         self.actor_critic = Policy(
@@ -72,10 +85,19 @@ class Trainer:
         self.n_env_per_split = self.n_env_per_actor // self.n_split
         ## remote reference to actors
         self.actor_rrefs = []
+        self.actor_ready_futures = [torch.futures.Future() for _ in range(self.n_actor)]
+        self.actor_startup_times = [None] * self.n_actor
         self.rref = rpc.RRef(self)
         self.future_outputs = [torch.futures.Future() for _ in range(self.n_split)]
         self.locks = [Lock() for _ in range(self.n_split)]
         self.split_cnt = [0] * self.n_split
+        self.inference_server = None
+        self.local_inference = args.local_inference
+        self.policy_version = 0
+        if args.dynamic_batching:
+            max_batch_size = args.inference_batch_size or self.n_actor
+            self.inference_server = InferenceServer(self._infer, max_batch_size, \
+                args.inference_deadline / 1000)
 
         # Training parameters
         self.n_env_steps = args.num_env_steps
@@ -97,14 +119,58 @@ class Trainer:
         self.buffer = ReplayBuffer(args, self.example_env.observation_space.shape,
             self.example_env.action_space, self.actor_critic.recurrent_hidden_state_size)
 
+        # Checkpoints
+        self.checkpoint_writer = CheckpointWriter(self.save_path, args.keep_checkpoints)
+        self.start_update = 0
+        self.resume_ob_rms = None
+        if args.resume:
+            self.resume()
+
+    def resume(self):
+        indices = checkpoint_indices(self.save_path)
+        if not indices:
+            print('no checkpoint to resume from in', self.save_path)
+            return
+        checkpoint = load_checkpoint(checkpoint_path(self.save_path, indices[-1]), map_location=self.device)
+        self.actor_critic.load_state_dict(checkpoint['model'])
+        self.rollout_policy.load_state_dict(checkpoint['model'])
+        if 'optimizer' in checkpoint:
+            self.agent.optimizer.load_state_dict(checkpoint['optimizer'])
+        update = checkpoint.get('update', indices[-1] * self.save_interval)
+        self.start_update = update + 1
+        self.policy_version = checkpoint.get('policy_version', self.start_update)
+        # set in the envs of the actors once they are created
+        self.resume_ob_rms = checkpoint['ob_rms']
+        print('resuming from checkpoint {} after update {}'.format(indices[-1], update))
+
     def setup_actors(self):
-        self.actor_rrefs = []
-        for i in range(self.n_actor):
-            name = 'actor_{}'.format(i)
-            actor_rref = rpc.remote(name, Actor, args=(i, self.env_fn, self.rref, self.args))
+        # the actors build their envs concurrently, and report when they are ready
+        start_time = time.time()
+        self.actor_rrefs = [rpc.remote('actor_{}'.format(i), Actor, args=(i, self.env_fn, self.rref, \
+            self.args, self.buffer.shared_slots, self.resume_ob_rms)) for i in range(self.n_actor)]
+        torch.futures.wait_all(self.actor_ready_futures)
+        self.startup_times['actors'] = time.time() - start_time
+
+        for actor_rref in self.actor_rrefs:
+            if self.local_inference:
+                actor_rref.rpc_sync().set_weights(self._policy_state(), self.policy_version)
             actor_rref.remote().run()
-            self.actor_rrefs.append(actor_rref)
-            time.sleep(5)
+        self.log_startup()
+
+    def actor_ready(self, actor_id, startup_times):
+        self.actor_startup_times[actor_id] = startup_times
+        self.actor_ready_futures[actor_id].set_result(None)
+
+    def log_startup(self):
+        print('startup times (sec):')
+        for name, t in self.startup_times.items():
+            print('  {}: {:.1f}'.format(name, t))
+            self.writer.add_scalar('startup/' + name, t, 0)
+        for actor_id, startup_times in enumerate(self.actor_startup_times):
+            print('  actor {}: '.format(actor_id) + ', '.join('{} {:.1f}'.format(name, t) \
+                for name, t in startup_times.items()))
+        self.writer.add_scalars('startup/actor', {str(actor_id): startup_times['total'] \
+            for actor_id, startup_times in enumerate(self.actor_startup_times)}, 0)
 
     @rpc.functions.async_execution
     def select_action(self, actor_id, split_id, model_inputs, init=False):
@@ -112,20 +178,37 @@ class Trainer:
         if init == True:
             obs = model_inputs
             reward = torch.zeros(self.n_env_per_split, 1).float()
-            done = [False] * self.n_env_per_split
-            infos = [{} for i in range(self.n_env_per_split)]
+            done = torch.zeros(self.n_env_per_split, dtype=bool)
+            info_rewards = None
+            bad_transitions = torch.zeros(self.n_env_per_split, dtype=bool)
             action_masks = None
         else:
             obs, reward, done, infos = model_inputs
+            done = torch.tensor(done, dtype=bool)
+            info_rewards = torch.tensor([info['reward'] for info in infos])
+            bad_transitions = torch.tensor(['bad_transition' in info.keys() for info in infos])
             action_masks = torch.cat([info['action_mask'] for info in infos], dim=0)
+        return self._select_action(actor_id, split_id, obs, reward, done, info_rewards, \
+            bad_transitions, action_masks, init)
+
+    @rpc.functions.async_execution
+    def select_action_from_slot(self, actor_id, split_id, slot, init=False):
+        obs, reward, done, info_rewards, bad_transitions, action_masks = \
+            self.buffer.shared_slots.read(actor_id, split_id, slot)
+        if init:
+            info_rewards = None
+            action_masks = None
+        return self._select_action(actor_id, split_id, obs, reward, done, info_rewards, \
+            bad_transitions, action_masks, init)
+
+    def _select_action(self, actor_id, split_id, obs, reward, done, info_rewards, bad_transitions, \
+        action_masks, init):
         # print('after select action for actor {} split {}'.format(actor_id, split_id))
         obs = obs.to(self.device)
 
         # print('obs to device for actor {} split {}'.format(actor_id, split_id))
-        masks = torch.FloatTensor([[0.0] if done_ else [1.0] for done_ in done])
-        bad_masks = torch.FloatTensor([[0.0] if 'bad_transition' in info.keys() else [1.0] \
-            for info in infos])
-        done = torch.tensor(done, dtype=bool)
+        masks = (~done).float().unsqueeze(1)
+        bad_masks = (~bad_transitions).float().unsqueeze(1)
 
         # print('insert before inference for actor {} split {}'.format(actor_id, split_id))
         self.buffer.insert_before_inference(actor_id, split_id, obs, reward, action_masks, masks, \
@@ -134,9 +217,13 @@ class Trainer:
         # print('collect rollout rewards for actor {} split {}'.format(actor_id, split_id))
         # collect rollout information
         if init == False:
-            self.rollout_rewards[split_id, actor_id] += torch.tensor([info['reward'] for info in infos])
+            with self.log_lock:
+                self.rollout_rewards[split_id, actor_id] += info_rewards
         # END
 
+        if self.inference_server is not None:
+            return self.inference_server.submit((actor_id, split_id))
+
         def _unpack(action_batch_futures):
             action_batch = action_batch_futures.wait()
             batch_slice = slice(actor_id * self.n_env_per_split, (actor_id + 1) * \
@@ -159,12 +246,17 @@ class Trainer:
                     outputs = self.rollout_policy.act(obs, recurrent_hidden_states, masks, \
                         action_masks=action_masks)
                 value, action, action_log_prob, recurrent_hidden_states = tocpu(outputs)
-                self.buffer.insert_after_inference(split_id, recurrent_hidden_states, action, \
-                    action_log_prob, value)
+                # the actors of the split are in lockstep, and all wait for this action
+                with self.log_lock:
+                    rewards = self.rollout_rewards[split_id].flatten().clone()
+                pushed_rewards = self.buffer.insert_after_inference(split_id, \
+                    recurrent_hidden_states, action, action_log_prob, value, rewards=rewards)
 
-                if self.buffer.current_rollouts[split_id].step == 0 and init == False:
+                if pushed_rewards is not None:
                     print("log done actor {} split {} step {}".format(actor_id, split_id, self.buffer.current_rollouts[split_id].step))
-                    self.log_rollout(split_id)
+                    with self.log_lock:
+                        self.rollout_rewards[split_id] = 0.0
+                    self.log_rollout(split_id, pushed_rewards)
 
                 self.split_cnt[split_id] = 0
                 cur_fut = self.future_outputs[split_id]
@@ -175,9 +267,51 @@ class Trainer:
 
         return fut
 
-    def log_rollout(self, split_id):
+    def add_rollout(self, actor_id, split_id, rollout, rewards):
+        # complete rollout of an actor that runs the policy locally, with its reward totals
+        pushed_rewards = self.buffer.insert_rollout(split_id, rollout, rewards)
+        if pushed_rewards is not None:
+            self.log_rollout(split_id, pushed_rewards)
+
+    def _policy_state(self):
+        return {k: v.cpu() for k, v in self.rollout_policy.state_dict().items()}
+
+    def broadcast_weights(self):
+        state_dict = self._policy_state()
+        for actor_rref in self.actor_rrefs:
+            actor_rref.rpc_async().set_weights(state_dict, self.policy_version)
+
+    def _infer(self, requests):
+        # run the policy on the envs of the (actor_id, split_id) requests at once
+        inputs = [self.buffer.get_policy_inputs(split_id, self.device, actor_id) \
+            for actor_id, split_id in requests]
+        obs, recurrent_hidden_states, masks, action_masks = [torch.cat(x) for x in zip(*inputs)]
+        with torch.no_grad():
+            outputs = self.rollout_policy.act(obs, recurrent_hidden_states, masks, \
+                action_masks=action_masks)
+        value, action, action_log_prob, recurrent_hidden_states = tocpu(outputs)
+
+        actions = []
+        for i, (actor_id, split_id) in enumerate(requests):
+            span = slice(i * self.n_env_per_split, (i + 1) * self.n_env_per_split)
+            # the actor waits for this action, so its rewards do not change meanwhile
+            with self.log_lock:
+                rewards = self.rollout_rewards[split_id, actor_id].clone()
+            pushed_rewards = self.buffer.insert_after_inference(split_id, \
+                recurrent_hidden_states[span], action[span], action_log_prob[span], value[span], \
+                actor_id=actor_id, rewards=rewards)
+            if self.buffer.actor_rollouts[split_id][actor_id].step == 0:
+                # the segment of the actor is stored with its rewards, the next one starts
+                with self.log_lock:
+                    self.rollout_rewards[split_id, actor_id] = 0.0
+            if pushed_rewards is not None:
+                self.log_rollout(split_id, pushed_rewards)
+            actions.append(action[span])
+        return actions
+
+    def log_rollout(self, split_id, rewards):
+        """Log the reward totals of the envs of a rollout pushed by the split."""
         with self.log_lock:
-            rewards = self.rollout_rewards[split_id]
             self.writer.add_scalars(
                 "rewards/train", 
                 {
@@ -196,13 +330,22 @@ class Trainer:
                 split_id, rewards.mean(), mean_reward))
             print("running_mean_reward / train_time {:.5f}, time {:.3f} sec".format(\
                 mean_reward / (time.time() - self.start_time), time.time() - self.start_time))
-            self.rollout_rewards[split_id] = 0.0
             self.global_steps += self.batch_size
 
     def train(self, idx):
         train_rollouts = self.buffer.get()
+        if self.args.vtrace:
+            self.agent.compute_vtrace_returns(train_rollouts, self.args.gamma, \
+                self.args.vtrace_rho_bar, self.args.vtrace_c_bar, self.args.use_proper_time_limits)
+        policy_lag = (self.policy_version - train_rollouts.policy_versions).float().mean()
         value_loss, action_loss, dist_entropy = self.agent.update(train_rollouts)
         self.rollout_policy.load_state_dict(self.actor_critic.state_dict())
+        self.policy_version += 1
+        if self.local_inference:
+            self.broadcast_weights()
+            self.writer.add_scalar('policy lag', policy_lag, (idx + 1) * self.batch_size)
+
+        self.buffer.release(train_rollouts)
 
         self.log_train(idx, value_loss, action_loss, dist_entropy)
         self.save_train(idx)
@@ -211,23 +354,40 @@ class Trainer:
         self.writer.add_scalar('training loss/value loss', value_loss, (idx + 1) * self.batch_size)
         self.writer.add_scalar('training loss/action loss', action_loss, (idx + 1) * self.batch_size)
         self.writer.add_scalar('training loss/dist_entropy', dist_entropy, (idx + 1) * self.batch_size)
+        if self.inference_server is not None:
+            queue_depths, batch_sizes = self.inference_server.pop_stats()
+            if len(batch_sizes) > 0:
+                self.writer.add_histogram('inference/queue depth', queue_depths, (idx + 1) * self.batch_size)
+                self.writer.add_histogram('inference/batch size', batch_sizes, (idx + 1) * self.batch_size)
         
         if idx % self.log_interval == 0:
             total_num_steps = (idx + 1) * self.batch_size
             end_time = time.time()
             print('\n' + '=' * 20, "Updates {}, num timesteps {}, FPS {}, cur FPS {}\n".format(idx, \
-                total_num_steps, int(total_num_steps / (end_time - self.start_time)), \
+                total_num_steps, int((idx + 1 - self.start_update) * self.batch_size / \
+                    (end_time - self.start_time)), \
                     int(self.batch_size / (end_time - self.up_start_time))))
 
+    def _ob_rms_futures(self):
+        return [actor_rref.rpc_async().get_ob_rms() for actor_rref in self.actor_rrefs]
+
     def save_train(self, idx):
         if idx % self.save_interval == 0:
-            ob_rms = self.actor_rrefs[0].rpc_sync().get_ob_rms()
-            torch.save([self.actor_critic, ob_rms], \
-                os.path.join(self.save_path, str(idx // self.save_interval) + ".pt"))
+            state = {
+                'model': self.actor_critic.state_dict(),
+                'optimizer': self.agent.optimizer.state_dict(),
+                'update': idx,
+                'policy_version': self.policy_version,
+            }
+            self.checkpoint_writer.save(idx // self.save_interval, state, self._ob_rms_futures())
 
     def eval(self, idx):
         total_num_steps = (idx + 1) * self.batch_size
-        ob_rms = self.actor_rrefs[0].rpc_sync().get_ob_rms()
+        if self.evaluator is not None:
+            # the ob_rms of the actors are merged by the evaluator
+            self.evaluator.submit(self.actor_critic.state_dict(), self._ob_rms_futures(), total_num_steps)
+            return
+        ob_rms = merge_ob_rms([fut.wait() for fut in self._ob_rms_futures()])
         evaluate(self.actor_critic, self.eval_envs, ob_rms, self.eval_num_processes, self.device, \
             self.save_path, self.writer, total_num_steps)
 
@@ -238,7 +398,7 @@ class Trainer:
         self.start_time = time.time()
         num_updates = self.n_env_steps // self.n_step_per_ep // (self.n_env_per_split * self.n_actor)
         
-        for j in range(num_updates):
+        for j in range(self.start_update, num_updates):
             self.up_start_time = time.time()
 
             if self.eval_interval is not None and j % self.eval_interval == 0:
@@ -250,4 +410,12 @@ class Trainer:
 
             self.train(j)
             
-        self.eval_envs.close()
+        self.checkpoint_writer.close()
+        if self.evaluator is not None:
+            # waits for the pending evaluations
+            self.evaluator.close()
+        else:
+            self.eval_envs.close()
+        if self.inference_server is not None:
+            self.inference_server.close()
+        self.buffer.close()
@@ -0,0 +1,113 @@
+import math
+import uuid
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+import torch
+
+
+class SharedRolloutSlots:
+    """Shared-memory ring slots in which actors write their step outputs.
+
+    Every (actor, split) pair owns `n_slot` slots. An actor writes the
+    observations, rewards, dones and bit-packed action masks of a step into
+    its next slot and only sends the slot index to the trainer, which reads
+    the step back without any copy through the RPC layer.
+
+    The trainer creates the slots; pickling them (e.g. as an argument of
+    `rpc.remote`) only sends the name of the shared memory block, which the
+    actor attaches to when unpickling.
+    """
+
+    def __init__(self, n_actor, n_split, n_env_per_split, obs_shape, action_dim, n_slot=2):
+        self.n_actor = n_actor
+        self.n_split = n_split
+        self.n_env_per_split = n_env_per_split
+        self.obs_shape = tuple(obs_shape)
+        self.action_dim = action_dim
+        self.n_slot = n_slot
+
+        self.name = 'rollout_slots_' + uuid.uuid4().hex[:16]
+        self.shm = SharedMemory(name=self.name, create=True, size=self._size())
+        self.owner = True
+        self._attach()
+
+    def __getstate__(self):
+        return {'name': self.name, 'n_actor': self.n_actor, 'n_split': self.n_split, \
+            'n_env_per_split': self.n_env_per_split, 'obs_shape': self.obs_shape, \
+            'action_dim': self.action_dim, 'n_slot': self.n_slot}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        # the trainer and the actors are spawned by the same process (see
+        # train_ppo.py), and share its resource tracker: attaching registers
+        # the name of the block again, which the tracker already holds, and
+        # the block is unlinked by the trainer, or by the tracker once all of
+        # them have exited if the trainer did not. The block must not be
+        # unregistered here, which would drop the registration of the trainer
+        self.shm = SharedMemory(name=self.name)
+        self.owner = False
+        self._attach()
+
+    def _fields(self):
+        shape = (self.n_actor, self.n_split, self.n_slot, self.n_env_per_split)
+        return [
+            ('obs', np.float32, shape + self.obs_shape),
+            ('rewards', np.float32, shape + (1, )),
+            ('info_rewards', np.float32, shape),
+            ('dones', np.bool_, shape),
+            ('bad_transitions', np.bool_, shape),
+            ('action_masks', np.uint8, shape + (math.ceil(self.action_dim / 8), )),
+        ]
+
+    def _size(self):
+        return sum(int(np.prod(shape)) * np.dtype(dtype).itemsize for _, dtype, shape in self._fields())
+
+    def _attach(self):
+        offset = 0
+        for name, dtype, shape in self._fields():
+            array = np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=offset)
+            setattr(self, name, array)
+            offset += array.nbytes
+        self.next_slot = np.zeros((self.n_actor, self.n_split), dtype=int)
+
+    def write(self, actor_id, split_id, obs, reward=None, done=None, infos=None):
+        """Write the outputs of a step in the next slot, and return its index.
+
+        Only `obs` is written for the first step after a reset.
+        """
+        slot = self.next_slot[actor_id, split_id]
+        self.next_slot[actor_id, split_id] = (slot + 1) % self.n_slot
+        self.obs[actor_id, split_id, slot] = obs
+        if reward is not None:
+            self.rewards[actor_id, split_id, slot] = reward
+            self.dones[actor_id, split_id, slot] = done
+            self.info_rewards[actor_id, split_id, slot] = [info['reward'] for info in infos]
+            self.bad_transitions[actor_id, split_id, slot] = \
+                ['bad_transition' in info.keys() for info in infos]
+            action_masks = torch.cat([info['action_mask'] for info in infos], dim=0)
+            self.action_masks[actor_id, split_id, slot] = np.packbits(action_masks.numpy(), axis=-1)
+        return int(slot)
+
+    def read(self, actor_id, split_id, slot):
+        """Return the outputs of a step as tensors.
+
+        The observations, rewards and dones share the memory of the slot, and
+        are overwritten once the actor cycles back to it.
+        """
+        action_masks = np.unpackbits(self.action_masks[actor_id, split_id, slot], axis=-1, \
+            count=self.action_dim).astype(bool)
+        return torch.from_numpy(self.obs[actor_id, split_id, slot]), \
+            torch.from_numpy(self.rewards[actor_id, split_id, slot]), \
+            torch.from_numpy(self.dones[actor_id, split_id, slot]), \
+            torch.from_numpy(self.info_rewards[actor_id, split_id, slot]), \
+            torch.from_numpy(self.bad_transitions[actor_id, split_id, slot]), \
+            torch.from_numpy(action_masks)
+
+    def close(self):
+        # drop the views on the block before closing it
+        for name, _, _ in self._fields():
+            setattr(self, name, None)
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
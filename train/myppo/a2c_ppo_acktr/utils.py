@@ -4,9 +4,6 @@ import os
 import torch
 import torch.nn as nn
 
-# from a2c_ppo_acktr.envs import VecNormalize
-from .envs import VecNormalize
-
 
 # Get a render function
 def get_render_func(venv):
@@ -21,6 +18,9 @@ def get_render_func(venv):
 
 
 def get_vec_normalize(venv):
+    # imported here, so that the policy and the algorithms do not need baselines
+    from .envs import VecNormalize
+
     if isinstance(venv, VecNormalize):
         return venv
     elif hasattr(venv, 'venv'):
@@ -15,6 +15,7 @@ import torch.optim as optim
 from .a2c_ppo_acktr import algo, utils
 from .a2c_ppo_acktr.algo import gail
 from .a2c_ppo_acktr.arguments import get_args
+from .a2c_ppo_acktr.checkpoint import load_checkpoint
 from .a2c_ppo_acktr.envs import make_vec_envs
 from .a2c_ppo_acktr.model import Policy
 from .a2c_ppo_acktr.storage import RolloutStorage
@@ -40,8 +41,7 @@ def eval_ppo(flow_params=None):
 
     save_path = os.path.join(os.path.join(args.save_dir, args.algo), args.experiment_name)
     pt =  os.path.join(save_path, str(args.eval_ckpt) + ".pt")
-    actor_critic, ob_rms = torch.load(pt, map_location='cpu')
-    actor_critic.to(device)
+    checkpoint = load_checkpoint(pt, map_location='cpu')
 
     screenshot_path = os.path.join(save_path, "images") if args.save_screenshot else None
 
@@ -49,6 +49,10 @@ def eval_ppo(flow_params=None):
     flow_params['sim'].save_render = screenshot_path
     eval_envs = make_vec_envs(args.env_name, args.seed, args.num_processes, \
         None, save_path, True, device=device, flow_params=flow_params, verbose=True)
-    evaluate(actor_critic, eval_envs, ob_rms, args.num_processes, device, save_path=save_path, \
+    actor_critic = Policy(eval_envs.observation_space.shape, eval_envs.action_space, \
+        base_kwargs={'recurrent': args.recurrent_policy})
+    actor_critic.load_state_dict(checkpoint['model'])
+    actor_critic.to(device)
+    evaluate(actor_critic, eval_envs, checkpoint['ob_rms'], args.num_processes, device, save_path=save_path, \
         do_plot_congestion=args.plot_congestion, ckpt=args.eval_ckpt, verbose=True)
     eval_envs.close()
\ No newline at end of file
@@ -2,13 +2,20 @@ from numpy.lib.type_check import _nan_to_num_dispatcher
 from flow.core.params import VehicleParams
 import numpy as np
 import torch
+import torch.multiprocessing as mp
 import os
+import queue
+import threading
+import traceback
 import traci
 from functools import partial
 from tqdm import tqdm
+from torch.utils.tensorboard import SummaryWriter
 
 from .a2c_ppo_acktr import utils
+from .a2c_ppo_acktr.checkpoint import merge_ob_rms
 from .a2c_ppo_acktr.envs import make_vec_envs
+from .a2c_ppo_acktr.model import Policy
 
 import matplotlib.pyplot as plt
 from matplotlib.patches import Polygon
@@ -226,6 +233,137 @@ def evaluate(actor_critic, eval_envs, ob_rms, num_processes, device, save_path=N
         plot_emission(np.array(background_velocities), np.array(background_co2s), np.array(taxi_velocities), np.array(taxi_co2s), save_path, ckpt, num_processes=num_processes)
 
 
+class AsyncEvaluator:
+    """Evaluates snapshots of the policy in a separate process.
+
+    The process owns the eval envs and its own tensorboard writer, in the log
+    directory of the trainer, so that the trainer only sends the weights and
+    ob_rms of each evaluation. A thread of the trainer waits for the ob_rms
+    of the actors and merges them, then hands the snapshot to the process.
+    At most one snapshot waits for the process: if an evaluation is still
+    running when the next one is submitted, the older waiting snapshot is
+    dropped, so that the evaluations follow the latest policy. Each snapshot
+    is logged at the total_num_steps it was taken at.
+
+    If the process dies, its exception (or exit code) is printed, and the
+    later evaluations are skipped instead of blocking the trainer.
+    """
+
+    def __init__(self, args, flow_params, save_path):
+        ctx = mp.get_context('spawn')
+        self.requests = ctx.Queue(maxsize=1)
+        # traceback of the exception that ended the process
+        self.errors = ctx.Queue()
+        self.error = None
+        self.process = ctx.Process(target=_eval_worker, \
+            args=(self.requests, self.errors, args, flow_params, save_path), daemon=True)
+        self.process.start()
+
+        self.pending = queue.Queue(maxsize=1)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, state_dict, ob_rms_futures, total_num_steps):
+        """Queue the evaluation of state_dict, with the merged ob_rms of the futures."""
+        if self.error is not None:
+            print('skipping the evaluation at {} steps, the evaluation process failed'.format(
+                total_num_steps))
+            return
+        state_dict = {k: v.detach().cpu().clone() for k, v in state_dict.items()}
+        request = (state_dict, ob_rms_futures, total_num_steps)
+        while True:
+            try:
+                self.pending.put_nowait(request)
+                return
+            except queue.Full:
+                pass
+            try:
+                _, _, stale_num_steps = self.pending.get_nowait()
+                print('skipping the evaluation at {} steps, the previous one is still running'.format(
+                    stale_num_steps))
+            except queue.Empty:
+                pass
+
+    def _run(self):
+        while True:
+            request = self.pending.get()
+            if request is None:
+                self._put(None)
+                return
+            state_dict, ob_rms_futures, total_num_steps = request
+            try:
+                ob_rms = merge_ob_rms([fut.wait() for fut in ob_rms_futures])
+            except Exception as e:
+                print('failed to get the ob_rms of the evaluation at {} steps: {}'.format(
+                    total_num_steps, e))
+                continue
+            if not self._put((state_dict, ob_rms, total_num_steps)):
+                return
+
+    def _put(self, request):
+        """Send request to the process, and return whether it is still alive."""
+        # blocks while the process evaluates the previous snapshot
+        while self.process.is_alive():
+            try:
+                self.requests.put(request, timeout=1)
+                return True
+            except queue.Full:
+                pass
+        self._set_error()
+        return False
+
+    def _set_error(self):
+        try:
+            self.error = self.errors.get(timeout=1)
+        except queue.Empty:
+            self.error = 'exit code {}'.format(self.process.exitcode)
+        print('the evaluation process failed:\n{}'.format(self.error))
+
+    def close(self):
+        """Wait for the pending evaluations, then stop the process."""
+        while self.thread.is_alive():
+            try:
+                self.pending.put(None, timeout=1)
+                break
+            except queue.Full:
+                pass
+        while self.thread.is_alive():
+            self.thread.join(timeout=1)
+        # the process exits once it has read None, or has already died
+        while self.process.is_alive() and self.error is None:
+            self.process.join(timeout=1)
+        if self.error is None and self.process.exitcode != 0:
+            self._set_error()
+
+
+def _eval_worker(requests, errors, args, flow_params, save_path):
+    try:
+        device = torch.device("cuda:0" if args.cuda else "cpu")
+        eval_envs = make_vec_envs(args.env_name, args.seed, args.eval_num_processes, \
+            None, save_path, True, device=device, flow_params=flow_params)
+        writer = SummaryWriter(os.path.join(save_path, 'tensorboard_logs'), filename_suffix='.eval')
+        actor_critic = Policy(eval_envs.observation_space.shape, eval_envs.action_space, \
+            base_kwargs={'recurrent': args.recurrent_policy})
+        actor_critic.to(device)
+
+        while True:
+            request = requests.get()
+            if request is None:
+                break
+            state_dict, ob_rms, total_num_steps = request
+            actor_critic.load_state_dict(state_dict)
+            evaluate(actor_critic, eval_envs, ob_rms, args.eval_num_processes, device, \
+                save_path, writer, total_num_steps)
+            writer.flush()
+
+        eval_envs.close()
+        writer.close()
+    except Exception:
+        # the trainer prints it, and the exit code is not 0
+        errors.put(traceback.format_exc())
+        raise
+
+
 def get_corners(s, e, w):
     s, e = np.array(s), np.array(e)
     se = e - s